@@ -0,0 +1,200 @@
+"""Teste de carga: várias sessões simultâneas do app no mesmo processo (AppTest)
+
+Uso:
+    python benchmark_load.py --sessions 1,5,10,20 --duration 30
+
+Gera uma base sintética num diretório temporário, desliga tudo que usa rede
+(verificação de links e cópia local dos PDFs) e roda roteiros de uso reais em
+várias sessões ao mesmo tempo: digitar a busca letra por letra, trocar o ano e
+paginar resultados. Para cada quantidade de sessões mostra os percentis de
+latência por rerun, reruns por segundo, CPU e memória do processo.
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from benchmark_storage import make_synthetic_vehicles
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+YEAR_LABEL = "📅 Filtrar por Ano:"
+TYPED_QUERIES = ['compass', 'corolla 2.0', 't-cross', 'bmw 118i', 'polo tsi', 'civic', 'xc60', 'renegade']
+
+def _install_shared_runtime():
+    """Permite várias AppTest em threads, como as sessões de um servidor Streamlit
+
+    Cada AppTest.run() troca Runtime._instance por um mock e o apaga no final, o que
+    derruba as outras sessões em andamento. O teste de carga instala um único runtime
+    simulado para o processo e faz as trocas de cada execução valerem só para uma
+    subclasse que ninguém consulta.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import patch_config_options
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type('SessionRuntime', (Runtime,), {})
+
+    # Como no servidor, o script é compilado uma vez e o bytecode é compartilhado
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    # Mesmo motivo: a opção global.appTest fica ligada durante todo o teste
+    patch_config_options({"global.appTest": True}).__enter__()
+
+def _year_select(at):
+    return next((select for select in at.selectbox if select.label == YEAR_LABEL), None)
+
+def typing_script(at, rng):
+    """Digita uma busca letra por letra (um rerun por tecla) e limpa o campo"""
+    query = rng.choice(TYPED_QUERIES)
+    for end in range(1, len(query) + 1):
+        yield at.text_input(key='search_query').input(query[:end])
+    yield at.text_input(key='search_query').input('')
+
+def year_script(at, rng):
+    """Troca o filtro de ano algumas vezes e volta para todos os anos"""
+    if _year_select(at) is None:
+        return
+    years = _year_select(at).options[1:]
+    for year in rng.sample(years, min(3, len(years))):
+        yield _year_select(at).select(year)
+    yield _year_select(at).select("Todos os anos")
+
+def paging_script(at, rng):
+    """Filtra um ano com muitos resultados e avança algumas páginas"""
+    years = _year_select(at).options[1:] if _year_select(at) is not None else []
+    if not years:
+        return
+    yield _year_select(at).select(rng.choice(years[:5]))
+    for page in range(2, 5):
+        pages = [widget for widget in at.number_input if widget.key == 'results_page']
+        if not pages or page > pages[0].max:
+            break
+        yield pages[0].set_value(page)
+    yield _year_select(at).select("Todos os anos")
+
+SCRIPTS = [(typing_script, 0.6), (year_script, 0.2), (paging_script, 0.2)]
+
+def run_session(index, deadline, think, seed, latencies, errors):
+    """Uma sessão simulada: abre o app e executa roteiros até o fim do tempo"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + index)
+    scripts, weights = zip(*SCRIPTS)
+    try:
+        start = time.perf_counter()
+        at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+        latencies.append(time.perf_counter() - start)
+
+        while time.perf_counter() < deadline:
+            script = rng.choices(scripts, weights)[0]
+            for widget in script(at, rng):
+                start = time.perf_counter()
+                widget.run()
+                latencies.append(time.perf_counter() - start)
+                if at.exception:
+                    errors.append(at.exception[0].message)
+                time.sleep(think * rng.uniform(0.5, 1.5))
+                if time.perf_counter() >= deadline:
+                    break
+    except Exception as error:
+        errors.append(repr(error))
+
+def _rss_bytes():
+    """Memória residente atual do processo (Linux); pico como alternativa"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def run_level(sessions, duration, think, seed):
+    """Roda `sessions` sessões simultâneas por `duration` segundos e resume as métricas"""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=run_session, args=(index, deadline, think, seed, latencies, errors), daemon=True)
+        for index in range(sessions)
+    ]
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'throughput': len(latencies) / wall,
+        'p50': p50, 'p90': p90, 'p95': p95, 'p99': p99, 'max': values.max(),
+        'cpu': cpu / wall,
+        'rss_mb': _rss_bytes() / 1024 ** 2,
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', default='1,5,10,20', help="quantidades de sessões simultâneas")
+    parser.add_argument('--duration', type=float, default=30, help="segundos por quantidade de sessões")
+    parser.add_argument('--think', type=float, default=0.2, help="pausa média entre ações (s)")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--storage', choices=['pandas', 'sqlite'], default='pandas')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Totalmente offline, com a mesma base a cada execução e sem log de buscas (o pré-aquecimento
+    # das buscas frequentes de uma execução anterior mudaria os tempos da seguinte)
+    os.environ.update({
+        'ADAS_LINK_CHECK': '0', 'ADAS_DOCUMENT_CACHE': '0', 'ADAS_QUERY_LOG': '0', 'ADAS_STORAGE': args.storage
+    })
+    _install_shared_runtime()
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='adas_load_') as directory:
+        make_synthetic_vehicles(args.rows, seed=args.seed).to_csv(
+            os.path.join(directory, 'processed_data.csv'), sep=';', index=False, encoding='utf-8'
+        )
+        os.chdir(directory)
+        try:
+            run_benchmark(args)
+        finally:
+            os.chdir(working_directory)
+
+def run_benchmark(args):
+    # Aquecimento: a primeira sessão carrega a base e monta os índices
+    start = time.perf_counter()
+    run_level(1, 0, 0, args.seed)
+    print(f"Base sintética: {args.rows:,} linhas ({args.storage}); carga inicial {time.perf_counter() - start:.1f}s")
+
+    print(f"\n{'sessões':>8}{'reruns':>8}{'rerun/s':>9}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}{'máx':>8}"
+          f"{'CPU':>7}{'RSS MB':>9}{'pico MB':>9}{'erros':>7}")
+    for sessions in (int(value) for value in args.sessions.split(',')):
+        result = run_level(sessions, args.duration, args.think, args.seed)
+        print(f"{result['sessions']:>8}{result['reruns']:>8}{result['throughput']:>9.1f}"
+              f"{result['p50']:>8.0f}{result['p90']:>8.0f}{result['p95']:>8.0f}{result['p99']:>8.0f}{result['max']:>8.0f}"
+              f"{result['cpu']:>7.2f}{result['rss_mb']:>9.0f}{result['peak_mb']:>9.0f}{len(result['errors']):>7}")
+        for error in result['errors'][:3]:
+            print(f"    erro: {error}")
+    print("\nLatências em ms por rerun; CPU em núcleos usados em média pelo processo.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark comparativo dos backends de armazenamento (pandas x SQLite FTS5)
+
+Uso:
+    python benchmark_storage.py --rows 1000000 [--deltas 3]
+
+Gera uma base sintética, monta os dois backends, confere se as buscas retornam
+exatamente os mesmos resultados e scores e mostra o tempo de cada um. Com --deltas,
+aplica deltas sintéticos (alterações, inclusões, exclusões e reinclusões) aos dois
+backends e confere as buscas de novo.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import streamlit_app as app
+
+BRANDS = [
+    'BMW', 'KIA', 'JEEP', 'TOYOTA', 'VOLKSWAGEN', 'CITROËN', 'FIAT', 'HONDA', 'AUDI',
+    'MERCEDES-BENZ', 'HYUNDAI', 'RENAULT', 'PEUGEOT', 'CHEVROLET', 'VOLVO', 'NISSAN'
+]
+MODELS = [
+    'Compass', 'Corolla', 'T-Cross', 'Polo', 'Câmbio', 'C4 Cactus', 'Sportage', 'Civic',
+    'A3 Sedan', '118i', 'Creta', 'Kwid', '208', 'Onix', 'XC60', 'Kicks', 'Renegade', 'HR-V'
+]
+VERSIONS = ['1.0 TSI', '1.5 TB', '1,5TB', '2.0 Flex', '1.6 16V', '2.0 TB AWD', '1.3 Turbo']
+
+BENCHMARK_QUERIES = ['COMPASS', 'COROLLA', 'T-CROSS', 'BMW', 'PO', '1.5 TB', 'XC60 2.0']
+
+def make_synthetic_vehicles(rows, seed=0):
+    """Base sintética com o mesmo formato do processed_data (uma linha por FipeID e ano)"""
+    rng = np.random.default_rng(seed)
+    # Média de 5 anos por FipeID; sobra um pouco e a base é cortada em `rows` linhas
+    fipe_count = max(rows // 4, 1)
+
+    fipe_ids = rng.choice(np.arange(1000, 1000 + fipe_count * 10), fipe_count, replace=False)
+    years_per_fipe = rng.integers(1, 10, fipe_count)
+    fipe_column = np.repeat(fipe_ids, years_per_fipe)[:rows]
+    first_year = rng.integers(2012, 2024, fipe_count)
+    offsets = np.concatenate([np.arange(n) for n in years_per_fipe])[:rows]
+    year_column = np.repeat(first_year, years_per_fipe)[:rows] + offsets
+
+    brand_of = np.asarray(BRANDS, dtype=object)[fipe_column % len(BRANDS)]
+    model_of = np.asarray(MODELS, dtype=object)[(fipe_column // len(BRANDS)) % len(MODELS)]
+    version_of = np.asarray(VERSIONS, dtype=object)[(fipe_column // 7) % len(VERSIONS)]
+
+    yes_no = np.array(['Sim', 'Não'], dtype=object)
+    df = pd.DataFrame({
+        'FipeID': fipe_column,
+        'VehicleModelYear': year_column,
+        'BrandName': brand_of,
+        'VehicleName': model_of + ' ' + version_of + ' Aut.',
+        'Abreviação de descrição': pd.Series(brand_of).str.title().to_numpy() + ' ' + model_of,
+    })
+    for col in ['ADAS', 'Opcional Parabrisa', 'ADAS no Parabrisa', 'Adas no Parachoque',
+                'Camera no Retrovisor', 'Faróis Matrix']:
+        # Características mudam pouco entre anos do mesmo FipeID
+        per_fipe = yes_no[rng.integers(0, 2, fipe_count)]
+        values = np.repeat(per_fipe, years_per_fipe)[:rows]
+        flips = rng.random(len(values)) < 0.05
+        values[flips] = yes_no[rng.integers(0, 2, flips.sum())]
+        df[col] = values
+    df['Tipo de Regulagem'] = np.array(['Dinâmica', 'Estática'], dtype=object)[fipe_column % 2]
+    return df
+
+def make_synthetic_delta(df, rng, excluded=None, rows=500):
+    """Delta sintético de ~`rows` linhas sobre a base `df`; retorna (delta, linhas de FipeIDs excluídos inteiros)
+
+    Mistura alterações, anos novos de FipeIDs existentes, FipeIDs inéditos, exclusões de
+    linhas e de FipeIDs inteiros e a reinclusão de FipeIDs excluídos por um delta anterior
+    (`excluded`), que devem voltar à posição que tinham.
+    """
+    sample = lambda count: df.iloc[rng.choice(len(df), count, replace=False)].copy()
+    updated = sample(rows * 2 // 5).assign(ADAS='Não')
+    updated['VehicleName'] = 'Novo ' + updated['VehicleName']
+    new_years = sample(rows // 5)
+    new_years['VehicleModelYear'] = 2030 + rng.integers(0, 3, len(new_years))
+    new_fipes = sample(rows // 10)
+    new_fipes['FipeID'] = df['FipeID'].max() + 1 + rng.choice(10 * len(new_fipes), len(new_fipes), replace=False)
+    deleted_rows = sample(rows // 5).assign(op='delete')
+    whole_fipes = df[df['FipeID'].isin(rng.choice(df['FipeID'].unique(), max(rows // 50, 1), replace=False))]
+    parts = [updated, new_years, new_fipes, deleted_rows, whole_fipes.assign(op='delete')]
+    if excluded is not None:
+        parts.append(excluded)
+    delta = pd.concat(parts, ignore_index=True)
+    delta['op'] = delta['op'].fillna('upsert')
+    return delta, whole_fipes
+
+def _best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--deltas', type=int, default=0)
+    args = parser.parse_args()
+
+    df = make_synthetic_vehicles(args.rows)
+    print(f"Base sintética: {len(df):,} linhas, {df['FipeID'].nunique():,} FipeIDs")
+
+    start = time.perf_counter()
+    pandas_base = app.VehicleBase(df, 'benchmark')
+    print(f"pandas: montagem {time.perf_counter() - start:.2f}s, memória {pandas_base.nbytes / 1024 ** 2:,.0f} MB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.sqlite')
+        start = time.perf_counter()
+        app.build_sqlite_base(df, path, 'benchmark')
+        sqlite_base = app.SQLiteVehicleBase(path, 'benchmark')
+        print(f"sqlite: montagem {time.perf_counter() - start:.2f}s, arquivo {os.path.getsize(path) / 1024 ** 2:,.0f} MB")
+
+        year = int(df['VehicleModelYear'].median())
+        cases = [(query, None) for query in BENCHMARK_QUERIES]
+        cases += [('COMPASS', year), ('', year), (str(df['FipeID'].iloc[0]), None)]
+        # Mesma normalização que search_vehicles aplica antes de ranquear
+        cases = [(app.fold_search_text(query), year_int) for query, year_int in cases]
+
+        _compare(pandas_base, sqlite_base, cases, args.repeat)
+
+        if args.deltas:
+            rng = np.random.default_rng(1)
+            excluded = None
+            print(f"\n{'delta':<8}{'linhas':>8}{'pandas (ms)':>14}{'sqlite (ms)':>14}")
+            for step in range(args.deltas):
+                delta, excluded_next = make_synthetic_delta(df, rng, excluded)
+                pandas_summary = pandas_base.apply_delta(delta)
+                sqlite_summary = sqlite_base.apply_delta(delta)
+                print(f"{step + 1:<8}{len(delta):>8}{pandas_summary['seconds'] * 1000:>14.1f}"
+                      f"{sqlite_summary['seconds'] * 1000:>14.1f}")
+                excluded = excluded_next
+            _compare(pandas_base, sqlite_base, cases, args.repeat)
+
+def _compare(pandas_base, sqlite_base, cases, repeat):
+    """Tempo de cada busca nos dois backends e se posições e scores são idênticos"""
+    print(f"\n{'busca':<22}{'pandas (ms)':>14}{'sqlite (ms)':>14}{'resultados':>12}  iguais")
+    for query, year_int in cases:
+        pandas_time, pandas_result = _best_time(lambda: pandas_base.rank(query, year_int), repeat)
+        sqlite_time, sqlite_result = _best_time(lambda: sqlite_base.rank(query, year_int), repeat)
+
+        same = np.array_equal(pandas_result[0], sqlite_result[0]) and (
+            (pandas_result[1] is None and sqlite_result[1] is None)
+            or np.array_equal(pandas_result[1], sqlite_result[1])
+        )
+        label = f"{query or '(vazio)'}" + (f" / {year_int}" if year_int else "")
+        print(f"{label:<22}{pandas_time * 1000:>14.1f}{sqlite_time * 1000:>14.1f}{len(pandas_result[0]):>12}  {'sim' if same else 'NÃO'}")
+
+if __name__ == '__main__':
+    main()
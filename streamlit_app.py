@@ -1,6 +1,36 @@
 import streamlit as st
 import pandas as pd
 import os
+import io
+import pstats
+import re
+import csv
+import json
+import queue
+import sqlite3
+import sys
+import tempfile
+import bisect
+import copy
+import cProfile
+import heapq
+import hashlib
+import time
+import unicodedata
+import asyncio
+import atexit
+import logging
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+import numpy as np
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # Configuração da página
 st.set_page_config(
@@ -619,18 +649,21 @@ BOSCH_CALIBRATION_LINKS = {
     }
 }
 
-def get_specific_calibration_link(brand_name, calibration_type):
-    """Retorna link específico para um tipo de calibração"""
+def calibration_links_digest(links):
+    """Impressão digital de uma tabela de links (parte da versão dos cards em cache)"""
+    return hashlib.sha256(json.dumps(links, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def get_specific_calibration_link(brand_name, calibration_type, links=None):
+    """Retorna link específico para um tipo de calibração (tabela padrão ou a da rede informada)"""
     if not brand_name:
         return None
     
-    brand_upper = brand_name.upper().strip()
-    
-    if brand_upper not in BOSCH_CALIBRATION_LINKS:
+    # A marca já vem em maiúsculas e sem espaços da limpeza feita na carga (clean_vehicle_data)
+    links = BOSCH_CALIBRATION_LINKS if links is None else links
+    brand_links = links.get(brand_name)
+    if brand_links is None:
         return None
     
-    brand_links = BOSCH_CALIBRATION_LINKS[brand_upper]
-    
     # Mapear tipos de calibração
     type_mapping = {
         'camera_frontal': ['camera_frontal', 'camera_frontal_ar'],
@@ -642,478 +675,3965 @@ def get_specific_calibration_link(brand_name, calibration_type):
     }
     
     if calibration_type in type_mapping:
+        link_status = get_link_status_cache()
         for link_type in type_mapping[calibration_type]:
             if link_type in brand_links and brand_links[link_type]:
-                return brand_links[link_type][0]  # Retorna o primeiro link
+                # Retorna o primeiro link disponível: cópia local ou origem que não está fora do ar
+                for link in brand_links[link_type]:
+                    local_url = get_document_store().local_url(link['link'])
+                    if local_url:
+                        return dict(link, link=local_url, origin=link['link'])
+                    if not link_status.is_dead(link['link']):
+                        return link
     
     return None
 
-@st.cache_data
-def load_vehicle_data(uploaded_file=None):
-    """Carrega dados com suporte prioritário ao XLSX e fallback para CSV"""
+# Verificação periódica dos PDFs de calibração
+LINK_CHECK_ENABLED = os.environ.get('ADAS_LINK_CHECK', '1') != '0'
+LINK_CHECK_CONCURRENCY = 16
+LINK_CHECK_TIMEOUT = 5.0
+LINK_CHECK_RETRIES = 2
+LINK_STATUS_TTL = int(os.environ.get('ADAS_LINK_STATUS_TTL', str(6 * 3600)))
+LINK_CHECK_USER_AGENT = 'SistemaADASPro-LinkCheck/1.0'
+
+def iter_calibration_links(links=None):
+    """URLs únicas de todos os PDFs de calibração cadastrados"""
+    links = BOSCH_CALIBRATION_LINKS if links is None else links
+    seen = set()
+    for brand_links in links.values():
+        for options in brand_links.values():
+            for option in options:
+                if option['link'] not in seen:
+                    seen.add(option['link'])
+                    yield option['link']
+
+def _probe_link(url, timeout):
+    """Status HTTP do link via HEAD; servidores que recusam HEAD recebem um GET de 1 byte"""
+    headers = {'User-Agent': LINK_CHECK_USER_AGENT}
+    try:
+        request = urllib.request.Request(url, method='HEAD', headers=headers)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        if e.code not in (403, 405, 501):
+            return e.code
     
     try:
-        if uploaded_file is not None:
-            # Detectar formato do arquivo enviado
-            if uploaded_file.name.endswith('.xlsx'):
-                df = pd.read_excel(uploaded_file, engine='openpyxl')
-                return df, f"✅ Arquivo XLSX enviado carregado: {len(df):,} veículos", len(df)
-            elif uploaded_file.name.endswith(('.csv', '.txt')):
-                df = pd.read_csv(uploaded_file, sep=';', encoding='utf-8')
-                return df, f"✅ Arquivo CSV enviado carregado: {len(df):,} veículos", len(df)
-            else:
-                st.error("⚠️ Formato não suportado. Use XLSX ou CSV.")
-                return pd.DataFrame(), "erro_formato", 0
+        request = urllib.request.Request(url, headers=dict(headers, Range='bytes=0-0'))
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def _link_state(status):
+    """Classifica o status HTTP: 'ok', 'dead' (resposta definitiva de erro) ou 'unreachable'"""
+    if status is not None and 200 <= status < 400:
+        return 'ok'
+    if status is not None and 400 <= status < 500 and status not in (401, 403, 408, 429):
+        return 'dead'
+    return 'unreachable'
+
+async def check_links(urls, concurrency=LINK_CHECK_CONCURRENCY, timeout=LINK_CHECK_TIMEOUT, retries=LINK_CHECK_RETRIES):
+    """Verifica todos os links em paralelo e retorna {url: status}"""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def check(url, executor):
+        async with semaphore:
+            status, error = None, None
+            for attempt in range(retries + 1):
+                try:
+                    status, error = await loop.run_in_executor(executor, _probe_link, url, timeout), None
+                except (urllib.error.URLError, OSError, ValueError) as e:
+                    status, error = None, str(getattr(e, 'reason', e))
+                # Só vale repetir falhas de rede e erros 5xx
+                if _link_state(status) != 'unreachable':
+                    break
+                if attempt < retries:
+                    await asyncio.sleep(0.2 * 2 ** attempt)
+            return url, {'state': _link_state(status), 'status': status, 'error': error, 'checked_at': time.time()}
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='link-check') as executor:
+        results = await asyncio.gather(*(check(url, executor) for url in urls))
+    return dict(results)
+
+class LinkStatusCache:
+    """Status dos links de calibração com validade (TTL), atualizado em segundo plano"""
+    
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._checking = False
+        # Muda quando algum link entra ou sai da lista de fora do ar (invalida os cards em cache)
+        self.version = 0
+    
+    def is_dead(self, url):
+        """Link confirmado como fora do ar (vale o último status conhecido, mesmo expirado)"""
+        status = self._statuses.get(url)
+        return status is not None and status['state'] == 'dead'
+    
+    def stale_links(self, urls):
+        now = time.time()
+        with self._lock:
+            return [
+                url for url in urls
+                if url not in self._statuses or now - self._statuses[url]['checked_at'] > self.ttl
+            ]
+    
+    def update(self, statuses):
+        with self._lock:
+            changed = any(
+                self.is_dead(url) != (status['state'] == 'dead') for url, status in statuses.items()
+            )
+            self._statuses.update(statuses)
+            if changed:
+                self.version += 1
+    
+    def refresh_in_background(self, urls, force=False):
+        """Dispara a verificação dos links vencidos sem bloquear o rerun"""
+        urls = list(urls) if force else self.stale_links(urls)
+        with self._lock:
+            if not urls or self._checking:
+                return False
+            self._checking = True
         
-        # Prioridade 1: Tentar carregar XLSX (dados mais limpos)
-        if os.path.exists('processed_data.xlsx'):
-            df = pd.read_excel('processed_data.xlsx', engine='openpyxl')
-            return df, f"✅ Base carregada: {len(df):,} veículos", len(df)
+        def run():
+            try:
+                self.update(asyncio.run(check_links(urls)))
+            except Exception as e:
+                logger.warning("Falha ao verificar links de calibração: %s", e)
+            finally:
+                with self._lock:
+                    self._checking = False
         
-        # Prioridade 2: Fallback para CSV se XLSX não existir
-        elif os.path.exists('processed_data.csv'):
-            df = pd.read_csv('processed_data.csv', sep=';', encoding='utf-8')
-            return df, f"✅ Base CSV carregada: {len(df):,} veículos", len(df)
+        threading.Thread(target=run, name='link-status-refresh', daemon=True).start()
+        return True
+    
+    def summary(self):
+        with self._lock:
+            statuses = dict(self._statuses)
+            checking = self._checking
+        counts = {'ok': 0, 'dead': 0, 'unreachable': 0}
+        for status in statuses.values():
+            counts[status['state']] += 1
+        dead = sorted(url for url, status in statuses.items() if status['state'] == 'dead')
+        return counts, dead, checking
+
+@st.cache_resource
+def get_link_status_cache():
+    """Instância única do status dos links para o processo"""
+    return LinkStatusCache(LINK_STATUS_TTL)
+
+# Cópia local dos PDFs de calibração, servida pelo próprio app em /app/static
+DOCUMENT_CACHE_ENABLED = os.environ.get('ADAS_DOCUMENT_CACHE', '1') != '0'
+DOCUMENT_CACHE_DIR = os.environ.get(
+    'ADAS_DOCUMENT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'calibration')
+)
+DOCUMENT_URL_PREFIX = 'app/static/calibration'
+DOCUMENT_REFRESH_INTERVAL = int(os.environ.get('ADAS_DOCUMENT_REFRESH', str(24 * 3600)))
+DOCUMENT_MAX_BYTES = 50 * 1024 * 1024
+DOCUMENT_FETCH_CONCURRENCY = 4
+DOCUMENT_FETCH_TIMEOUT = 30.0
+# Espera antes de tentar de novo um PDF que falhou; dobra a cada falha seguida, até o intervalo de revalidação
+DOCUMENT_RETRY_BACKOFF = 10 * 60
+
+class CalibrationDocumentStore:
+    """Cache local dos PDFs de calibração, gravado em disco endereçado pelo SHA-256 do conteúdo"""
+    
+    def __init__(self, directory, url_prefix, refresh_interval):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.refresh_interval = refresh_interval
+        self._index_path = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # Downloads que falharam: url -> (momento da última falha, falhas seguidas)
+        self._failures = {}
+        # Muda quando um PDF entra no cache ou troca de conteúdo (a URL local muda)
+        self.version = 0
         
-        # Fallback final: dados de demonstração
-        else:
-            demo_data = {
-                'FipeID': [92983, 95432, 87654, 76543, 65432],
-                'VehicleModelYear': [2024, 2023, 2024, 2023, 2022],
-                'BrandName': ['BMW', 'VOLKSWAGEN', 'MERCEDES-BENZ', 'AUDI', 'VOLVO'],
-                'VehicleName': [
-                    '118i M Sport 1.5 TB 12V Aut. 5p',
-                    'Polo TSI 1.0 200 Aut. 5p', 
-                    'C-Class C200 2.0 TB Aut.',
-                    'A3 Sedan 1.4 TFSI Aut.',
-                    'XC60 T5 2.0 TB Aut. AWD'
-                ],
-                'Abreviação de descrição': [
-                    'BMW 118i M Sport',
-                    'Polo TSI 200',
-                    'Mercedes C200',
-                    'Audi A3 Sedan',
-                    'Volvo XC60 T5'
-                ],
-                'ADAS': ['Sim', 'Sim', 'Sim', 'Sim', 'Sim'],
-                'Opcional Parabrisa': ['Sim', 'Não', 'Sim', 'Não', 'Sim'],
-                'ADAS no Parabrisa': ['Sim', 'Não', 'Sim', 'Sim', 'Sim'],
-                'Adas no Parachoque': ['Sim', 'Sim', 'Não', 'Sim', 'Sim'],
-                'Tipo de Regulagem': ['Dinâmica', 'Estática', 'Dinâmica', 'Estática', 'Dinâmica'],
-                'Camera no Retrovisor': ['Sim', 'Não', 'Sim', 'Sim', 'Sim'],
-                'Faróis Matrix': ['Sim', 'Não', 'Sim', 'Sim', 'Não']
-            }
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self._index_path, encoding='utf-8') as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+    
+    def local_url(self, url):
+        """URL servida pelo app para o PDF, ou None se ainda não está em cache"""
+        entry = self._index.get(url)
+        if entry is None:
+            return None
+        # O parâmetro v faz o servidor enviar Cache-Control de longa duração (conteúdo imutável)
+        return f"{self.url_prefix}/{entry['sha256']}.pdf?v={entry['sha256'][:12]}"
+    
+    def stale_documents(self, urls):
+        """PDFs ausentes ou vencidos, exceto os que falharam há pouco (aguardam o backoff)"""
+        now = time.time()
+        return [
+            url for url in urls
+            if (url not in self._index or now - self._index[url]['fetched_at'] > self.refresh_interval)
+            and not self._in_backoff(url, now)
+        ]
+    
+    def _in_backoff(self, url, now):
+        failure = self._failures.get(url)
+        if failure is None:
+            return False
+        failed_at, attempts = failure
+        return now - failed_at < min(DOCUMENT_RETRY_BACKOFF * 2 ** (attempts - 1), self.refresh_interval)
+    
+    def _record_failure(self, url):
+        with self._lock:
+            _, attempts = self._failures.get(url, (None, 0))
+            self._failures[url] = (time.time(), attempts + 1)
+    
+    def fetch(self, url, timeout=DOCUMENT_FETCH_TIMEOUT):
+        """Baixa (ou revalida com ETag/Last-Modified) um PDF da origem e grava no cache"""
+        entry = self._index.get(url)
+        headers = {'User-Agent': LINK_CHECK_USER_AGENT}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                self._update_index(url, dict(entry, fetched_at=time.time()))
+                return entry['sha256']
+            raise
+        
+        with response:
+            # Grava em arquivo temporário calculando o hash no mesmo passo
+            digest = hashlib.sha256()
+            size = 0
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    for chunk in iter(lambda: response.read(64 * 1024), b''):
+                        if size == 0 and not chunk.startswith(b'%PDF'):
+                            raise ValueError(f"conteúdo não é PDF: {url}")
+                        size += len(chunk)
+                        if size > DOCUMENT_MAX_BYTES:
+                            raise ValueError(f"PDF maior que o limite: {url}")
+                        digest.update(chunk)
+                        out.write(chunk)
+                sha256 = digest.hexdigest()
+                os.replace(temp_path, os.path.join(self.directory, f"{sha256}.pdf"))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            
+            self._update_index(url, {
+                'sha256': sha256,
+                'size': size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+            })
+        return sha256
+    
+    def _update_index(self, url, entry):
+        with self._lock:
+            previous = self._index.get(url)
+            index = dict(self._index)
+            index[url] = entry
+            
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.json')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(temp_path, self._index_path)
+            self._index = index
+            self._failures.pop(url, None)
+            if previous is None or previous['sha256'] != entry['sha256']:
+                self.version += 1
             
-            df = pd.DataFrame(demo_data)
-            return df, "⚠️ Usando dados de demonstração (5 veículos)", len(df)
+            # Remover o arquivo antigo se nenhum outro link aponta para ele
+            if previous and previous['sha256'] != entry['sha256']:
+                if all(other['sha256'] != previous['sha256'] for other in index.values()):
+                    try:
+                        os.unlink(os.path.join(self.directory, f"{previous['sha256']}.pdf"))
+                    except OSError:
+                        pass
+    
+    def refresh_in_background(self, urls):
+        """Baixa os PDFs ausentes ou vencidos sem bloquear o rerun"""
+        urls = self.stale_documents(urls)
+        with self._lock:
+            if not urls or self._refreshing:
+                return False
+            self._refreshing = True
         
-    except Exception as e:
-        st.error(f"❌ Erro ao carregar dados: {str(e)}")
-        return pd.DataFrame(), f"erro: {str(e)}", 0
+        def fetch_quietly(url):
+            try:
+                self.fetch(url)
+            except Exception as e:
+                self._record_failure(url)
+                logger.warning("Falha ao baixar PDF de calibração %s: %s", url, e)
+        
+        def run():
+            try:
+                with ThreadPoolExecutor(max_workers=DOCUMENT_FETCH_CONCURRENCY, thread_name_prefix='document-fetch') as executor:
+                    list(executor.map(fetch_quietly, urls))
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        
+        threading.Thread(target=run, name='document-refresh', daemon=True).start()
+        return True
+    
+    def summary(self):
+        index = self._index
+        return len(index), sum(entry['size'] for entry in index.values())
 
-def search_vehicles(query, df, year_filter=None):
-    """Busca inteligente nos veículos com filtro de ano e eliminação de duplicatas"""
-    if df.empty:
-        return []
+class _DisabledDocumentStore:
+    """Substituto quando o cache local de PDFs está desligado"""
     
-    # Aplicar filtro de ano primeiro
-    filtered_df = df.copy()
-    if year_filter and year_filter != "Todos os anos":
-        try:
-            year_int = int(year_filter)
-            filtered_df = filtered_df[filtered_df['VehicleModelYear'] == year_int]
-        except ValueError:
-            pass
+    version = 0
     
-    # Se não há query, retornar apenas filtro de ano
-    if not query:
-        if year_filter and year_filter != "Todos os anos":
-            # Eliminar duplicatas por FipeID
-            unique_df = filtered_df.drop_duplicates(subset=['FipeID'], keep='first')
-            return unique_df.head(20).to_dict('records')
-        else:
-            return []
+    def local_url(self, url):
+        return None
+    
+    def refresh_in_background(self, urls):
+        return False
+    
+    def summary(self):
+        return 0, 0
+
+@st.cache_resource
+def get_document_store():
+    """Instância única do cache local de PDFs para o processo"""
+    if not DOCUMENT_CACHE_ENABLED:
+        return _DisabledDocumentStore()
+    return CalibrationDocumentStore(DOCUMENT_CACHE_DIR, DOCUMENT_URL_PREFIX, DOCUMENT_REFRESH_INTERVAL)
+
+# Ações administrativas exigem ?admin=<token> na URL
+ADMIN_TOKEN = os.environ.get('ADAS_ADMIN_TOKEN')
+
+def is_admin_session():
+    """Sessão aberta com o token de administração na URL"""
+    return bool(ADMIN_TOKEN) and st.query_params.get('admin') == ADMIN_TOKEN
+
+# Normalização das chaves de busca: "CITROËN", "Citroen" e "citroën" viram "CITROEN";
+# "1,5TB" e "1.5 TB" viram "1.5 TB"; hífens e outras pontuações viram espaço
+_FOLD_DECIMAL_COMMA = re.compile(r'(?<=\d),(?=\d)')
+_FOLD_NUMBER_UNIT = re.compile(r'(?<=\d)(?=[A-Z])')
+_FOLD_PUNCTUATION = re.compile(r'[^A-Z0-9.]+|(?<!\d)\.|\.(?!\d)')
+_FOLD_SPACES = re.compile(r' {2,}')
+
+def fold_search_text(text):
+    """Chave de busca de um texto: sem acentos, maiúsculo, pontuação e espaços normalizados"""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').upper()
+    text = _FOLD_DECIMAL_COMMA.sub('.', text)
+    text = _FOLD_NUMBER_UNIT.sub(' ', text)
+    text = _FOLD_PUNCTUATION.sub(' ', text)
+    return _FOLD_SPACES.sub(' ', text).strip()
+
+def fold_search_series(series):
+    """Mesma normalização de fold_search_text, vetorizada para uma coluna inteira"""
+    folded = (
+        series.fillna('').astype(str)
+        .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.upper()
+        .str.replace(_FOLD_DECIMAL_COMMA, '.', regex=True)
+        .str.replace(_FOLD_NUMBER_UNIT, ' ', regex=True)
+        .str.replace(_FOLD_PUNCTUATION, ' ', regex=True)
+        .str.replace(_FOLD_SPACES, ' ', regex=True)
+        .str.strip()
+    )
+    return folded.astype(object)
+
+# Campos da busca textual e seus pesos; cada um ganha uma coluna de chave normalizada na visão
+SEARCH_FIELD_WEIGHTS = [('BrandName', 50), ('VehicleName', 40), ('Abreviação de descrição', 35), ('FipeID', 20)]
+
+def search_key_column(col):
+    return f"_key_{col}"
+
+def add_search_keys(view):
+    """Calcula uma vez, na carga, as chaves normalizadas de cada campo de busca"""
+    for col, _ in SEARCH_FIELD_WEIGHTS:
+        values = view[col].fillna('').astype(str) if col in view.columns else pd.Series('', index=view.index)
+        
+        # Normaliza só os valores distintos; como categoria, cada busca testa cada chave distinta uma vez
+        codes, uniques = pd.factorize(values)
+        folded = fold_search_series(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+        view[search_key_column(col)] = pd.Categorical(folded[codes])
+    return view
+
+# Características que podem variar entre os anos-modelo de um mesmo FipeID
+FLAG_COLUMNS = [
+    'ADAS', 'Opcional Parabrisa', 'ADAS no Parabrisa', 'Adas no Parachoque',
+    'Camera no Retrovisor', 'Faróis Matrix', 'Tipo de Regulagem'
+]
+
+def build_canonical_view(df):
+    """Monta a visão com uma linha por FipeID, seus anos-modelo e as diferenças de cada ano"""
+    if df.empty or 'FipeID' not in df.columns:
+        return df.copy()
+    
+    if 'VehicleModelYear' not in df.columns:
+        return add_search_keys(df.drop_duplicates(subset=['FipeID'], keep='first').reset_index(drop=True))
     
-    query = query.upper().strip()
+    # Linha canônica = ano-modelo mais recente de cada FipeID
+    ordered = df.sort_values(
+        ['FipeID', 'VehicleModelYear'], ascending=[True, False], kind='stable'
+    ).reset_index(drop=True)
     
-    # SEMPRE eliminar duplicatas primeiro, independente do tipo de busca
-    unique_df = filtered_df.drop_duplicates(subset=['FipeID'], keep='first')
+    codes = ordered['FipeID'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(ordered)])
+    canonical_pos = np.repeat(starts, sizes)
     
-    # Busca por FIPE ID exato
-    if query.isdigit():
-        fipe_matches = unique_df[unique_df['FipeID'].astype(str) == query]
-        if not fipe_matches.empty:
-            return fipe_matches.to_dict('records')
+    view = ordered.iloc[starts].reset_index(drop=True)
     
-    # Busca textual com score
-    results = []
+    # Anos-modelo de cada FipeID em um único array compacto (fatias sem cópia)
+    years = pd.to_numeric(ordered['VehicleModelYear'], errors='coerce').fillna(0).to_numpy(dtype='int16')
+    view['ModelYears'] = np.split(years, starts[1:])
     
-    for _, row in unique_df.iterrows():
-        score = 0
+    # Diferenças de características em relação à linha canônica, por ano
+    year_flags = [None] * len(view)
+    group_of_row = np.repeat(np.arange(len(starts)), sizes)
+    for col in FLAG_COLUMNS:
+        if col not in ordered.columns:
+            continue
+        values = ordered[col].to_numpy(dtype=object)
+        missing = pd.isna(values)
+        same = (values == values[canonical_pos]) | (missing & missing[canonical_pos])
+        rows = np.flatnonzero(~same)
+        for group, year, value, is_missing in zip(
+            group_of_row[rows].tolist(), years[rows].tolist(), values[rows].tolist(), missing[rows].tolist()
+        ):
+            if year_flags[group] is None:
+                year_flags[group] = {}
+            year_flags[group].setdefault(year, {})[col] = None if is_missing else value
+    view['YearFlags'] = year_flags
+    
+    return add_search_keys(view)
+
+def apply_year_flags(vehicle, year):
+    """Aplica ao registro canônico as características específicas de um ano-modelo"""
+    result = dict(vehicle)
+    result['VehicleModelYear'] = year
+    overrides = (vehicle.get('YearFlags') or {}).get(year)
+    if overrides:
+        result.update(overrides)
+    return result
+
+# Campos usados nas sugestões do autocompletar
+AUTOCOMPLETE_FIELDS = ['BrandName', 'VehicleName', 'Abreviação de descrição']
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_PRECOMPUTED_PREFIX = 3
+
+class AutocompleteIndex:
+    """Índice de prefixos em array ordenado para sugestões de marca, modelo e abreviação"""
+    
+    def __init__(self, view):
+        # Peso de cada sugestão = quantidade de veículos (FipeIDs) que ela cobre
+        coverage = self._coverage(view)
+        self.suggestions = list(coverage)
+        self.weights = np.fromiter(coverage.values(), dtype=np.int64, count=len(coverage))
+        
+        entries = self._entries(self.suggestions, 0)
+        entries.sort()
+        
+        self._keys = [key for key, _ in entries]
+        self._ids = np.fromiter((suggestion_id for _, suggestion_id in entries), dtype=np.int64, count=len(entries))
+        
+        # Prefixos curtos cobrem faixas enormes: as melhores sugestões deles são pré-calculadas,
+        # de baixo para cima (as de "CO" saem das de "COM", "COR", ...). Cada grupo é um
+        # prefixo exato de 3 letras; uma chave mais curta ("KA" de "Ford Ka") é um grupo só
+        # dela, sem engolir as chaves "KAR...", "KAD..." que vêm logo depois
+        groups = {}
+        lo = 0
+        while lo < len(self._keys):
+            key = self._keys[lo]
+            if len(key) < AUTOCOMPLETE_PRECOMPUTED_PREFIX:
+                group, hi = key, bisect.bisect_right(self._keys, key, lo)
+            else:
+                group = key[:AUTOCOMPLETE_PRECOMPUTED_PREFIX]
+                hi = bisect.bisect_left(self._keys, group + '\U0010ffff', lo)
+            groups[group] = self._top_in_range(lo, hi)
+            lo = hi
         
-        # Score por marca (peso maior)
-        if query in str(row.get('BrandName', '')).upper():
-            score += 50
+        self._top_by_prefix = {}
+        for length in range(1, AUTOCOMPLETE_PRECOMPUTED_PREFIX + 1):
+            candidates = {}
+            for group, top in groups.items():
+                if len(group) >= length:
+                    candidates.setdefault(group[:length], set()).update(top)
+            for prefix, ids in candidates.items():
+                self._top_by_prefix[prefix] = self._rank(np.fromiter(ids, dtype=np.int64))
+    
+    @staticmethod
+    def _coverage(view):
+        """Quantidade de linhas da visão (FipeIDs) por texto de sugestão"""
+        coverage = {}
+        for col in AUTOCOMPLETE_FIELDS:
+            if view is None or col not in view.columns:
+                continue
+            for text, count in view[col].dropna().astype(str).str.strip().value_counts().items():
+                if text:
+                    coverage[text] = coverage.get(text, 0) + int(count)
+        return coverage
+    
+    @staticmethod
+    def _entries(suggestions, first_id):
+        """Uma chave por início de palavra: "Compass" encontra "Jeep Compass Longitude" """
+        entries = []
+        folded = fold_search_series(pd.Series(suggestions, dtype=object))
+        for suggestion_id, key in enumerate(folded, start=first_id):
+            for word in re.finditer(r'\S+', key):
+                entries.append((key[word.start():], suggestion_id))
+        return entries
+    
+    @cached_property
+    def _id_of(self):
+        return {text: suggestion_id for suggestion_id, text in enumerate(self.suggestions)}
+    
+    def with_delta(self, removed_view, added_view):
+        """Cópia com a cobertura das linhas trocadas; só os prefixos curtos afetados são recalculados"""
+        change = self._coverage(added_view)
+        for text, count in self._coverage(removed_view).items():
+            change[text] = change.get(text, 0) - count
+        change = {text: count for text, count in change.items() if count}
         
-        # Score por nome do veículo
-        if query in str(row.get('VehicleName', '')).upper():
-            score += 40
+        index = copy.copy(self)
+        index.__dict__.pop('nbytes', None)
+        index._id_of = dict(self._id_of)
+        index.suggestions = list(self.suggestions)
+        index._top_by_prefix = dict(self._top_by_prefix)
         
-        # Score por abreviação
-        if query in str(row.get('Abreviação de descrição', '')).upper():
-            score += 35
+        new_texts = [text for text in change if text not in index._id_of]
+        first_id = len(index.suggestions)
+        for offset, text in enumerate(new_texts):
+            index._id_of[text] = first_id + offset
+        index.suggestions.extend(new_texts)
+        index.weights = np.concatenate([self.weights, np.zeros(len(new_texts), dtype=np.int64)])
+        changed_ids = np.fromiter((index._id_of[text] for text in change), dtype=np.int64, count=len(change))
+        index.weights[changed_ids] += np.fromiter(change.values(), dtype=np.int64, count=len(change))
         
-        # Score por FIPE parcial
-        if query in str(row.get('FipeID', '')):
-            score += 20
+        # Chaves das sugestões novas intercaladas no array ordenado
+        if new_texts:
+            merged = list(heapq.merge(zip(self._keys, self._ids.tolist()), sorted(self._entries(new_texts, first_id))))
+            index._keys = [key for key, _ in merged]
+            index._ids = np.fromiter((suggestion_id for _, suggestion_id in merged), dtype=np.int64, count=len(merged))
         
-        if score >= 20:  # Threshold mínimo
-            result = row.to_dict()
-            result['search_score'] = score
-            results.append(result)
+        affected = set()
+        for key, _ in self._entries(list(change), 0):
+            for length in range(1, AUTOCOMPLETE_PRECOMPUTED_PREFIX + 1):
+                affected.add(key[:length])
+        # Faixa completa de cada prefixo (inclui chaves mais curtas que o prefixo pré-calculado)
+        for prefix in affected:
+            lo, hi = index._prefix_range(prefix)
+            index._top_by_prefix[prefix] = index._top_in_range(lo, hi)
+        return index
     
-    # Ordenar por relevância e limitar a 10
-    return sorted(results, key=lambda x: x.get('search_score', 0), reverse=True)[:10]
-
-# MAIN APP
-def main():
-    # Header
-    st.markdown("""
-    <div class="main-header">
-        <h1>🔧 Sistema Inteligente de Calibração ADAS</h1>
-        <p>Plataforma Profissional para Consulta de Sistemas ADAS - Criada pela Carglass</p>
-    </div>
-    """, unsafe_allow_html=True)
+    @cached_property
+    def nbytes(self):
+        """Memória aproximada: textos das chaves e sugestões, arrays e prefixos pré-calculados"""
+        strings = sum(sys.getsizeof(text) for text in self._keys) + sum(sys.getsizeof(text) for text in self.suggestions)
+        pointers = 8 * (len(self._keys) + len(self.suggestions))
+        prefixes = sys.getsizeof(self._top_by_prefix) + sum(
+            sys.getsizeof(prefix) + sys.getsizeof(top) + 8 * len(top) for prefix, top in self._top_by_prefix.items()
+        )
+        return strings + pointers + prefixes + self._ids.nbytes + self.weights.nbytes
     
-    # Carregar dados
-    df, status_message, total_records = load_vehicle_data()
+    def _rank(self, ids, limit=AUTOCOMPLETE_LIMIT):
+        """Ordena sugestões por veículos cobertos (desempate alfabético) e mantém as `limit` primeiras"""
+        ids = ids[self.weights[ids] > 0]
+        ranked = sorted(ids.tolist(), key=lambda suggestion_id: (-self.weights[suggestion_id], self.suggestions[suggestion_id]))
+        return ranked[:limit]
     
-    # Mostrar status dos dados carregados
-    if "XLSX carregada" in status_message:
-        st.success(status_message + " 📊 (Dados limpos)")
-    elif "CSV carregada" in status_message:
-        st.info(status_message + " 📋 (Fallback)")
-    elif "demonstração" in status_message:
-        st.warning(status_message)
+    def _top_in_range(self, lo, hi, limit=AUTOCOMPLETE_LIMIT):
+        """Melhores sugestões entre as chaves [lo, hi) sem ordenar a faixa inteira"""
+        ids = self._ids[lo:hi]
+        if len(ids) > limit * 4:
+            top = np.argpartition(-self.weights[ids], limit * 4 - 1)[:limit * 4]
+            candidates = np.unique(ids[top])
+            # Uma mesma sugestão pode aparecer várias vezes na faixa (várias palavras com o prefixo)
+            if len(candidates) < limit:
+                candidates = np.unique(ids)
+        else:
+            candidates = np.unique(ids)
+        return self._rank(candidates, limit)
+    
+    def _prefix_range(self, prefix):
+        """Faixa [lo, hi) das chaves que começam com `prefix`"""
+        lo = bisect.bisect_left(self._keys, prefix)
+        return lo, bisect.bisect_left(self._keys, prefix + '\U0010ffff', lo)
+    
+    def suggest(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """Retorna até `limit` pares (sugestão, veículos cobertos), dos mais relevantes aos menos"""
+        prefix = fold_search_text(prefix)
+        if not prefix:
+            return []
+        
+        ranked = None
+        if len(prefix) <= AUTOCOMPLETE_PRECOMPUTED_PREFIX and limit <= AUTOCOMPLETE_LIMIT:
+            ranked = self._top_by_prefix.get(prefix)
+        if ranked is not None:
+            ranked = ranked[:limit]
+        else:
+            # Prefixo longo ou sem entrada pré-calculada: busca na faixa ordenada
+            lo, hi = self._prefix_range(prefix)
+            ranked = self._top_in_range(lo, hi, limit) if lo < hi else []
+        
+        return [(self.suggestions[suggestion_id], int(self.weights[suggestion_id])) for suggestion_id in ranked]
+
+SEARCH_RESULT_LIMIT = 10
+YEAR_ONLY_RESULT_LIMIT = 20
+
+def _matches_vehicle_fields(query, keys):
+    """Candidato da busca textual: o termo aparece em alguma das chaves já normalizadas"""
+    return any(query in key for key in keys)
+
+def _top_ranked(positions, scores, years=None):
+    """Ordena por relevância (empate = ano-modelo mais recente, depois ordem da visão); o resultado completo fica no cache e a tela pagina"""
+    positions = np.asarray(positions, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    years = np.zeros(len(positions), dtype=np.int64) if years is None else np.asarray(years, dtype=np.int64)
+    order = np.lexsort((positions, -years, -scores))
+    return positions[order], scores[order]
+
+# Ranking BM25F: peso de cada campo = SEARCH_FIELD_WEIGHTS / 10; b = normalização pelo tamanho do campo
+BM25_K1 = 1.2
+BM25_FIELD_B = {'BrandName': 0.3, 'VehicleName': 0.75, 'Abreviação de descrição': 0.75, 'FipeID': 0.0}
+
+def _hashed(index):
+    """O próprio índice, com a tabela hash já montada
+
+    O pandas monta a tabela na primeira busca, e buscas simultâneas (uma thread por rerun) em
+    um índice recém-criado podem falhar com "uniquely valued Index". Índices publicados em
+    snapshots passam por aqui antes.
+    """
+    # Atribuição, não expressão solta: no script do app a "mágica" do Streamlit escreveria o valor na página
+    _ = index.is_unique
+    return index
+
+def _contains_sorted(values, value):
+    position = bisect.bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+class BM25FIndex:
+    """Estatísticas de termos por campo para o ranking BM25F, calculadas uma vez por base
+
+    Muitos FipeIDs compartilham marca e nome, então tf, tamanho e normalização ficam por texto
+    distinto de cada campo e um candidato só precisa do código do seu texto. `field_counts`
+    traz, por campo, quantas linhas da visão têm cada texto (chave normalizada). A frequência
+    de documentos de um termo é a do campo em que ele mais aparece.
+    """
+
+    def __init__(self, field_counts):
+        token_lists = {
+            col: [str(text).split() for text in field_counts[col].index] if col in field_counts else []
+            for col, _ in SEARCH_FIELD_WEIGHTS
+        }
+        self.terms = sorted({term for lists in token_lists.values() for tokens in lists for term in tokens})
+        term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+
+        self.texts, self._counts, self._lengths = {}, {}, {}
+        self._token_term, self._token_text, self._pair_text, self._pair_term = {}, {}, {}, {}
+        for col, _ in SEARCH_FIELD_WEIGHTS:
+            self.texts[col] = _hashed(pd.Index(field_counts[col].index if col in field_counts else [], dtype=object))
+            self._counts[col] = (
+                field_counts[col].to_numpy(dtype=np.int64) if col in field_counts else np.zeros(0, dtype=np.int64)
+            )
+            self._add_texts(col, 0, token_lists[col], term_ids)
+        self._update_weights()
+
+    def _add_texts(self, col, first, lists, term_ids):
+        """Acrescenta ao campo os tokens dos textos `first`, `first + 1`, ... (já incluídos em `texts`)"""
+        lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        token_term = np.fromiter(
+            (term_ids[term] for tokens in lists for term in tokens), dtype=np.int64, count=int(lengths.sum())
+        )
+        token_text = np.repeat(np.arange(first, first + len(lists)), lengths)
+        # Pares texto × termo distintos: no df do campo cada texto conta uma vez por termo
+        width = max(len(self.terms), 1)
+        pairs = np.unique(token_text * width + token_term)
+
+        def extend(part, values):
+            part[col] = np.concatenate([part[col], values]) if col in part else values
+        extend(self._lengths, lengths)
+        extend(self._token_term, token_term)
+        extend(self._token_text, token_text)
+        extend(self._pair_text, pairs // width)
+        extend(self._pair_term, pairs % width)
+
+    def _update_weights(self):
+        """Total de linhas, df dos termos e pesos por texto a partir das contagens atuais"""
+        self.total = max((int(counts.sum()) for counts in self._counts.values()), default=0)
+        self.doc_freq = np.zeros(len(self.terms), dtype=np.int64)
+        self._field_scale = {}
+        for col, weight in SEARCH_FIELD_WEIGHTS:
+            counts, lengths = self._counts[col], self._lengths[col]
+            field_doc_freq = np.bincount(
+                self._pair_term[col], weights=counts[self._pair_text[col]], minlength=len(self.terms)
+            ).astype(np.int64)
+            np.maximum(self.doc_freq, field_doc_freq, out=self.doc_freq)
+
+            # Peso do campo já dividido pela normalização de tamanho (1 - b + b * tamanho / média);
+            # o 0 no fim atende o código -1 (texto que não existe na base)
+            b = BM25_FIELD_B.get(col, 0.75)
+            total_length = int(lengths @ counts)
+            average = total_length / self.total if total_length else 1.0
+            self._field_scale[col] = np.append((weight / 10) / (1 - b + b * lengths / average), 0.0)
+
+    def with_delta(self, removed_view, added_view):
+        """Cópia com as contagens das linhas trocadas da visão; só os textos novos são tokenizados
+
+        Textos que ficam sem linhas continuam no índice com contagem zero (não alteram df,
+        tamanho médio nem scores).
+        """
+        changes, new_texts = {}, {}
+        for col, _ in SEARCH_FIELD_WEIGHTS:
+            key = search_key_column(col)
+            count = lambda frame: (
+                pd.Series(np.asarray(frame[key], dtype=object)).value_counts() if key in frame.columns
+                else pd.Series(dtype='int64')
+            )
+            changes[col] = count(added_view).sub(count(removed_view), fill_value=0).astype('int64')
+            new_texts[col] = changes[col].index.difference(self.texts[col]).tolist()
+
+        index = copy.copy(self)
+        index.texts, index._counts, index._lengths = dict(self.texts), dict(self._counts), dict(self._lengths)
+        index._token_term, index._token_text = dict(self._token_term), dict(self._token_text)
+        index._pair_text, index._pair_term = dict(self._pair_text), dict(self._pair_term)
+
+        # Termos novos intercalados na lista ordenada; os ids antigos andam o número de termos
+        # novos inseridos antes deles
+        token_lists = {col: [str(text).split() for text in texts] for col, texts in new_texts.items()}
+        tokens = {term for lists in token_lists.values() for terms in lists for term in terms}
+        added_terms = sorted(term for term in tokens if not _contains_sorted(self.terms, term))
+        if added_terms:
+            insert_at = [bisect.bisect_left(self.terms, term) for term in added_terms]
+            index.terms, previous = [], 0
+            for term, position in zip(added_terms, insert_at):
+                index.terms += self.terms[previous:position]
+                index.terms.append(term)
+                previous = position
+            index.terms += self.terms[previous:]
+            old_ids = np.arange(len(self.terms))
+            remap = old_ids + np.searchsorted(np.array(insert_at, dtype=np.int64), old_ids, side='right')
+            for part in (index._token_term, index._pair_term):
+                for col in part:
+                    part[col] = remap[part[col]]
+        term_ids = {term: bisect.bisect_left(index.terms, term) for term in tokens}
+
+        for col, _ in SEARCH_FIELD_WEIGHTS:
+            first = len(index.texts[col])
+            if new_texts[col]:
+                index.texts[col] = _hashed(index.texts[col].append(pd.Index(new_texts[col], dtype=object)))
+                index._add_texts(col, first, token_lists[col], term_ids)
+            counts = np.concatenate([self._counts[col], np.zeros(len(new_texts[col]), dtype=np.int64)])
+            counts[index.texts[col].get_indexer(changes[col].index)] += changes[col].to_numpy()
+            index._counts[col] = counts
+        index._update_weights()
+        return index
+
+    @property
+    def nbytes(self):
+        parts = (self._counts, self._lengths, self._token_term, self._token_text, self._pair_text, self._pair_term,
+                 self._field_scale)
+        arrays = [self.doc_freq] + [array for part in parts for array in part.values()]
+        return sum(array.nbytes for array in arrays) + sum(sys.getsizeof(term) for term in self.terms)
+
+    def score(self, query, codes):
+        """Scores BM25F dos candidatos; `codes` traz, por campo, o texto de cada candidato (posição em `texts`)
+
+        Cada palavra da busca vale também como prefixo (busca enquanto digita): os termos que
+        começam com ela somam tf e df como se fossem um termo só.
+        """
+        length = len(next(iter(codes.values()))) if codes else 0
+        scores = np.zeros(length)
+        for token in dict.fromkeys(query.split()):
+            lo = bisect.bisect_left(self.terms, token)
+            hi = bisect.bisect_left(self.terms, token + '\U0010ffff', lo)
+            if lo == hi:
+                continue
+            doc_freq = min(int(self.doc_freq[lo:hi].sum()), self.total)
+            idf = np.log(1 + (self.total - doc_freq + 0.5) / (doc_freq + 0.5))
+
+            term_frequency = np.zeros(length)
+            for col, _ in SEARCH_FIELD_WEIGHTS:
+                if col not in codes:
+                    continue
+                hits = (self._token_term[col] >= lo) & (self._token_term[col] < hi)
+                text_frequency = np.bincount(self._token_text[col][hits], minlength=len(self._field_scale[col]))
+                term_frequency += (text_frequency * self._field_scale[col])[codes[col]]
+            scores += idf * term_frequency / (BM25_K1 + term_frequency)
+        return scores
+
+def _compute_base_stats(df):
+    """Estatísticas exibidas na tela, calculadas uma vez por base"""
+    stats = {'total_vehicles': None, 'adas_vehicles': None, 'brands': None, 'min_year': None, 'max_year': None}
+    if 'FipeID' in df.columns:
+        stats['total_vehicles'] = int(df['FipeID'].nunique())
+        if 'ADAS' in df.columns:
+            stats['adas_vehicles'] = int(df.loc[df['ADAS'] == 'Sim', 'FipeID'].nunique())
+    if 'BrandName' in df.columns:
+        stats['brands'] = int(df['BrandName'].nunique())
+    if 'VehicleModelYear' in df.columns and not df.empty:
+        stats['min_year'] = int(df['VehicleModelYear'].min())
+        stats['max_year'] = int(df['VehicleModelYear'].max())
+    return stats
+
+def _built_nbytes(base, attributes):
+    """Memória dos atributos preguiçosos (cached_property) que já foram construídos"""
+    total = 0
+    for name in attributes:
+        value = base.__dict__.get(name)
+        if isinstance(value, pd.DataFrame):
+            total += _dataframe_nbytes(value)
+        elif value is not None:
+            total += getattr(value, 'nbytes', 0)
+    return total
+
+def _distinct_model_years(df):
+    """Anos-modelo presentes na base, do mais recente ao mais antigo"""
+    if 'VehicleModelYear' not in df.columns:
+        return []
+    return sorted((int(year) for year in df['VehicleModelYear'].dropna().unique()), reverse=True)
+
+# Colunas com filtro avançado (facetas); valores nulos não entram em nenhuma opção
+FACET_FLAG_COLUMNS = ['ADAS', 'ADAS no Parabrisa', 'Adas no Parachoque', 'Camera no Retrovisor', 'Faróis Matrix']
+FACET_COLUMNS = ['BrandName', 'VehicleModelYear'] + FACET_FLAG_COLUMNS + ['Tipo de Regulagem']
+
+_POPCOUNT_TABLE = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+def _popcount(bitmap):
+    """Quantidade de bits ligados em um bitmap empacotado (uint8)"""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bitmap).sum(dtype=np.int64))
+    return int(_POPCOUNT_TABLE[bitmap].sum(dtype=np.int64))
+
+class FacetIndex:
+    """Bitmaps empacotados (um bit por linha FipeID × ano) para cada valor das colunas de faceta
+
+    Os filtros são uma sequência de pares (coluna, valores): valores da mesma entrada se
+    combinam com OU e entradas diferentes com E, sempre na mesma linha (mesmo ano-modelo).
+    """
+
+    def __init__(self, df, view):
+        self.size = len(df)
+        self._all = np.packbits(np.ones(self.size, dtype=bool))
+        self._row_fipe = df['FipeID'].to_numpy() if 'FipeID' in df.columns else np.empty(0, dtype=np.int64)
+        self._view_index = _hashed(pd.Index(view['FipeID']) if 'FipeID' in view.columns else pd.Index([]))
+        # Posição de cada linha da visão (a visão da sobreposição de deltas não começa em 0)
+        self._view_positions = view.index.to_numpy(dtype=np.int64)
+
+        self.bitmaps = {}
+        for col in FACET_COLUMNS:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col])
+            self.bitmaps[col] = {
+                value: np.packbits(codes == code) for code, value in enumerate(uniques.tolist())
+            }
+
+    @property
+    def nbytes(self):
+        return self._all.nbytes * (1 + sum(len(values) for values in self.bitmaps.values()))
+
+    def match(self, filters, rows=None):
+        """Bitmap das linhas que atendem a todos os filtros (dentre as do bitmap `rows`, se informado)"""
+        result = (self._all if rows is None else rows).copy()
+        for col, values in filters:
+            union = np.zeros_like(result)
+            for value in values:
+                bitmap = self.bitmaps.get(col, {}).get(value)
+                if bitmap is not None:
+                    np.bitwise_or(union, bitmap, out=union)
+            np.bitwise_and(result, union, out=result)
+        return result
+
+    def matching_positions(self, filters, rows=None):
+        """Posições na visão canônica dos FipeIDs com ao menos uma linha que atende aos filtros"""
+        matched = np.flatnonzero(np.unpackbits(self.match(filters, rows), count=self.size))
+        fipes = np.unique(self._row_fipe[matched])
+        # Em ordem de posição: FipeIDs incluídos por deltas não seguem a ordem dos FipeIDs
+        return np.sort(self._view_positions[self._view_index.get_indexer(fipes)])
+
+    def counts(self, filters, rows=None, columns=None):
+        """Linhas por valor de cada faceta (ou só das `columns`), considerando os filtros das demais colunas"""
+        counts = {}
+        # Colunas fora dos filtros compartilham o mesmo conjunto de filtros das demais
+        selections = {}
+        for col, bitmaps in self.bitmaps.items():
+            if columns is not None and col not in columns:
+                continue
+            others = tuple((other, values) for other, values in filters if other != col)
+            if others not in selections:
+                selections[others] = self.match(others, rows)
+            selected = selections[others]
+            counts[col] = {value: _popcount(selected & bitmap) for value, bitmap in bitmaps.items()}
+        return counts
+
+    def without(self, rows):
+        """Bitmap de todas as linhas menos as informadas (linhas substituídas por deltas)"""
+        bitmap = self._all.copy()
+        _clear_bits(bitmap, rows)
+        return bitmap
+
+def _clear_bits(bitmap, rows):
+    """Desliga os bits das linhas informadas em um bitmap empacotado (ordem de np.packbits)"""
+    np.bitwise_and.at(bitmap, rows >> 3, ~(128 >> (rows & 7)).astype(np.uint8))
+
+def _with_year_filter(filters, year_int):
+    """Acrescenta o ano escolhido no seletor como mais um filtro de faceta"""
+    filters = tuple(filters or ())
+    if year_int is not None:
+        filters += (('VehicleModelYear', (year_int,)),)
+    return filters
+
+# Dimensões do cubo de agregados (a característica é uma das FACET_FLAG_COLUMNS igual a 'Sim')
+CUBE_DIMENSIONS = ['BrandName', 'VehicleModelYear', 'Característica', 'Tipo de Regulagem']
+CUBE_SOURCE_COLUMNS = ['FipeID', 'BrandName', 'VehicleModelYear', 'Tipo de Regulagem'] + FACET_FLAG_COLUMNS
+
+def _cube_counts(frame, dimensions, weights=None):
+    """Linhas com cada característica = 'Sim', agrupadas pelas dimensões do cubo (ou soma de `weights` por linha)"""
+    levels = [dim for dim in CUBE_DIMENSIONS if dim in dimensions or dim == 'Característica']
+    empty = pd.Series(
+        dtype='int64',
+        index=pd.MultiIndex.from_tuples([], names=levels)
+    )
+    if frame is None or len(frame) == 0:
+        return empty
+
+    keys = pd.DataFrame({
+        dim: frame[dim] if dim in frame.columns else pd.Series(np.nan, index=frame.index, dtype=object)
+        for dim in dimensions
+    })
+    flags = [col for col in FACET_FLAG_COLUMNS if col in frame.columns]
+    if not flags:
+        return empty
+    # Uma linha por (linha da base, característica = 'Sim') e um único agrupamento
+    rows, flag_ids = np.nonzero(np.column_stack([frame[col].eq('Sim').to_numpy() for col in flags]))
+    pairs = keys.iloc[rows].reset_index(drop=True)
+    pairs['Característica'] = np.asarray(flags, dtype=object)[flag_ids]
+    if pairs.empty:
+        return empty
+    if weights is None:
+        return pairs.groupby(levels, dropna=False).size().astype('int64')
+    pairs['weight'] = np.asarray(weights)[rows]
+    return pairs.groupby(levels, dropna=False)['weight'].sum().astype('int64')
+
+def _merge_cube_counts(counts, removed, added, dimensions):
+    """Soma/subtrai as contagens de linhas incluídas/removidas, descartando células zeradas"""
+    frames = [(frame, sign) for frame, sign in ((removed, -1), (added, 1)) if frame is not None and len(frame)]
+    if not frames:
+        return counts
+    # Só as colunas do cubo (concatenar as chaves de busca categóricas custaria o tamanho das categorias)
+    frames = [(frame[[col for col in frame.columns if col in dimensions or col in FACET_FLAG_COLUMNS]], sign)
+              for frame, sign in frames]
+    # Removidas (-1) e incluídas (+1) num único agrupamento ponderado
+    delta = _cube_counts(
+        pd.concat([frame for frame, _ in frames], ignore_index=True), dimensions,
+        weights=np.concatenate([np.full(len(frame), sign, dtype=np.int64) for frame, sign in frames])
+    )
+    if len(delta):
+        counts = counts.add(delta, fill_value=0) if len(counts) else delta
+    return counts[counts != 0].astype('int64')
+
+class AggregateCube:
+    """Contagens de veículos (FipeID distintos) por marca × ano-modelo × característica × tipo de regulagem
+
+    `by_year` tem uma célula por ano-modelo: como cada FipeID aparece uma vez por ano, as
+    contagens são somas de linhas e podem ser atualizadas com deltas. `latest` usa a visão
+    canônica (ano mais recente de cada FipeID) para o recorte "todos os anos" sem contar o
+    mesmo veículo várias vezes.
+    """
+
+    def __init__(self, df, view):
+        if {'FipeID', 'VehicleModelYear'} <= set(df.columns):
+            df = df.drop_duplicates(['FipeID', 'VehicleModelYear'])
+        self.by_year = _cube_counts(df, ['BrandName', 'VehicleModelYear', 'Tipo de Regulagem'])
+        self.latest = _cube_counts(view, ['BrandName', 'Tipo de Regulagem'])
+
+    def with_delta(self, removed_rows=None, added_rows=None, removed_view=None, added_view=None):
+        """Cópia do cubo com as linhas alteradas da tabela e da visão canônica"""
+        cube = copy.copy(self)
+        cube.by_year = _merge_cube_counts(
+            self.by_year, removed_rows, added_rows, ['BrandName', 'VehicleModelYear', 'Tipo de Regulagem']
+        )
+        cube.latest = _merge_cube_counts(self.latest, removed_view, added_view, ['BrandName', 'Tipo de Regulagem'])
+        return cube
+
+    @staticmethod
+    def _select(counts, level, values):
+        if not values:
+            return counts
+        return counts[counts.index.get_level_values(level).isin(values)]
+
+    def _pivot(self, counts, rows):
+        table = counts.groupby(level=[rows, 'Característica'], dropna=False).sum().unstack(fill_value=0)
+        return table.reindex(columns=[col for col in FACET_FLAG_COLUMNS if col in table.columns])
+
+    def brand_table(self, year=None, regulation=()):
+        """Marcas × características; sem ano, cada FipeID conta pelo seu ano-modelo mais recente"""
+        counts = self.latest if year is None else self._select(self.by_year, 'VehicleModelYear', [year])
+        table = self._pivot(self._select(counts, 'Tipo de Regulagem', regulation), 'BrandName')
+        return table.sort_values(list(table.columns[:1]), ascending=False) if len(table.columns) else table
+
+    def year_table(self, brands=(), regulation=()):
+        """Anos-modelo × características para as marcas escolhidas"""
+        counts = self._select(self._select(self.by_year, 'BrandName', brands), 'Tipo de Regulagem', regulation)
+        return self._pivot(counts, 'VehicleModelYear').sort_index()
+
+    @property
+    def nbytes(self):
+        return int(self.by_year.memory_usage(deep=True) + self.latest.memory_usage(deep=True))
+
+    def totals(self):
+        """FipeIDs por característica (ano-modelo mais recente de cada um)"""
+        return self.latest.groupby(level='Característica').sum().reindex(FACET_FLAG_COLUMNS).dropna().astype('int64')
+
+# Atualização incremental (delta): linhas identificadas por (FipeID, ano-modelo)
+DELTA_OPERATION_COLUMNS = ['Operação', 'Operacao', 'op']
+DELTA_UPSERT_OPERATIONS = {'insert', 'inserir', 'i', 'update', 'atualizar', 'u', 'a', 'upsert'}
+DELTA_DELETE_OPERATIONS = {'delete', 'excluir', 'd', 'e'}
+
+def _row_keys(frame):
+    """Chave numérica de cada linha: FipeID × 10000 + ano-modelo"""
+    fipe = pd.to_numeric(frame['FipeID'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    year = pd.to_numeric(frame['VehicleModelYear'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    return fipe * 10000 + year
+
+def _isin_keys(values, keys):
+    """np.isin com tabela hash das poucas chaves do delta (np.isin ordenaria a base inteira)"""
+    return pd.Series(values, copy=False).isin(keys).to_numpy()
+
+def prepare_delta(delta, columns):
+    """Separa um delta em chaves afetadas e linhas a gravar (inclusões e alterações)
+
+    A coluna de operação (Operação/Operacao/op) aceita insert/update/delete ou os nomes em
+    português; sem ela, todas as linhas são gravadas (inclui ou substitui). Linhas sem chave
+    válida ou com operação desconhecida são ignoradas; se a mesma chave aparece mais de uma
+    vez, vale a última.
+    Retorna (chaves afetadas, linhas a gravar com as colunas da base, quantidade ignorada).
+    """
+    if not {'FipeID', 'VehicleModelYear'} <= set(delta.columns):
+        raise ValueError("O delta precisa das colunas FipeID e VehicleModelYear")
+    
+    fipe = pd.to_numeric(delta['FipeID'], errors='coerce')
+    year = pd.to_numeric(delta['VehicleModelYear'], errors='coerce')
+    operation_col = next((col for col in DELTA_OPERATION_COLUMNS if col in delta.columns), None)
+    if operation_col is None:
+        operations = pd.Series('upsert', index=delta.index)
     else:
-        st.error(status_message)
+        operations = delta[operation_col].astype(str).str.strip().str.lower()
+    is_delete = operations.isin(DELTA_DELETE_OPERATIONS).to_numpy()
+    valid = (fipe.notna() & year.notna()).to_numpy() & (is_delete | operations.isin(DELTA_UPSERT_OPERATIONS).to_numpy())
     
-    # Sidebar com estatísticas dinâmicas
-    with st.sidebar:
-        st.header("📊 Estatísticas")
+    keys = fipe.fillna(-1).to_numpy(dtype=np.int64) * 10000 + year.fillna(0).to_numpy(dtype=np.int64)
+    last = valid & ~pd.Series(np.where(valid, keys, -1)).duplicated(keep='last').to_numpy()
+    
+    upserts = delta[last & ~is_delete].reindex(columns=columns).reset_index(drop=True)
+    upserts['FipeID'] = fipe[last & ~is_delete].to_numpy(dtype=np.int64)
+    upserts['VehicleModelYear'] = year[last & ~is_delete].to_numpy(dtype=np.int64)
+    return keys[last], upserts, int((~valid).sum())
+
+def _patch_frame(frame, positions, rows):
+    """Cópia de `frame` com `rows` gravadas nas posições informadas (posições além do fim acrescentam linhas)
+
+    Coluna a coluna para preservar as categorias das chaves de busca (um concat misturando
+    categorias diferentes viraria object). Colunas que `rows` não traz ficam como estão (sem
+    valor definido nas linhas acrescentadas).
+    """
+    length = max(len(frame), int(positions.max()) + 1) if len(positions) else len(frame)
+    columns = {}
+    for col in frame.columns:
+        current = frame[col]
+        values = rows[col] if col in rows.columns else None
+        if isinstance(current.dtype, pd.CategoricalDtype):
+            categories = current.cat.categories
+            codes = np.full(length, -1, dtype=np.int64)
+            codes[:len(frame)] = current.cat.codes.to_numpy()
+            if values is not None:
+                categories = categories.append(pd.Index(values.dropna().unique()).difference(categories))
+                codes[positions] = categories.get_indexer(values)
+            columns[col] = pd.Categorical.from_codes(codes, categories)
+            continue
         
-        if not df.empty:
-            # CAMPO 1: Total de Veículos - Contagem distinta de FipeID
-            if 'FipeID' in df.columns:
-                total_vehicles = df['FipeID'].nunique()
-                st.metric("Total de Veículos", f"{total_vehicles:,}")
-            
-            # CAMPO 2: Veículos com ADAS - Contagem distinta de FipeID onde ADAS = 'Sim'
-            if 'ADAS' in df.columns and 'FipeID' in df.columns:
-                adas_vehicles = df[df['ADAS'] == 'Sim']['FipeID'].nunique()
-                st.metric("Veículos com ADAS", f"{adas_vehicles:,}")
-            
-            # Marcas Disponíveis
-            if 'BrandName' in df.columns:
-                unique_brands = df['BrandName'].nunique()
-                st.metric("Marcas Disponíveis", unique_brands)
+        patched = current.to_numpy()
+        if length > len(frame):
+            grown = np.empty(length, dtype=patched.dtype if patched.dtype.kind in 'Obfc' else object)
+            grown[:len(frame)] = patched
+            patched = grown
         else:
-            st.error("❌ Nenhum dado carregado")
+            patched = patched.copy()
+        if values is None:
+            columns[col] = patched
+            continue
+        try:
+            patched[positions] = values.to_numpy(dtype=patched.dtype)
+        except (TypeError, ValueError):
+            patched = patched.astype(object)
+            patched[positions] = values.to_numpy(dtype=object)
+        columns[col] = patched
+    return pd.DataFrame(columns, columns=frame.columns)
+
+def _snapshot_property(name):
+    """Atributo lido do snapshot publicado no momento da leitura"""
+    return property(lambda self: getattr(self.snapshot, name))
+
+def _value_counts(values):
+    """Linhas por valor (nulos não contam), com valores Python como chaves"""
+    counts = values.value_counts()
+    return dict(zip(counts.index.tolist(), counts.tolist()))
+
+def _adjusted_counts(totals, removed_rows, added_rows):
+    """Contagens por valor de cada coluna menos as linhas removidas e mais as incluídas (valores zerados saem)"""
+    result = {}
+    for col, counts in totals.items():
+        counts = dict(counts)
+        for value, count in _value_counts(removed_rows[col]).items():
+            counts[value] -= count
+        for value, count in _value_counts(added_rows[col]).items():
+            counts[value] = counts.get(value, 0) + count
+        result[col] = {value: count for value, count in counts.items() if count}
+    return result
+
+def _concat_rows(frames, **kwargs):
+    """pd.concat sem as partes vazias (o pandas vai deixar de ignorá-las ao escolher os tipos)"""
+    filled = [frame for frame in frames if len(frame)]
+    return pd.concat(filled or frames[:1], **kwargs)
+
+def _delta_stats(stats, old_rows, new_rows, brands, model_years):
+    """Estatísticas ajustadas pelas linhas dos FipeIDs afetados; marcas e anos já vêm dos índices de facetas"""
+    stats = dict(stats)
+    if stats['total_vehicles'] is not None:
+        stats['total_vehicles'] += new_rows['FipeID'].nunique() - old_rows['FipeID'].nunique()
+    if stats['adas_vehicles'] is not None:
+        adas = lambda rows: rows.loc[rows['ADAS'] == 'Sim', 'FipeID'].nunique()
+        stats['adas_vehicles'] += adas(new_rows) - adas(old_rows)
+    if brands is not None:
+        stats['brands'] = brands
+    if model_years:
+        stats['min_year'], stats['max_year'] = model_years[-1], model_years[0]
+    return stats
+
+# Deltas da base pandas ficam numa sobreposição com as linhas dos FipeIDs alterados; acima
+# desse total de linhas ela é incorporada a um segmento novo (custo proporcional à base)
+DELTA_OVERLAY_MAX_ROWS = int(os.environ.get('ADAS_DELTA_OVERLAY_ROWS', '50000'))
+
+class VehicleSegment:
+    """Tabela e visão canônica de uma montagem completa, compartilhadas pelos snapshots que descendem dela
     
-    # Interface de busca
-    st.subheader("🔍 Buscar Veículo na Base ADAS")
+    Nunca é alterado: os deltas ficam na sobreposição de cada snapshot, e os índices montados
+    aqui (facetas, linhas e posição de cada FipeID) servem a todos eles. `live` marca as
+    posições da visão com FipeID existente (None = todas); a posição de um FipeID excluído
+    continua reservada para ele.
+    """
     
-    # Filtros de busca
-    col1, col2, col3 = st.columns([3, 1.5, 1])
+    def __init__(self, df, view, live=None):
+        self.df = df
+        self.view = view
+        self.live = live
     
-    with col1:
-        search_query = st.text_input(
-            "Digite para buscar:",
-            placeholder="Ex: BMW, Polo, Mercedes, 92983",
-            help="Busque por marca, modelo ou código FIPE"
+    @cached_property
+    def facets(self):
+        return FacetIndex(self.df, self.view)
+    
+    @cached_property
+    def facet_totals(self):
+        """Linhas por valor de cada faceta, sem filtros (contadas nos bitmaps, se já construídos)"""
+        if 'facets' in self.__dict__:
+            return self.facets.counts(())
+        return {col: _value_counts(self.df[col]) for col in FACET_COLUMNS if col in self.df.columns}
+    
+    @cached_property
+    def positions(self):
+        """FipeID → posição na visão (inclui as reservadas para FipeIDs excluídos)"""
+        return pd.Index(self.view['FipeID']) if 'FipeID' in self.view.columns else pd.Index([], dtype=np.int64)
+    
+    @cached_property
+    def live_positions(self):
+        return np.arange(len(self.view)) if self.live is None else np.flatnonzero(self.live)
+    
+    @cached_property
+    def _sorted_keys(self):
+        keys = _row_keys(self.df)
+        order = np.argsort(keys, kind='stable')
+        return order, keys[order]
+    
+    def rows_of(self, fipe_ids):
+        """Índices (em ordem) das linhas da tabela dos FipeIDs informados, por busca binária nas chaves"""
+        order, keys = self._sorted_keys
+        fipe_ids = np.asarray(fipe_ids, dtype=np.int64)
+        lo = np.searchsorted(keys, fipe_ids * 10000)
+        sizes = np.searchsorted(keys, (fipe_ids + 1) * 10000) - lo
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return np.sort(order[np.repeat(lo, sizes) + offsets])
+    
+    @cached_property
+    def nbytes(self):
+        return _dataframe_nbytes(self.df) + _dataframe_nbytes(self.view)
+
+class VehicleSnapshot:
+    """Uma versão da base pandas: segmento (última montagem completa) + sobreposição dos deltas seguintes
+    
+    Não é alterado depois de publicado. Quem lê o snapshot uma vez no início de uma busca
+    enxerga tabela, visão, índices e versão coerentes entre si, mesmo com um delta em curso.
+    A sobreposição traz as linhas atuais dos FipeIDs tocados por deltas (`overlay_df`), a
+    linha canônica dos que ainda existem (`overlay_view`, índice = posição) e o que elas
+    substituem no segmento (`replaced_rows`, `replaced_positions`).
+    """
+    
+    def __init__(self, segment, version):
+        self.segment = segment
+        self.version = version
+        self.overlay_df = segment.df.iloc[:0]
+        self.overlay_view = segment.view.iloc[:0]
+        self.touched = np.empty(0, dtype=np.int64)
+        self.replaced_rows = np.empty(0, dtype=np.int64)
+        self.replaced_positions = np.empty(0, dtype=np.int64)
+        # FipeIDs fora da visão do segmento e a posição que receberam (mantida após uma exclusão)
+        self.new_positions = {}
+        self.next_position = len(segment.view)
+    
+    @cached_property
+    def df(self):
+        """Tabela completa (montada sob demanda quando há deltas)"""
+        if not len(self.touched):
+            return self.segment.df
+        kept = np.ones(len(self.segment.df), dtype=bool)
+        kept[self.replaced_rows] = False
+        return _concat_rows([self.segment.df[kept], self.overlay_df], ignore_index=True)
+    
+    @cached_property
+    def view(self):
+        """Visão canônica das posições com FipeID existente (índice = posição; montada sob demanda quando há deltas)"""
+        if not len(self.touched) and self.segment.live is None:
+            return self.segment.view
+        patched = _patch_frame(self.segment.view, self.overlay_view.index.to_numpy(dtype=np.int64), self.overlay_view)
+        return patched.iloc[self.live_positions]
+    
+    @cached_property
+    def segment_positions(self):
+        """Posições do segmento com FipeID existente e não substituído por delta"""
+        if not len(self.replaced_positions):
+            return self.segment.live_positions
+        live = np.ones(len(self.segment.view), dtype=bool) if self.segment.live is None else self.segment.live.copy()
+        live[self.replaced_positions] = False
+        return np.flatnonzero(live)
+    
+    @cached_property
+    def live_positions(self):
+        return np.sort(np.concatenate([self.segment_positions, self.overlay_view.index.to_numpy(dtype=np.int64)]))
+    
+    @property
+    def is_empty(self):
+        return not len(self.segment_positions) and self.overlay_view.empty
+    
+    def positions_of(self, fipe_ids):
+        """Posição de cada FipeID na visão (-1 = ainda não recebeu posição nesta versão raiz)"""
+        positions = self.segment.positions.get_indexer(fipe_ids).astype(np.int64)
+        for index in np.flatnonzero(positions < 0):
+            positions[index] = self.new_positions.get(int(fipe_ids[index]), -1)
+        return positions
+    
+    @cached_property
+    def stats(self):
+        return _compute_base_stats(self.df)
+    
+    @cached_property
+    def model_years(self):
+        return _distinct_model_years(self.df)
+    
+    @cached_property
+    def autocomplete(self):
+        return AutocompleteIndex(self.view)
+    
+    @property
+    def facets(self):
+        return self.segment.facets
+    
+    @cached_property
+    def _overlay_facets(self):
+        return FacetIndex(self.overlay_df, self.overlay_view)
+    
+    @cached_property
+    def _segment_rows(self):
+        """Bitmap das linhas do segmento que continuam valendo (None = todas)"""
+        return self.segment.facets.without(self.replaced_rows) if len(self.replaced_rows) else None
+    
+    @cached_property
+    def facet_totals(self):
+        """Linhas por valor de cada faceta sem filtros: as do segmento, menos as substituídas, mais as da sobreposição"""
+        if not len(self.touched):
+            return self.segment.facet_totals
+        return _adjusted_counts(self.segment.facet_totals, self.segment.df.iloc[self.replaced_rows], self.overlay_df)
+    
+    @cached_property
+    def cube(self):
+        return AggregateCube(self.df, self.view)
+    
+    @cached_property
+    def bm25(self):
+        # Textos distintos de cada chave e quantas linhas existentes da visão têm cada um. Os
+        # textos começam pelas categorias do segmento, então o código de categoria de uma linha
+        # do segmento já é o id do seu texto
+        counts = {}
+        for col, _ in SEARCH_FIELD_WEIGHTS:
+            key = self.segment.view[search_key_column(col)]
+            categories = key.cat.categories
+            codes = key.cat.codes.to_numpy()[self.segment_positions]
+            overlay = pd.Series(np.asarray(self.overlay_view[search_key_column(col)], dtype=object)).value_counts()
+            texts = categories.append(pd.Index(overlay.index.difference(categories), dtype=object))
+            totals = np.zeros(len(texts), dtype=np.int64)
+            totals[:len(categories)] = np.bincount(codes, minlength=len(categories))
+            totals[texts.get_indexer(overlay.index)] += overlay.to_numpy()
+            counts[col] = pd.Series(totals, index=texts)
+        return BM25FIndex(counts)
+    
+    @cached_property
+    def _overlay_nbytes(self):
+        return _dataframe_nbytes(self.overlay_df) + _dataframe_nbytes(self.overlay_view)
+    
+    @property
+    def nbytes(self):
+        """Memória da base: segmento e sobreposição (medidos uma vez) e índices já construídos"""
+        materialized = sum(
+            _dataframe_nbytes(self.__dict__[name]) for name in ('df', 'view')
+            if name in self.__dict__ and self.__dict__[name] is not getattr(self.segment, name)
+        )
+        return (
+            self.segment.nbytes + self._overlay_nbytes + materialized + _built_nbytes(self.segment, ('facets',))
+            + _built_nbytes(self, ('autocomplete', '_overlay_facets', 'cube', 'bm25'))
         )
     
-    with col2:
-        # Filtro de ano (baseado nos dados reais)
-        if 'VehicleModelYear' in df.columns and not df.empty:
-            years_available = sorted(df['VehicleModelYear'].unique(), reverse=True)
-            year_filter = st.selectbox(
-                "📅 Filtrar por Ano:",
-                options=["Todos os anos"] + [str(year) for year in years_available],
-                help="Selecione um ano específico"
-            )
+    def facet_counts(self, filters=()):
+        """Quantidade de linhas (FipeID × ano) por valor de cada faceta
+
+        Colunas sem filtro nas demais usam os totais calculados uma vez por snapshot; só as
+        outras passam pelos bitmaps.
+        """
+        totals = self.facet_totals
+        filtered = [col for col in totals if any(other != col for other, _ in filters)]
+        if not filtered:
+            return totals
+        
+        counts = dict(totals)
+        if not len(self.touched):
+            counts.update(self.segment.facets.counts(filters, columns=filtered))
+            return counts
+        segment = self.segment.facets.counts(filters, self._segment_rows, filtered)
+        overlay = self._overlay_facets.counts(filters, columns=filtered)
+        # Valores sem nenhuma linha (todas substituídas por deltas) saem da lista, como no SQLite
+        for col in filtered:
+            counts[col] = {
+                value: segment.get(col, {}).get(value, 0) + overlay.get(col, {}).get(value, 0)
+                for value in totals[col]
+            }
+        return counts
+    
+    def rank(self, query, year_int, filters=()):
+        """Calcula as posições na visão canônica e os scores dos resultados de uma busca"""
+        no_results = (np.empty(0, dtype=np.int64), None)
+        if self.is_empty:
+            return no_results
+        
+        # Aplicar ano e filtros avançados primeiro (FipeIDs com alguma linha que atende a todos);
+        # posições do segmento e da sobreposição ficam separadas até o fim
+        view, overlay = self.segment.view, self.overlay_view
+        filters = _with_year_filter(filters, year_int)
+        if not filters:
+            segment_positions, overlay_positions = self.segment_positions, overlay.index.to_numpy(dtype=np.int64)
+        elif len(self.touched):
+            segment_positions = self.segment.facets.matching_positions(filters, self._segment_rows)
+            overlay_positions = self._overlay_facets.matching_positions(filters)
         else:
-            year_filter = st.selectbox(
-                "📅 Filtrar por Ano:",
-                options=["Todos os anos"],
-                disabled=True,
-                help="Filtro indisponível - dados não carregados"
+            segment_positions = self.segment.facets.matching_positions(filters)
+            overlay_positions = np.empty(0, dtype=np.int64)
+        positions = np.concatenate([segment_positions, overlay_positions])
+        
+        # Se não há query, retornar apenas os filtros
+        if not query:
+            if filters:
+                return np.sort(positions), None
+            else:
+                return no_results
+        
+        overlay_rows = overlay.index.get_indexer(overlay_positions)
+        
+        def values(col, selected=slice(None)):
+            """Coluna da visão para os candidatos (`selected` = máscara sobre `positions`)"""
+            segment_values = view[col].to_numpy()[segment_positions]
+            overlay_values = overlay[col].to_numpy()[overlay_rows]
+            if not isinstance(selected, slice):
+                segment_values = segment_values[selected[:len(segment_positions)]]
+                overlay_values = overlay_values[selected[len(segment_positions):]]
+            return np.concatenate([segment_values, overlay_values])
+        
+        # Busca por FIPE ID exato
+        if query.isdigit():
+            fipe_matches = positions[values('FipeID').astype(str) == query]
+            if len(fipe_matches):
+                return np.sort(fipe_matches), None
+        
+        # Candidatos: o termo aparece em alguma chave normalizada; a ordem vem do BM25F. O código
+        # de cada candidato é a posição do seu texto no BM25F (as categorias do segmento vêm primeiro)
+        bm25 = self.bm25
+        codes = {}
+        matched = np.zeros(len(positions), dtype=bool)
+        for col, _ in SEARCH_FIELD_WEIGHTS:
+            key = search_key_column(col)
+            codes[col] = np.concatenate([
+                view[key].cat.codes.to_numpy()[segment_positions].astype(np.int64),
+                bm25.texts[col].get_indexer(np.asarray(overlay[key], dtype=object)[overlay_rows]),
+            ])
+            contains = np.append(np.asarray(bm25.texts[col].str.contains(query, regex=False), dtype=bool), False)
+            matched |= contains[codes[col]]
+        codes = {col: col_codes[matched] for col, col_codes in codes.items()}
+        years = values('VehicleModelYear', matched) if 'VehicleModelYear' in view.columns else None
+        return _top_ranked(positions[matched], bm25.score(query, codes), years)
+    
+    def records(self, positions):
+        """Registros completos da visão canônica para as posições informadas"""
+        positions = np.asarray(positions, dtype=np.int64)
+        rows = self.overlay_view.index.get_indexer(positions)
+        if not (rows >= 0).any():
+            return self.segment.view.iloc[positions].to_dict('records')
+        segment_records = iter(self.segment.view.iloc[positions[rows < 0]].to_dict('records'))
+        overlay_records = iter(self.overlay_view.iloc[rows[rows >= 0]].to_dict('records'))
+        return [next(overlay_records) if row >= 0 else next(segment_records) for row in rows]
+    
+    def live_among(self, positions):
+        """Das posições informadas, as que têm veículo nesta versão (excluídos por delta saem), na mesma ordem"""
+        positions = np.asarray(positions, dtype=np.int64)
+        live = self.live_positions
+        if not len(live):
+            return positions[:0]
+        found = np.minimum(np.searchsorted(live, positions), len(live) - 1)
+        return positions[live[found] == positions]
+    
+    def compacted(self):
+        """Mesmo conteúdo, com a sobreposição incorporada a um segmento novo (posições e índices mantidos)"""
+        overlay_positions = self.overlay_view.index.to_numpy(dtype=np.int64)
+        view = _patch_frame(self.segment.view, overlay_positions, self.overlay_view)
+        # Posições reservadas de FipeIDs novos já excluídos guardam só o FipeID
+        reserved = {
+            fipe: position for fipe, position in self.new_positions.items()
+            if not _contains_sorted(overlay_positions, position)
+        }
+        if reserved:
+            view = _patch_frame(
+                view, np.fromiter(reserved.values(), dtype=np.int64, count=len(reserved)),
+                pd.DataFrame({'FipeID': list(reserved)})
             )
+        # Categorias das chaves na ordem dos textos do BM25F, que continua valendo
+        if 'bm25' in self.__dict__:
+            for col, _ in SEARCH_FIELD_WEIGHTS:
+                key = search_key_column(col)
+                view[key] = view[key].cat.set_categories(self.bm25.texts[col])
+        live = np.zeros(len(view), dtype=bool)
+        live[self.live_positions] = True
+        
+        segment = VehicleSegment(self.df, view, None if live.all() else live)
+        # Índices do segmento montados aqui, antes da publicação, e não na próxima busca
+        segment.__dict__.update(facet_totals=self.facet_totals, _sorted_keys=segment._sorted_keys)
+        if 'facets' in self.segment.__dict__:
+            _ = segment.facets
+        snapshot = VehicleSnapshot(segment, self.version)
+        for name in ('stats', 'model_years', 'autocomplete', 'cube', 'bm25'):
+            if name in self.__dict__:
+                setattr(snapshot, name, self.__dict__[name])
+        return snapshot
+
+class VehicleBase:
+    """Base de veículos em memória (pandas): tabela original e visão canônica por FipeID
     
-    with col3:
-        search_button = st.button("🔍 Buscar", type="primary")
+    Os dados ficam em `snapshot` (VehicleSnapshot); apply_delta monta o próximo e o publica
+    com uma única atribuição.
+    """
+    
+    def __init__(self, df, version, cleaning_report=None, journal_path=None):
+        self.snapshot = VehicleSnapshot(VehicleSegment(df, build_canonical_view(df)), version)
+        # Relatório de clean_vehicle_data (linhas descartadas, valores corrigidos)
+        self.cleaning_report = cleaning_report
+        # Diário (JSONL) onde cada delta é anotado antes de valer; None = deltas só em memória
+        self.journal_path = journal_path
+        self._deltas_applied = 0
+        self._delta_lock = threading.Lock()
     
-    # Remover upload - não será utilizado
-    uploaded_file = None
+    df = _snapshot_property('df')
+    view = _snapshot_property('view')
+    version = _snapshot_property('version')
+    is_empty = _snapshot_property('is_empty')
+    stats = _snapshot_property('stats')
+    model_years = _snapshot_property('model_years')
+    autocomplete = _snapshot_property('autocomplete')
+    facets = _snapshot_property('facets')
+    cube = _snapshot_property('cube')
+    bm25 = _snapshot_property('bm25')
+    nbytes = _snapshot_property('nbytes')
+    facet_counts = _snapshot_property('facet_counts')
+    rank = _snapshot_property('rank')
+    records = _snapshot_property('records')
+    live_among = _snapshot_property('live_among')
     
-    # Processar busca
-    if search_button or search_query or (year_filter and year_filter != "Todos os anos"):
-        with st.spinner("🔄 Buscando na base de dados..."):
-            results = search_vehicles(search_query, df, year_filter)
+    def apply_delta(self, delta, record=True):
+        """Aplica inclusões, alterações e exclusões sem reconstruir nem copiar a base
         
-        if results:
-            # Mostrar filtros aplicados
-            filters_applied = []
-            if search_query:
-                filters_applied.append(f"Termo: '{search_query}'")
-            if year_filter and year_filter != "Todos os anos":
-                filters_applied.append(f"Ano: {year_filter}")
+        Só os FipeIDs afetados são lidos e recalculados: as linhas atuais deles vão para a
+        sobreposição do novo snapshot, que compartilha o segmento (tabela, visão e facetas) com
+        o anterior. Cada FipeID mantém a sua posição na visão, mesmo depois de excluído; FipeIDs
+        novos recebem as próximas. Índices já construídos (autocompletar, cubo, BM25F) recebem
+        apenas as linhas trocadas. Quando a sobreposição passa de DELTA_OVERLAY_MAX_ROWS linhas,
+        ela é incorporada a um segmento novo (esse delta custa o tamanho da base). O novo
+        snapshot, com versão nova (que invalida as buscas em cache), só é publicado quando está
+        completo e, havendo diário, depois de o delta ser anotado nele (`record=False` na
+        reaplicação do próprio diário).
+        """
+        start = time.perf_counter()
+        with self._delta_lock:
+            current = self.snapshot
+            segment = current.segment
+            keys, upserts, ignored = prepare_delta(delta, list(segment.df.columns))
+            affected = np.unique(keys // 10000)
             
-            filter_text = " | ".join(filters_applied) if filters_applied else "Todos"
-            st.success(f"✅ Encontrados {len(results)} resultado(s) - Filtros: {filter_text}")
+            # Linhas atuais dos FipeIDs afetados: da sobreposição (já tocados por um delta) ou do segmento
+            from_segment = affected[~np.isin(affected, current.touched)]
+            segment_rows = segment.rows_of(from_segment)
+            in_overlay = _isin_keys(current.overlay_df['FipeID'].to_numpy(), affected)
+            old_rows = _concat_rows([segment.df.iloc[segment_rows], current.overlay_df[in_overlay]], ignore_index=True)
+            touched = _isin_keys(_row_keys(old_rows), keys)
+            removed_rows = old_rows[touched]
+            new_rows = _concat_rows([old_rows[~touched], upserts], ignore_index=True)
             
-            # Processar e exibir cada veículo
-            for vehicle in results:
-                # Card do veículo
-                st.markdown(f"""
-                <div class="vehicle-card">
-                    <h3>🚗 {vehicle.get('BrandName', 'N/A')} - {vehicle.get('VehicleName', 'N/A')}</h3>
-                    <p><strong>Ano:</strong> {vehicle.get('VehicleModelYear', 'N/A')} | 
-                       <strong>FIPE:</strong> {vehicle.get('FipeID', 'N/A')} | 
-                       <strong>ADAS:</strong> {'✅' if vehicle.get('ADAS') == 'Sim' else '❌'} |
-                       <strong>Opcional Parabrisa:</strong> {'✅ SIM' if vehicle.get('Opcional Parabrisa') == 'Sim' else '❌ NÃO' if vehicle.get('Opcional Parabrisa') == 'Não' else '❓ N/A'}</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Detalhes ADAS se disponível
-                if vehicle.get('ADAS') == 'Sim':
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write("**🎯 Características ADAS:**")
-                        
-                        # ADAS no Parabrisa com link integrado
-                        parabrisa_value = vehicle.get('ADAS no Parabrisa', 'N/A')
-                        icon_parabrisa = "✅" if parabrisa_value == "Sim" else "❌" if parabrisa_value == "Não" else "❓"
-                        
-                        col_char1, col_link1 = st.columns([2, 1])
-                        with col_char1:
-                            st.write(f"• ADAS no Parabrisa: {icon_parabrisa}")
-                        
-                        # Link para calibração da câmera frontal
-                        if parabrisa_value == "Sim":
-                            camera_link = get_specific_calibration_link(vehicle.get('BrandName', ''), 'camera_frontal')
-                            if camera_link:
-                                with col_link1:
-                                    st.markdown(f"""
-                                    <a href="{camera_link['link']}" target="_blank">
-                                        <button style="
-                                            background: linear-gradient(90deg, #28a745, #20c997);
-                                            color: white;
-                                            border: none;
-                                            padding: 4px 8px;
-                                            border-radius: 3px;
-                                            cursor: pointer;
-                                            font-size: 10px;
-                                            font-weight: bold;
-                                            width: 100%;
-                                        ">
-                                            📄 Câmera Frontal
-                                        </button>
-                                    </a>
-                                    """, unsafe_allow_html=True)
-                        
-                        # ADAS no Parachoque com link integrado
-                        parachoque_value = vehicle.get('Adas no Parachoque', 'N/A')
-                        icon_parachoque = "✅" if parachoque_value == "Sim" else "❌" if parachoque_value == "Não" else "❓"
-                        
-                        col_char2, col_link2 = st.columns([2, 1])
-                        with col_char2:
-                            st.write(f"• ADAS no Parachoque: {icon_parachoque}")
-                        
-                        # Link para calibração do radar frontal
-                        if parachoque_value == "Sim":
-                            radar_link = get_specific_calibration_link(vehicle.get('BrandName', ''), 'radar_frontal')
-                            if radar_link:
-                                with col_link2:
-                                    st.markdown(f"""
-                                    <a href="{radar_link['link']}" target="_blank">
-                                        <button style="
-                                            background: linear-gradient(90deg, #dc3545, #e74c3c);
-                                            color: white;
-                                            border: none;
-                                            padding: 4px 8px;
-                                            border-radius: 3px;
-                                            cursor: pointer;
-                                            font-size: 10px;
-                                            font-weight: bold;
-                                            width: 100%;
-                                        ">
-                                            📡 Radar Frontal
-                                        </button>
-                                    </a>
-                                    """, unsafe_allow_html=True)
-                        
-                        # Câmera Retrovisor com link integrado
-                        retrovisor_value = vehicle.get('Camera no Retrovisor', 'N/A')
-                        icon_retrovisor = "✅" if retrovisor_value == "Sim" else "❌" if retrovisor_value == "Não" else "❓"
-                        
-                        col_char3, col_link3 = st.columns([2, 1])
-                        with col_char3:
-                            st.write(f"• Câmera Retrovisor: {icon_retrovisor}")
-                        
-                        # Link para calibração da câmera traseira
-                        if retrovisor_value == "Sim":
-                            camera_tras_link = get_specific_calibration_link(vehicle.get('BrandName', ''), 'camera_traseira')
-                            if camera_tras_link:
-                                with col_link3:
-                                    st.markdown(f"""
-                                    <a href="{camera_tras_link['link']}" target="_blank">
-                                        <button style="
-                                            background: linear-gradient(90deg, #6f42c1, #8e44ad);
-                                            color: white;
-                                            border: none;
-                                            padding: 4px 8px;
-                                            border-radius: 3px;
-                                            cursor: pointer;
-                                            font-size: 10px;
-                                            font-weight: bold;
-                                            width: 100%;
-                                        ">
-                                            📹 Câm. Traseira
-                                        </button>
-                                    </a>
-                                    """, unsafe_allow_html=True)
-                        
-                        # Faróis Matrix
-                        matrix_value = vehicle.get('Faróis Matrix', 'N/A')
-                        icon_matrix = "✅" if matrix_value == "Sim" else "❌" if matrix_value == "Não" else "❓"
-                        st.write(f"• Faróis Matrix: {icon_matrix}")
-                        
-                        # Links especiais para Audi e Volkswagen (câmera 360)
-                        brand_name = vehicle.get('BrandName', '').upper()
-                        if brand_name in ['AUDI', 'VOLKSWAGEN']:
-                            # Câmera 360
-                            camera_360_link = get_specific_calibration_link(brand_name, 'camera_360')
-                            if camera_360_link:
-                                col_360_1, col_360_2 = st.columns([2, 1])
-                                with col_360_1:
-                                    st.write("• Câmera 360°: ✅")
-                                with col_360_2:
-                                    st.markdown(f"""
-                                    <a href="{camera_360_link['link']}" target="_blank">
-                                        <button style="
-                                            background: linear-gradient(90deg, #17a2b8, #138496);
-                                            color: white;
-                                            border: none;
-                                            padding: 4px 8px;
-                                            border-radius: 3px;
-                                            cursor: pointer;
-                                            font-size: 10px;
-                                            font-weight: bold;
-                                            width: 100%;
-                                        ">
-                                            🔄 Câm. 360°
-                                        </button>
-                                    </a>
-                                    """, unsafe_allow_html=True)
-                        
-                        # Lidar especial para Audi
-                        if brand_name == 'AUDI':
-                            lidar_link = get_specific_calibration_link(brand_name, 'lidar')
-                            if lidar_link:
-                                col_lidar_1, col_lidar_2 = st.columns([2, 1])
-                                with col_lidar_1:
-                                    st.write("• Sistema Lidar: ✅")
-                                with col_lidar_2:
-                                    st.markdown(f"""
-                                    <a href="{lidar_link['link']}" target="_blank">
-                                        <button style="
-                                            background: linear-gradient(90deg, #fd7e14, #e55d00);
-                                            color: white;
-                                            border: none;
-                                            padding: 4px 8px;
-                                            border-radius: 3px;
-                                            cursor: pointer;
-                                            font-size: 10px;
-                                            font-weight: bold;
-                                            width: 100%;
-                                        ">
-                                            🌊 Lidar
-                                        </button>
-                                    </a>
-                                    """, unsafe_allow_html=True)
-                    
-                    with col2:
-                        st.write("**⚙️ Informações Técnicas:**")
-                        if vehicle.get('Tipo de Regulagem'):
-                            st.write(f"• **Tipo de Calibração:** {vehicle['Tipo de Regulagem']}")
-                        if vehicle.get('Abreviação de descrição'):
-                            st.write(f"• **Modelo:** {vehicle['Abreviação de descrição']}")
-                    
-                    # Aviso sobre piloto e links disponíveis
-                    brand_name = vehicle.get('BrandName', '')
-                    pilot_brands = [
-                        'ALFA ROMEO', 'AUDI', 'BENTLEY', 'BMW', 'MINI', 'MERCEDES', 'MERCEDES-BENZ',
-                        'CITROEN', 'CUPRA', 'DAIHATSU', 'FIAT', 'JEEP', 'FORD', 'HONDA', 'HYUNDAI',
-                        'IVECO', 'KIA', 'LAMBORGHINI', 'LEXUS', 'TOYOTA', 'VOLKSWAGEN', 'RENAULT',
-                        'PEUGEOT', 'NISSAN', 'OPEL', 'CHEVROLET', 'VOLVO', 'SUBARU', 'PORSCHE'
-                    ]
-                    
-                    if brand_name.upper() in pilot_brands:
-                        st.success(f"""
-                        🎯 **{brand_name} - Piloto Ativo:** Links específicos de calibração integrados acima conforme características detectadas
-                        """)
-                    else:
-                        st.info(f"""
-                        📚 **{brand_name}:** Consulte documentação geral - https://help.boschdiagnostics.com/DAS3000/
-                        """)
-                    
-                    st.markdown("""
-                    **⚠️ Importante:**
-                    • Use apenas equipamento certificado (DAS 3000, VCDS, ODIS)
-                    • Sempre siga as instruções do PDF específico
-                    • Verifique compatibilidade antes de iniciar
-                    """)
-                
-                st.markdown("---")
+            # Linha canônica recalculada só para os FipeIDs afetados, na posição que já tinham
+            segment_positions = segment.positions.get_indexer(from_segment)
+            segment_positions = segment_positions[segment_positions >= 0]
+            live_positions = segment_positions if segment.live is None else segment_positions[segment.live[segment_positions]]
+            in_overlay_view = _isin_keys(current.overlay_view['FipeID'].to_numpy(), affected)
+            removed_view = _concat_rows([segment.view.iloc[live_positions], current.overlay_view[in_overlay_view]])
+            added_view = build_canonical_view(new_rows)
+            fipes = added_view['FipeID'].to_numpy(dtype=np.int64)
+            positions = current.positions_of(fipes)
+            new_fipes = positions < 0
+            positions[new_fipes] = current.next_position + np.arange(new_fipes.sum())
+            added_view.index = positions
+            
+            snapshot = VehicleSnapshot(segment, f"{dataset_root_version(current.version)}#delta{self._deltas_applied + 1}")
+            snapshot.overlay_df = _concat_rows([current.overlay_df[~in_overlay], new_rows], ignore_index=True)
+            snapshot.overlay_view = _concat_rows([current.overlay_view[~in_overlay_view], added_view]).sort_index()
+            _hashed(snapshot.overlay_view.index)
+            snapshot.touched = np.union1d(current.touched, affected)
+            snapshot.replaced_rows = np.union1d(current.replaced_rows, segment_rows)
+            snapshot.replaced_positions = np.union1d(current.replaced_positions, segment_positions)
+            snapshot.new_positions = dict(current.new_positions)
+            snapshot.new_positions.update(zip(fipes[new_fipes].tolist(), positions[new_fipes].tolist()))
+            snapshot.next_position = current.next_position + int(new_fipes.sum())
+            
+            # Índices já construídos recebem só as linhas trocadas
+            if 'autocomplete' in current.__dict__:
+                snapshot.autocomplete = current.autocomplete.with_delta(removed_view, added_view)
+            if 'cube' in current.__dict__:
+                snapshot.cube = current.cube.with_delta(removed_rows, upserts, removed_view, added_view)
+            if 'bm25' in current.__dict__:
+                snapshot.bm25 = current.bm25.with_delta(removed_view, added_view)
+            if 'model_years' in current.__dict__ or 'stats' in current.__dict__:
+                totals = snapshot.facet_totals = _adjusted_counts(current.facet_totals, old_rows, new_rows)
+                snapshot.model_years = sorted((int(year) for year in totals.get('VehicleModelYear', {})), reverse=True)
+                if 'stats' in current.__dict__:
+                    brands = len(totals['BrandName']) if 'BrandName' in totals else None
+                    snapshot.stats = _delta_stats(current.stats, old_rows, new_rows, brands, snapshot.model_years)
+            
+            if len(snapshot.overlay_df) > DELTA_OVERLAY_MAX_ROWS:
+                snapshot = snapshot.compacted()
+            if record and self.journal_path is not None:
+                self._record_delta(dataset_root_version(current.version), delta)
+            self._deltas_applied += 1
+            self.snapshot = snapshot
+        
+        existing = _isin_keys(_row_keys(upserts), _row_keys(old_rows))
+        return {
+            'inserted': int((~existing).sum()),
+            'updated': int(existing.sum()),
+            'deleted': int(touched.sum() - existing.sum()),
+            'ignored': ignored,
+            'seconds': time.perf_counter() - start,
+        }
+    
+    def _record_delta(self, root_version, delta):
+        """Anota o delta no diário; se a gravação falha, o delta não é publicado"""
+        rows = delta.astype(object).where(delta.notna(), None).to_dict('records')
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'base': root_version, 'rows': rows}, ensure_ascii=False, default=str) + '\n')
+    
+    def replay_journal(self):
+        """Reaplica os deltas do diário anotados para esta versão raiz; retorna quantos
+
+        Anotações de outra versão raiz (a base de origem mudou, como no SQLite) saem do diário.
+        """
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                lines = [line for line in f if line.strip()]
+        except FileNotFoundError:
+            return 0
+        
+        root = dataset_root_version(self.version)
+        entries = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Linha cortada (processo interrompido durante a gravação): esse delta não valeu
+                logger.warning("Linha inválida no diário de deltas %s", self.journal_path)
+                continue
+            if entry.get('base') == root:
+                entries.append((line, entry))
+        if len(entries) < len(lines):
+            temporary = f"{self.journal_path}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.writelines(line for line, _ in entries)
+            os.replace(temporary, self.journal_path)
         
+        for _, entry in entries:
+            self.apply_delta(pd.DataFrame(entry['rows']), record=False)
+        return len(entries)
+
+# Backend de armazenamento: 'pandas' (em memória) ou 'sqlite' (arquivo com índice FTS5)
+STORAGE_BACKEND = os.environ.get('ADAS_STORAGE', 'pandas')
+SQLITE_PATH = os.environ.get('ADAS_SQLITE_PATH', 'processed_data.sqlite')
+# Diário dos deltas aplicados à base local no backend pandas (o SQLite grava no próprio arquivo)
+DELTA_JOURNAL_PATH = os.environ.get('ADAS_DELTA_JOURNAL_PATH', 'processed_data.deltas.jsonl')
+# Conexões somente leitura ociosas guardadas por base (cada rerun roda numa thread nova)
+SQLITE_POOL_SIZE = int(os.environ.get('ADAS_SQLITE_POOL', '4'))
+
+def _sql_name(column):
+    return '"' + column.replace('"', '""') + '"'
+
+def _encode_view_for_sqlite(view):
+    """Anos-modelo e diferenças por ano da visão canônica em JSON (colunas TEXT)"""
+    if 'ModelYears' in view.columns:
+        view['ModelYears'] = [json.dumps(years.tolist()) for years in view['ModelYears']]
+        view['YearFlags'] = [
+            json.dumps({str(year): values for year, values in flags.items()}, ensure_ascii=False) if flags else None
+            for flags in view['YearFlags']
+        ]
+    return view
+
+def _sql_rows(frame):
+    """Linhas de um DataFrame como tuplas de tipos Python (NaN vira NULL)"""
+    return list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+def build_sqlite_base(df, path, version, cleaning_report=None):
+    """Grava a base em um arquivo SQLite com visão canônica, índice FTS5 e índices B-tree"""
+    view = _encode_view_for_sqlite(build_canonical_view(df))
+    
+    # Grava em arquivo temporário e troca no final: leitores nunca veem a base pela metade
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.sqlite')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(temp_path)
+        with conn:
+            df.to_sql('vehicles', conn, index=False, chunksize=50000)
+            view.to_sql('vehicle_view', conn, index=True, index_label='pos', chunksize=50000)
+            
+            if 'FipeID' in df.columns:
+                conn.execute('CREATE INDEX idx_vehicle_view_fipe ON vehicle_view ("FipeID")')
+                conn.execute('CREATE INDEX idx_vehicles_fipe ON vehicles ("FipeID")')
+                if 'VehicleModelYear' in df.columns:
+                    conn.execute('CREATE INDEX idx_vehicles_year ON vehicles ("VehicleModelYear", "FipeID")')
+            
+            # Trigramas sobre as chaves normalizadas acham um trecho em qualquer posição, como o `in` do pandas
+            keys = [_sql_name(search_key_column(col)) for col, _ in SEARCH_FIELD_WEIGHTS]
+            conn.execute(
+                "CREATE VIRTUAL TABLE vehicle_fts USING fts5("
+                "brand, name, abbreviation, fipe, content='', tokenize='trigram')"
+            )
+            conn.execute(
+                f"INSERT INTO vehicle_fts (rowid, brand, name, abbreviation, fipe) "
+                f"SELECT pos, {', '.join(keys)} FROM vehicle_view"
+            )
+            
+            # Posição de cada FipeID na visão; continua registrada depois de uma exclusão por delta
+            conn.execute('CREATE TABLE vehicle_positions ("FipeID" INTEGER PRIMARY KEY, pos INTEGER NOT NULL)')
+            if 'FipeID' in view.columns:
+                conn.execute('INSERT INTO vehicle_positions SELECT "FipeID", pos FROM vehicle_view')
+            
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', version),
+                ('stats', json.dumps(_compute_base_stats(df))),
+                ('model_years', json.dumps(_distinct_model_years(df))),
+                ('view_columns', json.dumps(list(view.columns), ensure_ascii=False)),
+                ('cleaning_report', json.dumps(cleaning_report, ensure_ascii=False)),
+            ])
+        conn.close()
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class SQLiteSnapshot:
+    """Estado em memória de uma versão da base SQLite: estatísticas, contagens e índices
+
+    Como o VehicleSnapshot, não é alterado depois de publicado. Os índices são carregados do
+    arquivo sob demanda.
+    """
+    
+    def __init__(self, base, version, stats, model_years, total):
+        self._base = base
+        self.version = version
+        self.stats = stats
+        self.model_years = model_years
+        self.total = total
+    
+    @property
+    def is_empty(self):
+        return self.total == 0
+    
+    @property
+    def nbytes(self):
+        # Os dados ficam no arquivo; em memória só metadados, o cache de páginas do SQLite
+        # e o que já foi carregado sob demanda
+        return 64 * 1024 + _built_nbytes(self, ('autocomplete', 'cube', 'bm25', 'facet_combinations'))
+    
+    @cached_property
+    def autocomplete(self):
+        columns = [_sql_name(col) for col in AUTOCOMPLETE_FIELDS if col in self._base._view_columns]
+        if not columns:
+            return AutocompleteIndex(pd.DataFrame())
+        with self._base._connection() as conn:
+            return AutocompleteIndex(pd.read_sql(f"SELECT {', '.join(columns)} FROM vehicle_view", conn))
+    
+    @cached_property
+    def cube(self):
+        columns = lambda available: ', '.join(_sql_name(col) for col in CUBE_SOURCE_COLUMNS if col in available)
+        with self._base._connection() as conn:
+            return AggregateCube(
+                pd.read_sql(f"SELECT {columns(self._base._columns)} FROM vehicles", conn),
+                pd.read_sql(f"SELECT {columns(self._base._view_columns)} FROM vehicle_view", conn)
+            )
+    
+    @cached_property
+    def bm25(self):
+        # Mesmas estatísticas do backend pandas, a partir das linhas por texto distinto de cada chave
+        counts = {}
+        with self._base._connection() as conn:
+            for col, _ in SEARCH_FIELD_WEIGHTS:
+                key = _sql_name(search_key_column(col))
+                rows = conn.execute(f"SELECT {key}, COUNT(*) FROM vehicle_view GROUP BY {key}").fetchall()
+                counts[col] = pd.Series([count for _, count in rows], index=[text for text, _ in rows], dtype='int64')
+        return BM25FIndex(counts)
+    
+    @cached_property
+    def facet_combinations(self):
+        """Linhas agrupadas por combinação de valores das facetas (bem menor que a tabela)"""
+        columns = [_sql_name(col) for col in FACET_COLUMNS if col in self._base._columns]
+        if not columns:
+            return pd.DataFrame({'rows': []})
+        with self._base._connection() as conn:
+            return pd.read_sql(
+                f"SELECT {', '.join(columns)}, COUNT(*) AS rows FROM vehicles GROUP BY {', '.join(columns)}", conn
+            )
+    
+    def facet_counts(self, filters=()):
+        """Quantidade de linhas (FipeID × ano) por valor de cada faceta"""
+        combinations = self.facet_combinations
+        counts = {}
+        for col in FACET_COLUMNS:
+            if col not in combinations.columns:
+                continue
+            selected = np.ones(len(combinations), dtype=bool)
+            for other, values in filters:
+                if other != col:
+                    selected &= combinations[other].isin(values).to_numpy() if other in combinations.columns else False
+            totals = combinations['rows'].where(selected, 0).groupby(combinations[col]).sum()
+            counts[col] = {value: int(count) for value, count in totals.items()}
+        return counts
+    
+    def rank(self, query, year_int, filters=()):
+        """Calcula as posições na visão canônica e os scores dos resultados de uma busca"""
+        with self._base._connection() as conn:
+            return self._rank(conn, query, year_int, filters)
+    
+    def _rank(self, conn, query, year_int, filters):
+        no_results = (np.empty(0, dtype=np.int64), None)
+        if self.total == 0:
+            return no_results
+        
+        # Ano e filtros avançados na mesma linha da tabela original, como os bitmaps do pandas
+        where, params = [], []
+        filters = _with_year_filter(filters, year_int)
+        if filters:
+            clauses, params = self._base._facet_where(filters)
+            where.append(f'"FipeID" IN (SELECT "FipeID" FROM vehicles WHERE {" AND ".join(clauses)})')
+        
+        if not query:
+            if filters:
+                rows = conn.execute(
+                    f"SELECT pos FROM vehicle_view WHERE {' AND '.join(where)} ORDER BY pos", params
+                ).fetchall()
+                return np.array([row[0] for row in rows], dtype=np.int64), None
+            return no_results
+        
+        # Busca por FIPE ID exato (mesma comparação textual do pandas)
+        if query.isdigit():
+            rows = conn.execute(
+                'SELECT pos FROM vehicle_view WHERE "FipeID" = ? AND CAST("FipeID" AS TEXT) = ?'
+                + ''.join(f" AND {clause}" for clause in where) + " ORDER BY pos",
+                [int(query), query] + params
+            ).fetchall()
+            if rows:
+                return np.array([row[0] for row in rows], dtype=np.int64), None
+        
+        # Candidatos pelo FTS5 (trigramas exigem 3+ caracteres; abaixo disso, varredura)
+        keys = [_sql_name(search_key_column(col)) for col, _ in SEARCH_FIELD_WEIGHTS]
+        year = '"VehicleModelYear"' if 'VehicleModelYear' in self._base._view_columns else '0'
+        sql = f'SELECT pos, {year}, {", ".join(keys)} FROM vehicle_view'
+        if len(query) >= 3:
+            where.insert(0, 'pos IN (SELECT rowid FROM vehicle_fts WHERE vehicle_fts MATCH ?)')
+            params.insert(0, '"' + query.replace('"', '""') + '"')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        
+        rows = [row for row in conn.execute(sql, params) if _matches_vehicle_fields(query, row[2:])]
+        texts = self.bm25.texts
+        codes = {
+            col: texts[col].get_indexer([row[2 + index] for row in rows])
+            for index, (col, _) in enumerate(SEARCH_FIELD_WEIGHTS)
+        }
+        return _top_ranked([row[0] for row in rows], self.bm25.score(query, codes), [row[1] or 0 for row in rows])
+
+class SQLiteVehicleBase:
+    """Base de veículos em arquivo SQLite: mesma interface e mesmos resultados do backend pandas
+
+    O que fica em memória (versão, estatísticas, índices carregados) está em `snapshot`
+    (SQLiteSnapshot); apply_delta grava o arquivo e depois publica o próximo com uma única
+    atribuição.
+    """
+    
+    def __init__(self, path, version):
+        self.path = path
+        self._pool = queue.Queue(maxsize=SQLITE_POOL_SIZE)
+        
+        with self._connection() as conn:
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+            self._view_columns = json.loads(meta['view_columns'])
+            self.cleaning_report = json.loads(meta.get('cleaning_report', 'null'))
+            self._columns = [row[1] for row in conn.execute('PRAGMA table_info(vehicles)')]
+            total = conn.execute('SELECT COUNT(*) FROM vehicle_view').fetchone()[0]
+        self.snapshot = SQLiteSnapshot(
+            self, version, json.loads(meta['stats']), json.loads(meta['model_years']), total
+        )
+        # Um arquivo reaberto continua a numeração dos deltas já gravados nele
+        self._deltas_applied = int(version.partition('#delta')[2] or 0)
+        self._delta_lock = threading.Lock()
+    
+    version = _snapshot_property('version')
+    is_empty = _snapshot_property('is_empty')
+    stats = _snapshot_property('stats')
+    model_years = _snapshot_property('model_years')
+    autocomplete = _snapshot_property('autocomplete')
+    cube = _snapshot_property('cube')
+    bm25 = _snapshot_property('bm25')
+    nbytes = _snapshot_property('nbytes')
+    facet_counts = _snapshot_property('facet_counts')
+    rank = _snapshot_property('rank')
+    
+    @staticmethod
+    def stored_version(path):
+        """Versão da base gravada no arquivo (None se não existe, está incompleto ou é de um formato antigo)"""
+        if not os.path.exists(path):
+            return None
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                conn.execute('SELECT 1 FROM vehicle_positions LIMIT 1')
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+    
+    @contextmanager
+    def _connection(self):
+        """Conexão somente leitura emprestada do pool; aberta na hora se todas estão em uso
+
+        Ao devolver, fica no pool até SQLITE_POOL_SIZE conexões ociosas; as excedentes são fechadas.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute('PRAGMA mmap_size = 268435456')
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    @staticmethod
+    def _decode_years(value):
+        return np.array(json.loads(value), dtype='int16')
+    
+    @staticmethod
+    def _decode_year_flags(value):
+        return {int(year): flags for year, flags in json.loads(value).items()} if value else None
+    
+    def _facet_where(self, filters):
+        """Condição SQL equivalente ao FacetIndex.match sobre a tabela original"""
+        clauses, params = [], []
+        for col, values in filters:
+            if col not in self._columns or not values:
+                return ['0'], []
+            clauses.append(f"{_sql_name(col)} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        return clauses, params
+    
+    def records(self, positions):
+        """Registros completos da visão canônica para as posições informadas"""
+        if len(positions) == 0:
+            return []
+        positions = [int(position) for position in positions]
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"SELECT * FROM vehicle_view WHERE pos IN ({', '.join('?' * len(positions))})", positions
+            )
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        by_position = {}
+        for row in rows:
+            record = dict(zip(columns, row))
+            position = record.pop('pos')
+            if 'ModelYears' in record:
+                record['ModelYears'] = self._decode_years(record['ModelYears'])
+                record['YearFlags'] = self._decode_year_flags(record['YearFlags'])
+            by_position[position] = record
+        return [by_position[position] for position in positions]
+    
+    def live_among(self, positions):
+        """Das posições informadas, as que têm veículo nesta versão (excluídos por delta saem), na mesma ordem"""
+        positions = [int(position) for position in positions]
+        if not positions:
+            return np.empty(0, dtype=np.int64)
+        with self._connection() as conn:
+            live = {
+                position for position, in conn.execute(
+                    f"SELECT pos FROM vehicle_view WHERE pos IN ({', '.join('?' * len(positions))})", positions
+                )
+            }
+        return np.array([position for position in positions if position in live], dtype=np.int64)
+    
+    def _rows_of_fipes(self, conn, table, fipe_ids):
+        """Linhas de uma tabela para os FipeIDs informados (pelo índice de FipeID)"""
+        frames = [
+            pd.read_sql(
+                f'SELECT * FROM {table} WHERE "FipeID" IN ({", ".join("?" * len(chunk))})', conn, params=chunk
+            )
+            for chunk in (fipe_ids[i:i + 500] for i in range(0, len(fipe_ids), 500))
+        ]
+        return pd.concat(frames, ignore_index=True) if frames else pd.read_sql(f'SELECT * FROM {table} LIMIT 0', conn)
+    
+    def apply_delta(self, delta):
+        """Aplica inclusões, alterações e exclusões no arquivo, em uma única transação
+
+        Mesmo comportamento do backend pandas: só as linhas e a visão canônica dos FipeIDs
+        afetados são regravadas (nas mesmas posições; novos FipeIDs no fim), e no FTS5 as
+        entradas antigas desses FipeIDs saem e as novas entram. A versão gravada ganha o
+        sufixo do delta, e o arquivo continua valendo ao reabrir enquanto a base de origem
+        não muda.
+        """
+        start = time.perf_counter()
+        with self._delta_lock:
+            current = self.snapshot
+            keys, upserts, ignored = prepare_delta(delta, self._columns)
+            affected = np.unique(keys // 10000).tolist()
+            # Lido antes da transação: a consulta usa outra conexão, que ficaria bloqueada pela escrita
+            old_combinations = current.facet_combinations
+            conn = sqlite3.connect(self.path)
+            try:
+                with conn:
+                    old_rows = self._rows_of_fipes(conn, 'vehicles', affected)
+                    touched = _isin_keys(_row_keys(old_rows), keys)
+                    removed_rows = old_rows[touched]
+                    new_rows = pd.concat([old_rows[~touched], upserts], ignore_index=True)
+                    
+                    old_view = self._rows_of_fipes(conn, 'vehicle_view', affected).set_index('pos')
+                    old_view.index.name = None
+                    added_view = build_canonical_view(new_rows)
+                    
+                    # Mesma regra do pandas: um FipeID volta à posição que já teve (mesmo se foi
+                    # excluído antes); FipeIDs inéditos ganham as próximas posições
+                    fipes = added_view['FipeID'].tolist()
+                    known = {}
+                    for chunk in (fipes[i:i + 500] for i in range(0, len(fipes), 500)):
+                        known.update(conn.execute(
+                            f'SELECT "FipeID", pos FROM vehicle_positions WHERE "FipeID" IN ({", ".join("?" * len(chunk))})',
+                            chunk
+                        ))
+                    positions = np.array([known.get(fipe, -1) for fipe in fipes], dtype=np.int64)
+                    new_fipes = positions < 0
+                    next_position = conn.execute('SELECT COALESCE(MAX(pos), -1) + 1 FROM vehicle_positions').fetchone()[0]
+                    positions[new_fipes] = next_position + np.arange(new_fipes.sum())
+                    added_view.index = positions
+                    conn.executemany('INSERT INTO vehicle_positions VALUES (?, ?)', [
+                        (fipe, position) for fipe, position in zip(fipes, positions.tolist()) if fipe not in known
+                    ])
+                    
+                    conn.executemany(
+                        'DELETE FROM vehicles WHERE "FipeID" = ? AND "VehicleModelYear" = ?',
+                        _sql_rows(removed_rows[['FipeID', 'VehicleModelYear']])
+                    )
+                    conn.executemany(
+                        f"INSERT INTO vehicles ({', '.join(_sql_name(col) for col in self._columns)}) "
+                        f"VALUES ({', '.join('?' * len(self._columns))})",
+                        _sql_rows(upserts[self._columns])
+                    )
+                    # FTS5 sem conteúdo próprio: a exclusão repete os valores indexados, lidos da visão
+                    keys_sql = [_sql_name(search_key_column(col)) for col, _ in SEARCH_FIELD_WEIGHTS]
+                    for chunk in (affected[i:i + 500] for i in range(0, len(affected), 500)):
+                        conn.execute(
+                            f"INSERT INTO vehicle_fts (vehicle_fts, rowid, brand, name, abbreviation, fipe) "
+                            f"SELECT 'delete', pos, {', '.join(keys_sql)} FROM vehicle_view "
+                            f'WHERE "FipeID" IN ({", ".join("?" * len(chunk))})',
+                            chunk
+                        )
+                    conn.executemany('DELETE FROM vehicle_view WHERE "FipeID" = ?', [(fipe,) for fipe in affected])
+                    encoded = _encode_view_for_sqlite(added_view.copy()).reindex(columns=self._view_columns)
+                    encoded.insert(0, 'pos', positions)
+                    conn.executemany(
+                        f"INSERT INTO vehicle_view ({', '.join(_sql_name(col) for col in encoded.columns)}) "
+                        f"VALUES ({', '.join('?' * len(encoded.columns))})",
+                        _sql_rows(encoded)
+                    )
+                    for chunk in (positions[i:i + 500].tolist() for i in range(0, len(positions), 500)):
+                        conn.execute(
+                            f"INSERT INTO vehicle_fts (rowid, brand, name, abbreviation, fipe) "
+                            f"SELECT pos, {', '.join(keys_sql)} FROM vehicle_view WHERE pos IN ({', '.join('?' * len(chunk))})",
+                            chunk
+                        )
+                    
+                    combinations = self._patched_facet_combinations(old_combinations, removed_rows, upserts)
+                    model_years = current.model_years
+                    if 'VehicleModelYear' in combinations.columns:
+                        model_years = sorted(
+                            (int(year) for year in combinations['VehicleModelYear'].dropna().unique()), reverse=True
+                        )
+                    brands = int(combinations['BrandName'].nunique()) if 'BrandName' in combinations.columns else None
+                    stats = _delta_stats(current.stats, old_rows, new_rows, brands, model_years)
+                    version = f"{dataset_root_version(current.version)}#delta{self._deltas_applied + 1}"
+                    conn.executemany('UPDATE meta SET value = ? WHERE key = ?', [
+                        (version, 'version'),
+                        (json.dumps(stats), 'stats'),
+                        (json.dumps(model_years), 'model_years'),
+                    ])
+            finally:
+                conn.close()
+            
+            # Gravado no arquivo: agora o estado em memória acompanha (tabelas são relidas sob demanda)
+            snapshot = SQLiteSnapshot(
+                self, version, stats, model_years, current.total + len(added_view) - len(old_view)
+            )
+            snapshot.facet_combinations = combinations
+            if 'autocomplete' in current.__dict__:
+                snapshot.autocomplete = current.autocomplete.with_delta(old_view, added_view)
+            if 'cube' in current.__dict__:
+                snapshot.cube = current.cube.with_delta(removed_rows, upserts, old_view, added_view)
+            if 'bm25' in current.__dict__:
+                snapshot.bm25 = current.bm25.with_delta(old_view, added_view)
+            self._deltas_applied += 1
+            self.snapshot = snapshot
+        
+        inserted = int((~_isin_keys(_row_keys(upserts), _row_keys(old_rows))).sum())
+        return {
+            'inserted': inserted,
+            'updated': len(upserts) - inserted,
+            'deleted': int(touched.sum()) - (len(upserts) - inserted),
+            'ignored': ignored,
+            'seconds': time.perf_counter() - start,
+        }
+    
+    @staticmethod
+    def _patched_facet_combinations(combinations, removed_rows, added_rows):
+        """Contagens por combinação de facetas ajustadas pelas linhas removidas e incluídas"""
+        columns = [col for col in combinations.columns if col != 'rows']
+        if not columns:
+            return combinations
+        changes = pd.concat([
+            combinations,
+            removed_rows[columns].assign(rows=-1),
+            added_rows[columns].assign(rows=1),
+        ], ignore_index=True)
+        combinations = changes.groupby(columns, dropna=False, sort=False)['rows'].sum().reset_index()
+        return combinations[combinations['rows'] != 0].reset_index(drop=True)
+
+# Limites do cache de bases carregadas, locais e enviadas (compartilhado entre sessões);
+# ADAS_UPLOAD_CACHE_MB é o nome antigo da variável, aceito enquanto houver instalações com ele
+DATASET_CACHE_MAX_BYTES = int(
+    os.environ.get('ADAS_DATASET_CACHE_MB') or os.environ.get('ADAS_UPLOAD_CACHE_MB') or '512'
+) * 1024 * 1024
+DATASET_CACHE_MAX_ENTRIES = int(os.environ.get('ADAS_DATASET_CACHE_ENTRIES', '4'))
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+
+# Bases sem uso por esse tempo saem do cache mesmo com memória sobrando
+DATASET_IDLE_SECONDS = int(os.environ.get('ADAS_DATASET_IDLE_MINUTES', '60')) * 60
+
+# Aviso quando o processo se aproxima do limite de memória do contêiner (cgroup)
+MEMORY_WARNING_RATIO = float(os.environ.get('ADAS_MEMORY_WARNING_RATIO', '0.85'))
+MEMORY_WARNING_INTERVAL = 300
+
+class DatasetCache:
+    """Cache LRU de bases carregadas, limitado pela quantidade de bases e pelo tamanho em memória"""
+    
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            entry[2] = time.time()
+            return entry[0]
+    
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            
+            # Uma base maior que o limite inteiro fica como única entrada (senão seria relida a cada rerun)
+            if nbytes > self.max_bytes:
+                logger.warning("Base %s (%d MB) maior que o limite do cache (%d MB); fica sozinha no cache. "
+                               "Aumente ADAS_DATASET_CACHE_MB para manter outras bases junto",
+                               key, nbytes // (1024 * 1024), self.max_bytes // (1024 * 1024))
+            
+            self._entries[key] = [value, nbytes, time.time()]
+            self._total_bytes += nbytes
+            self._evict()
+    
+    def _evict(self):
+        """Remove as menos usadas até caber nos limites, mantendo sempre a mais recente (chamado com o lock)"""
+        while len(self._entries) > 1 and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key, (_, evicted_bytes, _) = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_bytes
+            self._evictions += 1
+            logger.info("Base %s removida do cache (%d MB)", key, evicted_bytes // (1024 * 1024))
+    
+    def evict_idle(self, max_idle):
+        """Remove as bases sem uso há mais de `max_idle` segundos; retorna quantas saíram"""
+        now = time.time()
+        with self._lock:
+            idle = [key for key, (_, _, last_used) in self._entries.items() if now - last_used > max_idle]
+            for key in idle:
+                _, evicted_bytes, _ = self._entries.pop(key)
+                self._total_bytes -= evicted_bytes
+                self._evictions += 1
+                logger.info("Base %s removida do cache por inatividade (%d MB)", key, evicted_bytes // (1024 * 1024))
+        return len(idle)
+    
+    def refresh_sizes(self, measure):
+        """Mede de novo cada entrada (índices construídos depois da carga) e reaplica os limites"""
+        with self._lock:
+            items = list(self._entries.items())
+        sizes = {key: measure(entry[0]) for key, entry in items}
+        with self._lock:
+            for key, nbytes in sizes.items():
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._total_bytes += nbytes - entry[1]
+                    entry[1] = nbytes
+            self._evict()
+    
+    def entries(self):
+        """(chave, bytes, segundos sem uso) de cada base, da mais recente para a mais antiga"""
+        now = time.time()
+        with self._lock:
+            return [(key, nbytes, now - last_used) for key, (_, nbytes, last_used) in reversed(self._entries.items())]
+    
+    def purge(self):
+        """Esvazia o cache; retorna quantas bases e quantos bytes foram liberados"""
+        with self._lock:
+            count, freed = len(self._entries), self._total_bytes
+            self._entries.clear()
+            self._total_bytes = 0
+        logger.warning("Cache de bases esvaziado: %d base(s), %d MB", count, freed // (1024 * 1024))
+        return count, freed
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._total_bytes, 'evictions': self._evictions}
+
+@st.cache_resource
+def get_dataset_cache():
+    """Instância única do cache de bases para o processo"""
+    return DatasetCache(DATASET_CACHE_MAX_BYTES, DATASET_CACHE_MAX_ENTRIES)
+
+def _read_cgroup_value(path):
+    try:
+        with open(path) as file:
+            value = file.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+def container_memory():
+    """(uso, limite) de memória do contêiner em bytes pelo cgroup v2 ou v1; None sem limite"""
+    for usage_path, limit_path in (
+        ('/sys/fs/cgroup/memory.current', '/sys/fs/cgroup/memory.max'),
+        ('/sys/fs/cgroup/memory/memory.usage_in_bytes', '/sys/fs/cgroup/memory/memory.limit_in_bytes'),
+    ):
+        limit = _read_cgroup_value(limit_path)
+        usage = _read_cgroup_value(usage_path)
+        # cgroup v1 sem limite informa um valor enorme (próximo de 2**63)
+        if limit is not None and usage is not None and limit < 2 ** 60:
+            return usage, limit
+    return None
+
+class MemoryWatch:
+    """Registra um aviso (no máximo a cada `interval` segundos) perto do limite do contêiner"""
+    
+    def __init__(self, ratio, interval):
+        self.ratio = ratio
+        self.interval = interval
+        self._last_warning = 0.0
+        self._lock = threading.Lock()
+    
+    def check(self):
+        """Retorna (uso, limite) quando acima do limiar, senão None"""
+        memory = container_memory()
+        if memory is None:
+            return None
+        usage, limit = memory
+        if usage < self.ratio * limit:
+            return None
+        
+        with self._lock:
+            now = time.time()
+            should_log = now - self._last_warning >= self.interval
+            if should_log:
+                self._last_warning = now
+        if should_log:
+            cache_stats = get_dataset_cache().stats()
+            logger.warning(
+                "Memória do contêiner em %.0f%% (%d de %d MB); cache de bases com %d base(s), %d MB",
+                100 * usage / limit, usage // (1024 * 1024), limit // (1024 * 1024),
+                cache_stats['entries'], cache_stats['bytes'] // (1024 * 1024)
+            )
+        return memory
+
+@st.cache_resource
+def get_memory_watch():
+    """Instância única do monitor de memória para o processo"""
+    return MemoryWatch(MEMORY_WARNING_RATIO, MEMORY_WARNING_INTERVAL)
+
+def _loaded_base_nbytes(result):
+    """Tamanho atual de uma entrada do cache (base, mensagem, total)"""
+    return result[0].nbytes
+
+def _dataframe_nbytes(df):
+    """Tamanho real do DataFrame em memória, incluindo strings"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+# Limpeza e validação na carga: tudo que vem depois compara os valores exatos ('Sim', 'Não',
+# marca em maiúsculas sem espaços) sem normalizar de novo linha a linha
+FLAG_VALUE_COLUMNS = [col for col in FLAG_COLUMNS if col != 'Tipo de Regulagem']
+FLAG_VALUES = {
+    'SIM': 'Sim', 'S': 'Sim', 'YES': 'Sim', 'Y': 'Sim', 'TRUE': 'Sim', 'VERDADEIRO': 'Sim', 'X': 'Sim', '1': 'Sim', '1.0': 'Sim',
+    'NAO': 'Não', 'N': 'Não', 'NO': 'Não', 'FALSE': 'Não', 'FALSO': 'Não', '0': 'Não', '0.0': 'Não',
+}
+CLEAN_TEXT_COLUMNS = ['VehicleName', 'Abreviação de descrição', 'Tipo de Regulagem']
+MIN_MODEL_YEAR = 1950
+CLEANING_SAMPLE_VALUES = 5
+
+def _trimmed_text(values):
+    """Texto sem espaços nas pontas e com espaços internos colapsados"""
+    return values.astype(str).str.strip().str.replace(r'\s+', ' ', regex=True)
+
+def _flag_key(values):
+    """Chave de comparação das características: sem acentos, maiúscula, sem espaços"""
+    return values.astype(str).str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.strip().str.upper()
+
+def _normalize_distinct(series, normalize):
+    """Aplica `normalize` (operações de texto do pandas) só aos valores distintos da coluna
+
+    Retorna a coluna normalizada, os códigos de cada linha e os valores distintos
+    originais/normalizados; nulos e textos vazios viram None.
+    """
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Index(uniques, dtype=object)
+    cleaned = pd.Index(normalize(uniques), dtype=object)
+    cleaned = cleaned.where(cleaned.notna() & (cleaned != ''), None)
+    # O código -1 (nulo) pega o None acrescentado no fim
+    lookup = np.append(cleaned.to_numpy(dtype=object), None)
+    return pd.Series(lookup[codes], index=series.index, name=series.name), codes, uniques, cleaned
+
+def _changed_rows(codes, uniques, cleaned):
+    """Linhas cujo valor foi alterado pela normalização (nulos de origem não contam)"""
+    changed = np.fromiter(
+        (original != value for original, value in zip(uniques, cleaned)), dtype=bool, count=len(uniques)
+    )
+    return int(np.bincount(codes[codes >= 0], minlength=len(uniques))[changed].sum())
+
+def clean_vehicle_data(df, deduplicate=True):
+    """Limpa e valida a base lida, uma vez na carga, com operações por coluna
+
+    Retorna (DataFrame limpo, relatório). Linhas sem FipeID ou ano-modelo inteiros ou
+    repetidas (mesmo FipeID e ano) são descartadas; anos fora de [1950, ano atual + 2] ficam
+    na base, mas aparecem no relatório. Variantes de Sim/Não ("SIM", " sim", "S", "1"...)
+    são padronizadas e valores não reconhecidos viram nulos (❓), também listados.
+    """
+    report = {'rows': len(df), 'kept': len(df), 'rejected': {}, 'odd': {}, 'normalized': {}, 'unrecognized': {}, 'missing': {}}
+    if df.empty:
+        return df, report
+    
+    df = df.copy(deep=False)
+    df.columns = [str(col).strip() for col in df.columns]
+    keep = np.ones(len(df), dtype=bool)
+    
+    def reject(reason, invalid):
+        count = int((invalid & keep).sum())
+        if count:
+            report['rejected'][reason] = count
+        keep[invalid] = False
+    
+    if 'FipeID' in df.columns:
+        fipe = pd.to_numeric(df['FipeID'], errors='coerce')
+        reject('FipeID inválido', (fipe.isna() | (fipe <= 0) | (fipe % 1 != 0)).to_numpy())
+        df['FipeID'] = fipe.fillna(0).astype('int64')
+    if 'VehicleModelYear' in df.columns:
+        year = pd.to_numeric(df['VehicleModelYear'], errors='coerce')
+        reject('Ano-modelo inválido', (year.isna() | (year % 1 != 0)).to_numpy())
+        df['VehicleModelYear'] = year.fillna(0).astype('int64')
+    if deduplicate and {'FipeID', 'VehicleModelYear'} <= set(df.columns):
+        repeated = np.zeros(len(df), dtype=bool)
+        repeated[keep] = df.loc[keep].duplicated(['FipeID', 'VehicleModelYear'], keep='first').to_numpy()
+        reject('FipeID e ano repetidos', repeated)
+    if not keep.all():
+        df = df.loc[keep].reset_index(drop=True)
+    report['kept'] = len(df)
+    
+    if 'VehicleModelYear' in df.columns:
+        years = df['VehicleModelYear'].to_numpy()
+        odd_years = int(((years < MIN_MODEL_YEAR) | (years > time.localtime().tm_year + 2)).sum())
+        if odd_years:
+            report['odd']['Ano-modelo fora do esperado'] = odd_years
+    
+    normalizers = [('BrandName', lambda values: _trimmed_text(values).str.upper())]
+    normalizers += [(col, _trimmed_text) for col in CLEAN_TEXT_COLUMNS]
+    normalizers += [(col, lambda values: _flag_key(values).map(FLAG_VALUES)) for col in FLAG_VALUE_COLUMNS]
+    for col, normalize in normalizers:
+        if col not in df.columns:
+            continue
+        df[col], codes, uniques, cleaned = _normalize_distinct(df[col], normalize)
+        changed = _changed_rows(codes, uniques, cleaned)
+        if changed:
+            report['normalized'][col] = changed
+        
+        if col in FLAG_VALUE_COLUMNS:
+            # Valores preenchidos que não são nenhuma variante de Sim/Não
+            unrecognized = cleaned.isna() & (_flag_key(uniques) != '') & pd.Index(uniques).notna()
+            if unrecognized.any():
+                counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+                values = sorted(zip(counts[unrecognized], uniques[unrecognized]), reverse=True)
+                report['unrecognized'][col] = {str(value): int(count) for count, value in values[:CLEANING_SAMPLE_VALUES]}
+        
+        missing = int(np.append(cleaned.isna(), True)[codes].sum())
+        if missing and (col in FLAG_VALUE_COLUMNS or col == 'BrandName'):
+            report['missing'][col] = missing
+    
+    return df, report
+
+def _read_upload(uploaded_file):
+    """Lê o arquivo enviado em blocos calculando o SHA-256 no mesmo passo"""
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    
+    uploaded_file.seek(0)
+    for chunk in iter(lambda: uploaded_file.read(UPLOAD_READ_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        buffer.write(chunk)
+    
+    buffer.seek(0)
+    return digest.hexdigest(), buffer
+
+def _load_uploaded_vehicle_data(uploaded_file):
+    """Carrega arquivo enviado usando a impressão digital do conteúdo como chave de cache"""
+    if uploaded_file.name.endswith('.xlsx'):
+        file_format = 'xlsx'
+    elif uploaded_file.name.endswith(('.csv', '.txt')):
+        file_format = 'csv'
+    else:
+        st.error("⚠️ Formato não suportado. Use XLSX ou CSV.")
+        return VehicleBase(pd.DataFrame(), "erro_formato"), "erro_formato", 0
+    
+    cache = get_dataset_cache()
+    
+    # O hash é calculado uma única vez por upload da sessão
+    fingerprints = st.session_state.setdefault('upload_fingerprints', {})
+    fingerprint = fingerprints.get(uploaded_file.file_id)
+    if fingerprint is not None:
+        cached = cache.get(f"{file_format}:{fingerprint}")
+        if cached is not None:
+            return cached
+    
+    fingerprint, buffer = _read_upload(uploaded_file)
+    fingerprints[uploaded_file.file_id] = fingerprint
+    cache_key = f"{file_format}:{fingerprint}"
+    
+    # Outra sessão pode já ter enviado a mesma base
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    if file_format == 'xlsx':
+        df = pd.read_excel(buffer, engine='openpyxl')
+        message = f"✅ Arquivo XLSX enviado carregado: {len(df):,} veículos"
+    else:
+        df = pd.read_csv(buffer, sep=';', encoding='utf-8')
+        message = f"✅ Arquivo CSV enviado carregado: {len(df):,} veículos"
+    
+    df, report = clean_vehicle_data(df)
+    base = VehicleBase(df, cache_key, report)
+    result = (base, message, report['rows'])
+    cache.refresh_sizes(_loaded_base_nbytes)
+    cache.put(cache_key, result, base.nbytes)
+    return result
+
+def read_delta_file(uploaded_file):
+    """Lê um arquivo de delta (XLSX ou CSV separado por ';') enviado pela tela de administração"""
+    if uploaded_file.name.endswith('.xlsx'):
+        return pd.read_excel(uploaded_file, engine='openpyxl')
+    return pd.read_csv(uploaded_file, sep=';', encoding='utf-8')
+
+# Redes parceiras: cada uma com sua base de veículos e sua tabela de links de calibração.
+# O arquivo tenants.json lista as redes ({"nome": {"rotulo", "base", "links"}}); caminhos
+# relativos partem do diretório do arquivo. Sem ele, só existe a rede padrão.
+TENANTS_FILE = os.environ.get('ADAS_TENANTS_FILE', 'tenants.json')
+DEFAULT_TENANT_NAME = 'padrao'
+
+class Tenant:
+    """Rede parceira: base de veículos (carregada só quando usada) e tabela de links"""
+    
+    def __init__(self, name, label, data_path=None, links=None):
+        self.name = name
+        self.label = label
+        # Sem caminho: processed_data.xlsx/.csv do diretório de trabalho (ou a demonstração)
+        self.data_path = data_path
+        self.links = BOSCH_CALIBRATION_LINKS if links is None else links
+        self.links_version = calibration_links_digest(self.links)
+    
+    @property
+    def sqlite_path(self):
+        if self.data_path is None:
+            return SQLITE_PATH
+        return f"{os.path.splitext(self.data_path)[0]}.sqlite"
+    
+    @property
+    def delta_journal_path(self):
+        if self.data_path is None:
+            return DELTA_JOURNAL_PATH
+        return f"{os.path.splitext(self.data_path)[0]}.deltas.jsonl"
+    
+    def calibration_link(self, brand_name, calibration_type):
+        """get_specific_calibration_link com a tabela de links desta rede"""
+        return get_specific_calibration_link(brand_name, calibration_type, self.links)
+
+DEFAULT_TENANT = Tenant(DEFAULT_TENANT_NAME, "Base padrão")
+
+def _read_tenant_links(path):
+    """Tabela de links no mesmo formato de BOSCH_CALIBRATION_LINKS, com marcas normalizadas"""
+    with open(path, encoding='utf-8') as f:
+        links = json.load(f)
+    return {brand.upper().strip(): brand_links for brand, brand_links in links.items()}
+
+def read_tenants(path):
+    """Redes do arquivo de configuração, sempre com a rede padrão (que o arquivo pode substituir)"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    directory = os.path.dirname(os.path.abspath(path))
+    resolve = lambda value: os.path.join(directory, value) if value else None
+    
+    tenants = {DEFAULT_TENANT_NAME: DEFAULT_TENANT}
+    for name, entry in config.items():
+        links_path = resolve(entry.get('links'))
+        tenants[name] = Tenant(
+            name,
+            entry.get('rotulo', name),
+            resolve(entry.get('base')),
+            _read_tenant_links(links_path) if links_path else None,
+        )
+    return tenants
+
+class TenantRegistry:
+    """Redes cadastradas, relidas do arquivo de configuração quando ele muda"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._tenants = {DEFAULT_TENANT_NAME: DEFAULT_TENANT}
+        self._lock = threading.Lock()
+    
+    def tenants(self):
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        
+        with self._lock:
+            if signature != self._signature:
+                self._signature = signature
+                if signature is None:
+                    self._tenants = {DEFAULT_TENANT_NAME: DEFAULT_TENANT}
+                else:
+                    try:
+                        self._tenants = read_tenants(self.path)
+                    except (OSError, ValueError, AttributeError) as e:
+                        # Mantém as redes anteriores até o arquivo ser corrigido
+                        logger.warning("Configuração de redes inválida em %s: %s", self.path, e)
+            return self._tenants
+    
+    def get(self, name):
+        tenants = self.tenants()
+        return tenants.get(name) or tenants[DEFAULT_TENANT_NAME]
+
+@st.cache_resource
+def get_tenant_registry():
+    """Instância única do cadastro de redes para o processo"""
+    return TenantRegistry(TENANTS_FILE)
+
+def select_tenant():
+    """Rede da sessão: fixada por ?rede=<nome> na URL ou escolhida na barra lateral"""
+    registry = get_tenant_registry()
+    tenants = registry.tenants()
+    requested = st.query_params.get('rede')
+    if requested in tenants:
+        return tenants[requested]
+    if len(tenants) == 1:
+        return next(iter(tenants.values()))
+    
+    name = st.sidebar.selectbox(
+        "🏢 Rede",
+        list(tenants),
+        format_func=lambda key: tenants[key].label,
+        key="tenant"
+    )
+    return registry.get(name)
+
+def load_vehicle_data(uploaded_file=None, tenant=DEFAULT_TENANT):
+    """Carrega dados com suporte prioritário ao XLSX e fallback para CSV"""
+    
+    try:
+        # Bases de redes sem acesso recente liberam memória para as que estão em uso
+        get_dataset_cache().evict_idle(DATASET_IDLE_SECONDS)
+        if uploaded_file is not None:
+            result = _load_uploaded_vehicle_data(uploaded_file)
         else:
-            filter_msg = f" com filtros aplicados" if (search_query or year_filter != "Todos os anos") else ""
-            st.error(f"❌ Nenhum resultado encontrado{filter_msg}")
-            st.info("💡 Tente: 'BMW', 'Polo', 'Mercedes' ou códigos FIPE")
+            result = _load_local_vehicle_data(tenant)
+        
+        get_memory_watch().check()
+        return result
+        
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar dados: {str(e)}")
+        return VehicleBase(pd.DataFrame(), "erro"), f"erro: {str(e)}", 0
+
+def _local_data_cache_key(data_path=None):
+    """Chave da base local: arquivo, data de modificação e tamanho"""
+    paths = ('processed_data.xlsx', 'processed_data.csv') if data_path is None else (data_path,)
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return f"local:{path}:{stat.st_mtime_ns}:{stat.st_size}"
+    if data_path is not None:
+        raise FileNotFoundError(f"base da rede não encontrada: {data_path}")
+    return "demo"
+
+def _load_local_vehicle_data(tenant=DEFAULT_TENANT):
+    """Carrega a base da rede pelo cache compartilhado, relendo apenas se o arquivo mudar
+
+    A primeira sessão que usa a rede carrega a base; as demais recebem a mesma instância.
+    """
+    cache = get_dataset_cache()
+    cache_key = _local_data_cache_key(tenant.data_path)
+    if STORAGE_BACKEND == 'sqlite':
+        cache_key = f"sqlite:{cache_key}"
+    
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    # Exibir dica quando não há busca
-    elif not search_query and (not year_filter or year_filter == "Todos os anos"):
-        st.info("💡 **Dica:** Digite um termo de busca ou selecione um ano para começar")
+    if STORAGE_BACKEND == 'sqlite':
+        result = _open_sqlite_vehicle_data(cache_key, tenant)
+    else:
+        df, message, total_records = _read_local_vehicle_data(tenant.data_path)
+        df, report = clean_vehicle_data(df)
+        # Deltas já aplicados a esta base (antes de um despejo do cache ou reinício) voltam a valer
+        base = VehicleBase(df, cache_key, report, tenant.delta_journal_path)
+        replayed = base.replay_journal()
+        if replayed:
+            message += f" ({replayed} delta(s) reaplicado(s))"
+        result = (base, message, total_records)
+    
+    cache.refresh_sizes(_loaded_base_nbytes)
+    cache.put(cache_key, result, result[0].nbytes)
+    return result
+
+def _open_sqlite_vehicle_data(version, tenant=DEFAULT_TENANT):
+    """Abre o arquivo SQLite da base, reconstruindo-o só quando a base de origem muda
+
+    Deltas aplicados ao arquivo mudam só o sufixo da versão gravada e são mantidos.
+    """
+    stored = SQLiteVehicleBase.stored_version(tenant.sqlite_path)
+    if stored is None or dataset_root_version(stored) != version:
+        df, _, _ = _read_local_vehicle_data(tenant.data_path)
+        df, report = clean_vehicle_data(df)
+        build_sqlite_base(df, tenant.sqlite_path, version, report)
+        stored = version
+    
+    base = SQLiteVehicleBase(tenant.sqlite_path, stored)
+    total_vehicles = base.stats['total_vehicles'] or 0
+    return base, f"✅ Base SQLite carregada: {total_vehicles:,} veículos", total_vehicles
+
+def _read_local_vehicle_data(data_path=None):
+    """Lê a base local do diretório de trabalho (ou o arquivo da rede) ou os dados de demonstração"""
+    
+    if data_path is not None:
+        if data_path.endswith('.xlsx'):
+            df = pd.read_excel(data_path, engine='openpyxl')
+            return df, f"✅ Base XLSX carregada: {len(df):,} veículos", len(df)
+        df = pd.read_csv(data_path, sep=';', encoding='utf-8')
+        return df, f"✅ Base CSV carregada: {len(df):,} veículos", len(df)
+    
+    # Prioridade 1: Tentar carregar XLSX (dados mais limpos)
+    if os.path.exists('processed_data.xlsx'):
+        df = pd.read_excel('processed_data.xlsx', engine='openpyxl')
+        return df, f"✅ Base carregada: {len(df):,} veículos", len(df)
+    
+    # Prioridade 2: Fallback para CSV se XLSX não existir
+    elif os.path.exists('processed_data.csv'):
+        df = pd.read_csv('processed_data.csv', sep=';', encoding='utf-8')
+        return df, f"✅ Base CSV carregada: {len(df):,} veículos", len(df)
+    
+    # Fallback final: dados de demonstração
+    else:
+        demo_data = {
+            'FipeID': [92983, 95432, 87654, 76543, 65432],
+            'VehicleModelYear': [2024, 2023, 2024, 2023, 2022],
+            'BrandName': ['BMW', 'VOLKSWAGEN', 'MERCEDES-BENZ', 'AUDI', 'VOLVO'],
+            'VehicleName': [
+                '118i M Sport 1.5 TB 12V Aut. 5p',
+                'Polo TSI 1.0 200 Aut. 5p', 
+                'C-Class C200 2.0 TB Aut.',
+                'A3 Sedan 1.4 TFSI Aut.',
+                'XC60 T5 2.0 TB Aut. AWD'
+            ],
+            'Abreviação de descrição': [
+                'BMW 118i M Sport',
+                'Polo TSI 200',
+                'Mercedes C200',
+                'Audi A3 Sedan',
+                'Volvo XC60 T5'
+            ],
+            'ADAS': ['Sim', 'Sim', 'Sim', 'Sim', 'Sim'],
+            'Opcional Parabrisa': ['Sim', 'Não', 'Sim', 'Não', 'Sim'],
+            'ADAS no Parabrisa': ['Sim', 'Não', 'Sim', 'Sim', 'Sim'],
+            'Adas no Parachoque': ['Sim', 'Sim', 'Não', 'Sim', 'Sim'],
+            'Tipo de Regulagem': ['Dinâmica', 'Estática', 'Dinâmica', 'Estática', 'Dinâmica'],
+            'Camera no Retrovisor': ['Sim', 'Não', 'Sim', 'Sim', 'Sim'],
+            'Faróis Matrix': ['Sim', 'Não', 'Sim', 'Sim', 'Não']
+        }
         
-        # Mostrar estatísticas interessantes se há dados
-        if not df.empty:
-            st.subheader("📊 Resumo da Base Carregada")
-            col1, col2, col3, col4 = st.columns(4)
+        df = pd.DataFrame(demo_data)
+        return df, "⚠️ Usando dados de demonstração (5 veículos)", len(df)
+
+# Limite de memória do cache de buscas compartilhado entre sessões
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('ADAS_QUERY_CACHE_MB', '64')) * 1024 * 1024
+
+class _InFlightQuery:
+    """Busca em andamento: as sessões com a mesma consulta aguardam este resultado"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = False
+
+class QueryCache:
+    """Cache LRU de resultados de busca, limitado em memória e com coalescência (single-flight)"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+    
+    def get_or_compute(self, key, compute):
+        """Retorna o resultado em cache ou calcula uma única vez para todas as sessões concorrentes"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _InFlightQuery()
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
             
-            with col1:
-                if 'FipeID' in df.columns:
-                    total_vehicles = df['FipeID'].nunique()
-                    st.metric("Total Veículos", f"{total_vehicles:,}")
+            if leader:
+                break
             
-            with col2:
-                if 'ADAS' in df.columns and 'FipeID' in df.columns:
-                    adas_vehicles = df[df['ADAS'] == 'Sim']['FipeID'].nunique()
-                    total_vehicles = df['FipeID'].nunique()
-                    adas_percent = (adas_vehicles / total_vehicles * 100) if total_vehicles > 0 else 0
-                    st.metric("Percentual ADAS", f"{adas_percent:.1f}%")
+            flight.done.wait()
+            if not flight.failed:
+                return flight.value
+            # A sessão que calculava foi interrompida: tentar de novo (esta pode virar a líder)
+        
+        try:
+            value = compute()
+            flight.value = value
+            self._store(key, value)
+            return value
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+    
+    def _store(self, key, value):
+        nbytes = _ranked_result_nbytes(value)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+                self.evictions += 1
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+@st.cache_resource
+def get_query_cache():
+    """Instância única do cache de buscas para o processo"""
+    return QueryCache(QUERY_CACHE_MAX_BYTES)
+
+# Registro das buscas (JSON Lines, só acréscimo) para repetir as mais frequentes após um deploy
+QUERY_LOG_ENABLED = os.environ.get('ADAS_QUERY_LOG', '1') != '0'
+QUERY_LOG_PATH = os.environ.get('ADAS_QUERY_LOG_PATH', 'query_log.jsonl')
+QUERY_LOG_MAX_BYTES = int(os.environ.get('ADAS_QUERY_LOG_MB', '50')) * 1024 * 1024
+QUERY_LOG_FLUSH_INTERVAL = 2.0
+QUERY_LOG_BUFFER_LIMIT = 10000
+QUERY_PREWARM_COUNT = int(os.environ.get('ADAS_QUERY_PREWARM', '20'))
+QUERY_PREWARM_MAX_AGE = 7 * 24 * 3600
+
+class QueryLog:
+    """Log de buscas gravado por uma thread própria: o rerun só acrescenta numa lista em memória
+
+    Quando o arquivo passa de `max_bytes`, ele vira `<arquivo>.1` (a versão anterior é descartada).
+    """
+    
+    def __init__(self, path, max_bytes, flush_interval):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._replayed = set()
+        self.recorded = 0
+        self.dropped = 0
+        atexit.register(self.flush)
+    
+    def record(self, tenant, query, year, filters, results, seconds):
+        entry = {
+            'ts': round(time.time(), 3),
+            'rede': tenant,
+            'query': query,
+            'year': year,
+            'filters': [[col, list(values)] for col, values in filters],
+            'results': results,
+            'ms': round(seconds * 1000, 2),
+        }
+        with self._lock:
+            # Disco lento ou cheio: descarta em vez de segurar memória ou o rerun
+            if len(self._buffer) >= QUERY_LOG_BUFFER_LIMIT:
+                self.dropped += 1
+                return
+            self._buffer.append(entry)
+            self.recorded += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+                self._writer.start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+    
+    def flush(self):
+        """Grava as entradas pendentes; retorna quantas foram escritas"""
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return 0
+        
+        lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        with self._write_lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+            except OSError as e:
+                logger.warning("Falha ao gravar o log de buscas em %s: %s", self.path, e)
+                return 0
+        return len(entries)
+    
+    def _read_entries(self):
+        for path in (f"{self.path}.1", self.path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            # Linha cortada por uma parada no meio da gravação
+                            continue
+            except OSError:
+                continue
+    
+    def top_queries(self, tenant, limit, max_age):
+        """(busca normalizada, ano, filtros avançados) mais frequentes da rede nos últimos `max_age` segundos"""
+        cutoff = time.time() - max_age
+        counts = Counter(
+            (entry['query'], entry.get('year'), self._filters_of(entry))
+            for entry in self._read_entries()
+            if entry.get('rede') == tenant and entry.get('ts', 0) >= cutoff
+            and (entry.get('query') or entry.get('year') is not None or entry.get('filters'))
+        )
+        return [key for key, _ in counts.most_common(limit)]
+    
+    @staticmethod
+    def _filters_of(entry):
+        """Filtros da entrada como tuplas, iguais aos da interface (mesma chave no cache de buscas)"""
+        return tuple((col, tuple(values)) for col, values in entry.get('filters') or ())
+    
+    def start_replay(self, generation):
+        """True só na primeira chamada para cada (rede, versão da base)"""
+        with self._lock:
+            if generation in self._replayed:
+                return False
+            self._replayed.add(generation)
+            return True
+    
+    def stats(self):
+        with self._lock:
+            return {'recorded': self.recorded, 'dropped': self.dropped, 'pending': len(self._buffer)}
+
+class _DisabledQueryLog:
+    """Substituto quando o log de buscas está desligado"""
+    
+    def record(self, tenant, query, year, filters, results, seconds):
+        pass
+    
+    def top_queries(self, tenant, limit, max_age):
+        return []
+    
+    def start_replay(self, generation):
+        return False
+    
+    def stats(self):
+        return {'recorded': 0, 'dropped': 0, 'pending': 0}
+
+@st.cache_resource
+def get_query_log():
+    """Instância única do log de buscas para o processo"""
+    if not QUERY_LOG_ENABLED:
+        return _DisabledQueryLog()
+    return QueryLog(QUERY_LOG_PATH, QUERY_LOG_MAX_BYTES, QUERY_LOG_FLUSH_INTERVAL)
+
+def _ranked_result_nbytes(value):
+    """Memória de um resultado ranqueado (arrays de posições e scores) mais a chave"""
+    positions, scores = value
+    return 256 + positions.nbytes + (scores.nbytes if scores is not None else 0)
+
+def _parse_year_filter(year_filter):
+    """Converte a opção do filtro de ano em inteiro (None = todos os anos)"""
+    if year_filter and year_filter != "Todos os anos":
+        try:
+            return int(year_filter)
+        except ValueError:
+            pass
+    return None
+
+def rank_vehicles(query, base, year_filter=None, filters=()):
+    """Posições e scores de todos os resultados de uma busca, pelo cache compartilhado"""
+    year_int = _parse_year_filter(year_filter)
+    query = fold_search_text(query or '')
+    filters = tuple(filters)
+    
+    # Sessões diferentes com a mesma busca na mesma versão da base compartilham o resultado;
+    # versão e ranking vêm do mesmo snapshot, mesmo que um delta seja publicado no meio
+    snapshot = base.snapshot
+    return get_query_cache().get_or_compute(
+        (snapshot.version, query, year_int, filters),
+        lambda: snapshot.rank(query, year_int, filters)
+    )
+
+def result_page_size(query):
+    """Resultados por página: busca textual mostra os mais relevantes; só filtros, mais linhas"""
+    return SEARCH_RESULT_LIMIT if fold_search_text(query or '') else YEAR_ONLY_RESULT_LIMIT
+
+def search_vehicles(query, base, year_filter=None, filters=(), offset=0, limit=None, tenant=DEFAULT_TENANT, log=True):
+    """Busca inteligente na visão canônica (uma linha por FipeID) com filtro de ano e facetas"""
+    start = time.perf_counter()
+    year_int = _parse_year_filter(year_filter)
+    positions, scores = rank_vehicles(query, base, year_filter, filters)
+    total = len(positions)
+    
+    end = offset + (limit if limit is not None else result_page_size(query))
+    positions = positions[offset:end]
+    scores = scores[offset:end] if scores is not None else None
+    
+    results = base.records(positions)
+    for result, position in zip(results, positions.tolist()):
+        result['view_position'] = position
+    if scores is not None:
+        for result, score in zip(results, scores.tolist()):
+            result['search_score'] = score
+    if year_int is not None:
+        results = [apply_year_flags(result, year_int) for result in results]
+    
+    if log:
+        get_query_log().record(
+            tenant.name, fold_search_text(query or ''), year_int, filters, total, time.perf_counter() - start
+        )
+    return results
+
+def format_model_years(vehicle):
+    """Texto com todos os anos-modelo do FipeID e as características que mudam entre eles"""
+    years = vehicle.get('ModelYears')
+    if years is None or len(years) == 0:
+        return str(vehicle.get('VehicleModelYear', 'N/A')), ""
+    
+    years_text = ", ".join(str(year) for year in years)
+    
+    differences = []
+    for year, flags in sorted((vehicle.get('YearFlags') or {}).items(), reverse=True):
+        changes = ", ".join(f"{col}: {value if value is not None else 'N/A'}" for col, value in flags.items())
+        differences.append(f"{year} ({changes})")
+    
+    return years_text, "; ".join(differences)
+
+def vehicle_calibration_links(vehicle, lookup=get_specific_calibration_link):
+    """Links de calibração que o card do veículo exibe (mesmas regras dos botões)"""
+    if vehicle.get('ADAS') != 'Sim':
+        return {}
+    
+    brand_name = vehicle.get('BrandName') or ''
+    wanted = []
+    if vehicle.get('ADAS no Parabrisa') == 'Sim':
+        wanted.append(('Câmera Frontal', 'camera_frontal'))
+    if vehicle.get('Adas no Parachoque') == 'Sim':
+        wanted.append(('Radar Frontal', 'radar_frontal'))
+    if vehicle.get('Camera no Retrovisor') == 'Sim':
+        wanted.append(('Câmera Traseira', 'camera_traseira'))
+    if brand_name in ['AUDI', 'VOLKSWAGEN']:
+        wanted.append(('Câmera 360°', 'camera_360'))
+    if brand_name == 'AUDI':
+        wanted.append(('Lidar', 'lidar'))
+    
+    links = {}
+    for label, calibration_type in wanted:
+        link = lookup(brand_name, calibration_type)
+        if link:
+            links[label] = link
+    return links
+
+# Cards de veículo montados uma vez e reaproveitados entre reruns e sessões
+CARD_CACHE_MAX_ENTRIES = int(os.environ.get('ADAS_CARD_CACHE_ENTRIES', '2000'))
+CARD_PREWARM_COUNT = int(os.environ.get('ADAS_CARD_PREWARM', '50'))
+CARD_VIEW_TRACK_LIMIT = 50000
+
+PILOT_BRANDS = [
+    'ALFA ROMEO', 'AUDI', 'BENTLEY', 'BMW', 'MINI', 'MERCEDES', 'MERCEDES-BENZ',
+    'CITROEN', 'CUPRA', 'DAIHATSU', 'FIAT', 'JEEP', 'FORD', 'HONDA', 'HYUNDAI',
+    'IVECO', 'KIA', 'LAMBORGHINI', 'LEXUS', 'TOYOTA', 'VOLKSWAGEN', 'RENAULT',
+    'PEUGEOT', 'NISSAN', 'OPEL', 'CHEVROLET', 'VOLVO', 'SUBARU', 'PORSCHE'
+]
+
+# Botão de cada link de calibração: cores do gradiente e texto
+CALIBRATION_BUTTONS = {
+    'Câmera Frontal': ('#28a745, #20c997', '📄 Câmera Frontal'),
+    'Radar Frontal': ('#dc3545, #e74c3c', '📡 Radar Frontal'),
+    'Câmera Traseira': ('#6f42c1, #8e44ad', '📹 Câm. Traseira'),
+    'Câmera 360°': ('#17a2b8, #138496', '🔄 Câm. 360°'),
+    'Lidar': ('#fd7e14, #e55d00', '🌊 Lidar'),
+}
+
+CALIBRATION_NOTICE = """
+**⚠️ Importante:**
+• Use apenas equipamento certificado (DAS 3000, VCDS, ODIS)
+• Sempre siga as instruções do PDF específico
+• Verifique compatibilidade antes de iniciar
+"""
+
+def _flag_icon(value):
+    return "✅" if value == "Sim" else "❌" if value == "Não" else "❓"
+
+def _calibration_button_html(label, link):
+    colors, text = CALIBRATION_BUTTONS[label]
+    return f"""
+    <a href="{link['link']}" target="_blank">
+        <button style="
+            background: linear-gradient(90deg, {colors});
+            color: white;
+            border: none;
+            padding: 4px 8px;
+            border-radius: 3px;
+            cursor: pointer;
+            font-size: 10px;
+            font-weight: bold;
+            width: 100%;
+        ">
+            {text}
+        </button>
+    </a>
+    """
+
+def build_vehicle_card(vehicle, lookup=get_specific_calibration_link):
+    """Conteúdo pronto do card de um veículo: HTML do cabeçalho, características com links e avisos
+
+    Depende só do registro (já com as características do ano escolhido) e dos links de
+    calibração, por isso pode ser guardado no cache de cards.
+    """
+    years_text, year_differences = format_model_years(vehicle)
+    differences_html = f"<p><strong>Diferenças por ano:</strong> {year_differences}</p>" if year_differences else ""
+    optional_windshield = vehicle.get('Opcional Parabrisa')
+    optional_text = '✅ SIM' if optional_windshield == 'Sim' else '❌ NÃO' if optional_windshield == 'Não' else '❓ N/A'
+    card = {
+        'header': f"""
+        <div class="vehicle-card">
+            <h3>🚗 {vehicle.get('BrandName', 'N/A')} - {vehicle.get('VehicleName', 'N/A')}</h3>
+            <p><strong>Ano:</strong> {vehicle.get('VehicleModelYear', 'N/A')} | 
+               <strong>FIPE:</strong> {vehicle.get('FipeID', 'N/A')} | 
+               <strong>ADAS:</strong> {'✅' if vehicle.get('ADAS') == 'Sim' else '❌'} |
+               <strong>Opcional Parabrisa:</strong> {optional_text}</p>
+            <p><strong>Anos-modelo:</strong> {years_text}</p>
+            {differences_html}
+        </div>
+        """,
+        'adas': vehicle.get('ADAS') == 'Sim',
+    }
+    if not card['adas']:
+        return card
+    
+    # (texto, botão do link ou None, em colunas texto | botão)
+    links = vehicle_calibration_links(vehicle, lookup)
+    button = lambda label: _calibration_button_html(label, links[label]) if label in links else None
+    features = [
+        (f"• ADAS no Parabrisa: {_flag_icon(vehicle.get('ADAS no Parabrisa', 'N/A'))}", button('Câmera Frontal'), True),
+        (f"• ADAS no Parachoque: {_flag_icon(vehicle.get('Adas no Parachoque', 'N/A'))}", button('Radar Frontal'), True),
+        (f"• Câmera Retrovisor: {_flag_icon(vehicle.get('Camera no Retrovisor', 'N/A'))}", button('Câmera Traseira'), True),
+        (f"• Faróis Matrix: {_flag_icon(vehicle.get('Faróis Matrix', 'N/A'))}", None, False),
+    ]
+    if 'Câmera 360°' in links:
+        features.append(("• Câmera 360°: ✅", button('Câmera 360°'), True))
+    if 'Lidar' in links:
+        features.append(("• Sistema Lidar: ✅", button('Lidar'), True))
+    card['features'] = features
+    
+    technical = []
+    if vehicle.get('Tipo de Regulagem'):
+        technical.append(f"• **Tipo de Calibração:** {vehicle['Tipo de Regulagem']}")
+    if vehicle.get('Abreviação de descrição'):
+        technical.append(f"• **Modelo:** {vehicle['Abreviação de descrição']}")
+    card['technical'] = technical
+    
+    # Aviso sobre piloto e links disponíveis
+    brand_name = vehicle.get('BrandName') or ''
+    if brand_name in PILOT_BRANDS:
+        card['pilot'] = ('success', f"""
+        🎯 **{brand_name} - Piloto Ativo:** Links específicos de calibração integrados acima conforme características detectadas
+        """)
+    else:
+        card['pilot'] = ('info', f"""
+        📚 **{brand_name}:** Consulte documentação geral - https://help.boschdiagnostics.com/DAS3000/
+        """)
+    return card
+
+def render_vehicle_card(card):
+    """Exibe um card montado por build_vehicle_card"""
+    st.markdown(card['header'], unsafe_allow_html=True)
+    
+    # Detalhes ADAS se disponível
+    if card['adas']:
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.write("**🎯 Características ADAS:**")
+            for text, button_html, in_columns in card['features']:
+                if not in_columns:
+                    st.write(text)
+                    continue
+                col_text, col_link = st.columns([2, 1])
+                with col_text:
+                    st.write(text)
+                if button_html:
+                    with col_link:
+                        st.markdown(button_html, unsafe_allow_html=True)
+        
+        with col2:
+            st.write("**⚙️ Informações Técnicas:**")
+            for line in card['technical']:
+                st.write(line)
+        
+        kind, text = card['pilot']
+        if kind == 'success':
+            st.success(text)
+        else:
+            st.info(text)
+        st.markdown(CALIBRATION_NOTICE)
+    
+    st.markdown("---")
+
+class CardCache:
+    """Cache LRU dos cards montados, com contagem de visualizações para o pré-aquecimento"""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._views = {}
+        self._warmed = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get_or_build(self, key, build):
+        with self._lock:
+            card = self._entries.get(key)
+            if card is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return card
+            self.misses += 1
+        
+        # Montado fora do lock: duas sessões montando o mesmo card só repetem trabalho barato
+        card = build()
+        with self._lock:
+            self._entries[key] = card
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return card
+    
+    def record_view(self, base_key, position, year):
+        """Conta uma exibição do card (base, posição na visão, ano escolhido)"""
+        with self._lock:
+            view_key = (base_key, position, year)
+            self._views[view_key] = self._views.get(view_key, 0) + 1
+            if len(self._views) > CARD_VIEW_TRACK_LIMIT:
+                # Mantém só a metade mais vista para a contagem não crescer sem limite
+                ranked = sorted(self._views.items(), key=lambda item: item[1], reverse=True)
+                self._views = dict(ranked[:CARD_VIEW_TRACK_LIMIT // 2])
+    
+    def most_viewed(self, base_key, limit):
+        """(posição, ano) dos cards mais exibidos de uma base"""
+        with self._lock:
+            views = [(count, position, year) for (key, position, year), count in self._views.items() if key == base_key]
+        views.sort(key=lambda item: item[0], reverse=True)
+        return [(position, year) for _, position, year in views[:limit]]
+    
+    def start_generation(self, generation):
+        """True só na primeira chamada para cada (versão da base, versão dos links)"""
+        with self._lock:
+            if generation in self._warmed:
+                return False
+            self._warmed.add(generation)
+            return True
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+@st.cache_resource
+def get_card_cache():
+    """Instância única do cache de cards para o processo"""
+    return CardCache(CARD_CACHE_MAX_ENTRIES)
+
+def calibration_links_version(tenant=DEFAULT_TENANT):
+    """Versão de tudo que muda os links de um card: tabela da rede, links fora do ar e PDFs locais"""
+    return (tenant.links_version, get_link_status_cache().version, get_document_store().version)
+
+def dataset_root_version(version):
+    """Versão da base sem o sufixo dos deltas aplicados"""
+    return version.split('#delta')[0]
+
+def vehicle_card(base, vehicle, links_version=None, tenant=DEFAULT_TENANT):
+    """Card do veículo pelo cache, chaveado por (FipeID, ano, versão da base, versão dos links)"""
+    links_version = links_version or calibration_links_version(tenant)
+    key = (vehicle.get('FipeID'), vehicle.get('VehicleModelYear'), base.version, links_version)
+    return get_card_cache().get_or_build(key, lambda: build_vehicle_card(vehicle, tenant.calibration_link))
+
+def prewarm_vehicle_cards(base, tenant=DEFAULT_TENANT, limit=CARD_PREWARM_COUNT):
+    """Monta os cards mais vistos da base quando ela ou os links mudam de versão"""
+    links_version = calibration_links_version(tenant)
+    cache = get_card_cache()
+    if base.is_empty or not cache.start_generation((base.version, links_version)):
+        return 0
+    
+    warmed = 0
+    viewed = cache.most_viewed(dataset_root_version(base.version), limit)
+    # Veículos excluídos por um delta depois de serem vistos ficam de fora
+    live = set(base.live_among([position for position, _ in viewed]).tolist())
+    for position, year in viewed:
+        if position not in live:
+            continue
+        vehicle = base.records([position])[0]
+        if year is not None:
+            vehicle = apply_year_flags(vehicle, year)
+        vehicle_card(base, vehicle, links_version, tenant)
+        warmed += 1
+    return warmed
+
+def prewarm_popular_queries(base, tenant=DEFAULT_TENANT, limit=QUERY_PREWARM_COUNT):
+    """Repete em segundo plano as buscas mais frequentes da rede (caches de resultados e de cards)
+
+    Roda uma vez por versão da base; quem buscar o mesmo termo enquanto isso aguarda o
+    mesmo cálculo pelo cache de buscas em vez de repeti-lo.
+    """
+    query_log = get_query_log()
+    if base.is_empty or limit <= 0 or not query_log.start_replay((tenant.name, base.version)):
+        return False
+    
+    # Caches do processo obtidos aqui: um cache_resource criado dentro da thread mostraria seu
+    # spinner na página de quem disparou o pré-aquecimento, mesmo depois do rerun terminar
+    get_query_cache()
+    get_card_cache()
+    links_version = calibration_links_version(tenant)
+    
+    def run():
+        start = time.perf_counter()
+        try:
+            popular = query_log.top_queries(tenant.name, limit, QUERY_PREWARM_MAX_AGE)
+            for query, year, filters in popular:
+                year_filter = str(year) if year is not None else None
+                for vehicle in search_vehicles(query, base, year_filter, filters, tenant=tenant, log=False):
+                    vehicle_card(base, vehicle, links_version, tenant)
+        except Exception as e:
+            logger.warning("Falha ao repetir as buscas mais frequentes: %s", e)
+        else:
+            logger.info("%d busca(s) frequente(s) de %s repetida(s) em %.1fs",
+                        len(popular), tenant.name, time.perf_counter() - start)
+    
+    thread = threading.Thread(target=run, name='query-prewarm', daemon=True)
+    # Os caches do processo (st.cache_resource) são acessados pela thread como num rerun
+    add_script_run_ctx(thread, get_script_run_ctx(suppress_warning=True))
+    thread.start()
+    return True
+
+# Exportação dos resultados: linhas lidas da base em blocos a partir das posições em cache
+EXPORT_CHUNK_ROWS = 2000
+EXPORT_COLUMNS = ['FipeID', 'BrandName', 'VehicleName', 'Abreviação de descrição', 'VehicleModelYear'] + FLAG_COLUMNS
+EXPORT_LINK_LABELS = ['Câmera Frontal', 'Radar Frontal', 'Câmera Traseira', 'Câmera 360°', 'Lidar']
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'XLSX': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+def _export_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+def _export_rows(base, positions, scores, year_int, tenant=DEFAULT_TENANT):
+    """Cabeçalho e linhas da exportação, gerados bloco a bloco"""
+    # O link depende só da marca e do tipo: uma consulta por par em toda a exportação
+    link_lookup = lru_cache(maxsize=None)(tenant.calibration_link)
+    
+    yield (EXPORT_COLUMNS + ['Anos-modelo'] + [f"Link {label}" for label in EXPORT_LINK_LABELS]
+           + (['Relevância'] if scores is not None else []))
+    
+    for start in range(0, len(positions), EXPORT_CHUNK_ROWS):
+        chunk = positions[start:start + EXPORT_CHUNK_ROWS]
+        for offset, vehicle in enumerate(base.records(chunk)):
+            if year_int is not None:
+                vehicle = apply_year_flags(vehicle, year_int)
+            years_text, _ = format_model_years(vehicle)
+            # Sempre o endereço público do PDF: o arquivo é aberto fora do app
+            links = vehicle_calibration_links(vehicle, link_lookup)
+            row = [_export_value(vehicle.get(col)) for col in EXPORT_COLUMNS] + [years_text]
+            row += [links[label].get('origin', links[label]['link']) if label in links else None
+                    for label in EXPORT_LINK_LABELS]
+            if scores is not None:
+                row.append(round(float(scores[start + offset]), 2))
+            yield row
+
+def export_results(base, positions, scores, year_filter, export_format, tenant=DEFAULT_TENANT):
+    """Arquivo CSV ou XLSX com os resultados ranqueados, escrito em blocos num buffer em memória"""
+    rows = _export_rows(base, positions, scores, _parse_year_filter(year_filter), tenant)
+    buffer = io.BytesIO()
+    
+    if export_format == 'XLSX':
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Resultados')
+        for row in rows:
+            sheet.append(row)
+        workbook.save(buffer)
+    else:
+        # Ponto e vírgula e BOM: o Excel em português abre o CSV direto
+        text = io.TextIOWrapper(buffer, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text, delimiter=';')
+        for row in rows:
+            writer.writerow(row)
+        text.flush()
+        text.detach()
+    
+    return buffer.getvalue()
+
+def _use_autocomplete_suggestion():
+    """Copia a sugestão escolhida para o campo de busca antes do próximo rerun"""
+    choice = st.session_state.get('autocomplete_choice')
+    if choice:
+        st.session_state['search_query'] = choice[-1]
+    st.session_state['autocomplete_choice'] = []
+
+FACET_ANY = "Qualquer"
+
+def read_facet_filters(model_years):
+    """Filtros avançados escolhidos na sessão, no formato aceito por FacetIndex e rank"""
+    state = st.session_state
+    filters = []
+
+    brands = state.get('facet_BrandName') or []
+    if brands:
+        filters.append(('BrandName', tuple(sorted(brands))))
+
+    year_range = state.get('facet_year_range')
+    if year_range and model_years:
+        low, high = year_range
+        if low < min(model_years) or high > max(model_years):
+            # Faixa de outra base (ex.: upload): volta para a faixa completa
+            del state['facet_year_range']
+        elif (low, high) != (min(model_years), max(model_years)):
+            filters.append(('VehicleModelYear', tuple(year for year in sorted(model_years) if low <= year <= high)))
+
+    for col in FACET_FLAG_COLUMNS:
+        value = state.get(f'facet_{col}', FACET_ANY)
+        if value != FACET_ANY:
+            filters.append((col, (value,)))
+
+    regulation = state.get('facet_Tipo de Regulagem') or []
+    if regulation:
+        filters.append(('Tipo de Regulagem', tuple(sorted(regulation))))
+    return tuple(filters)
+
+def render_facet_filters(base, filters):
+    """Widgets dos filtros avançados, com a contagem de cada opção dentro dos demais filtros"""
+    counts = base.facet_counts(filters)
+    state = st.session_state
+
+    def options_for(col, selected):
+        # Valores já escolhidos continuam na lista mesmo que sumam da base
+        return sorted(set(counts.get(col, {})) | set(selected), key=str)
+
+    def label_for(col):
+        return lambda value: value if value == FACET_ANY else f"{value} ({counts.get(col, {}).get(value, 0):,})"
+
+    with st.expander("🎛️ Filtros avançados", expanded=bool(filters)):
+        col1, col2 = st.columns(2)
+        with col1:
+            if 'BrandName' in counts:
+                st.multiselect(
+                    "🏷️ Marcas",
+                    options=options_for('BrandName', state.get('facet_BrandName') or []),
+                    format_func=label_for('BrandName'),
+                    key='facet_BrandName'
+                )
+        with col2:
+            model_years = base.model_years
+            if len(model_years) > 1:
+                st.slider(
+                    "📅 Faixa de anos-modelo",
+                    min_value=min(model_years),
+                    max_value=max(model_years),
+                    value=(min(model_years), max(model_years)),
+                    key='facet_year_range'
+                )
+
+        flag_columns = [col for col in FACET_FLAG_COLUMNS if col in counts]
+        for column, col in zip(st.columns(max(len(flag_columns), 1)), flag_columns):
+            with column:
+                selected = state.get(f'facet_{col}', FACET_ANY)
+                st.selectbox(
+                    col,
+                    options=[FACET_ANY] + options_for(col, [] if selected == FACET_ANY else [selected]),
+                    format_func=label_for(col),
+                    key=f'facet_{col}'
+                )
+
+        if 'Tipo de Regulagem' in counts:
+            st.multiselect(
+                "⚙️ Tipo de Regulagem",
+                options=options_for('Tipo de Regulagem', state.get('facet_Tipo de Regulagem') or []),
+                format_func=label_for('Tipo de Regulagem'),
+                key='facet_Tipo de Regulagem'
+            )
+
+        st.caption("Opções da mesma lista se somam (OU); listas diferentes se combinam (E). "
+                   "Contagens por ano-modelo (FipeID × ano).")
+
+def render_dashboard(base, stats):
+    """Painel gerencial: veículos por marca, ano-modelo e característica a partir do cubo"""
+    if base.is_empty:
+        st.info("💡 Carregue uma base para ver o painel")
+        return
+
+    cube = base.cube
+    st.subheader("📊 Painel de Calibrações")
+
+    # Totais sobre as estatísticas da base (cada FipeID pelo seu ano-modelo mais recente)
+    totals = cube.totals()
+    metric_columns = st.columns(len(totals) + 1)
+    with metric_columns[0]:
+        if stats['total_vehicles'] is not None:
+            st.metric("Total Veículos", f"{stats['total_vehicles']:,}")
+    for column, (flag, count) in zip(metric_columns[1:], totals.items()):
+        with column:
+            st.metric(flag, f"{count:,}")
+
+    col1, col2, col3 = st.columns([1, 2, 2])
+    with col1:
+        year_option = st.selectbox(
+            "📅 Ano-modelo",
+            options=["Todos os anos"] + [str(year) for year in base.model_years],
+            key="dashboard_year",
+            help="Em 'Todos os anos' cada veículo conta uma vez, pelo ano-modelo mais recente"
+        )
+    with col2:
+        regulation_options = sorted(cube.latest.index.get_level_values('Tipo de Regulagem').dropna().unique(), key=str)
+        regulation = st.multiselect("⚙️ Tipo de Regulagem", options=regulation_options, key="dashboard_regulation")
+    with col3:
+        brand_options = sorted(cube.by_year.index.get_level_values('BrandName').dropna().unique(), key=str)
+        brands = st.multiselect("🏷️ Marcas (evolução por ano)", options=brand_options, key="dashboard_brands")
+
+    brand_table = cube.brand_table(_parse_year_filter(year_option), regulation)
+    st.write("**Veículos por marca e característica**")
+    st.dataframe(brand_table, use_container_width=True)
+
+    camera_vs_radar = [col for col in ['ADAS no Parabrisa', 'Adas no Parachoque'] if col in brand_table.columns]
+    if camera_vs_radar and not brand_table.empty:
+        st.write("**Câmera no parabrisa × radar no parachoque (15 maiores marcas)**")
+        st.bar_chart(brand_table[camera_vs_radar].head(15), stack=False)
+
+    year_table = cube.year_table(brands, regulation)
+    if not year_table.empty:
+        st.write("**Evolução por ano-modelo**" + (f" — {', '.join(brands)}" if brands else ""))
+        year_table.index = year_table.index.map(str)
+        st.line_chart(year_table)
+
+# MAIN APP
+# Perfil sob demanda de um único rerun (?profile=1 na URL ou botão da administração)
+PROFILING_ALLOWED = os.environ.get('ADAS_PROFILING', '0') == '1'
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_KEY_FUNCTIONS = [
+    'load_vehicle_data', 'search_vehicles', 'rank_vehicles', 'get_specific_calibration_link',
+    'vehicle_card', 'render_vehicle_card', 'render_facet_filters', 'render_dashboard',
+]
+
+def _request_profile():
+    st.session_state['profile_next_rerun'] = True
+
+def profiling_requested():
+    """Rerun pedido com perfil: botão da administração ou ?profile=1 (admin ou ADAS_PROFILING=1)"""
+    if st.session_state.pop('profile_next_rerun', False):
+        return True
+    return st.query_params.get('profile') == '1' and (PROFILING_ALLOWED or is_admin_session())
+
+def _profile_function_name(key):
+    filename, line, name = key
+    if filename == '~':
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+def summarize_profile(profiler, elapsed):
+    """Funções com maior tempo acumulado, tempos das funções-chave e o arquivo .prof"""
+    stats = pstats.Stats(profiler)
+    rows = [
+        (_profile_function_name(key), primitive_calls, calls, total_time, cumulative_time)
+        for key, (primitive_calls, calls, total_time, cumulative_time, _) in stats.stats.items()
+    ]
+    rows.sort(key=lambda row: row[4], reverse=True)
+    columns = ['Função', 'Chamadas primitivas', 'Chamadas', 'Tempo próprio (s)', 'Tempo acumulado (s)']
+    
+    # Funções-chave somadas por nome; chamadas aninhadas entre elas contam tempo mais de uma vez
+    app_file = os.path.abspath(__file__)
+    key_functions = {name: [0, 0.0] for name in PROFILE_KEY_FUNCTIONS}
+    for (filename, _, name), (_, calls, _, cumulative_time, _) in stats.stats.items():
+        if name in key_functions and os.path.abspath(filename) == app_file:
+            key_functions[name][0] += calls
+            key_functions[name][1] += cumulative_time
+    
+    with tempfile.NamedTemporaryFile(suffix='.prof') as file:
+        stats.dump_stats(file.name)
+        data = file.read()
+    
+    return {
+        'elapsed': elapsed,
+        'top': pd.DataFrame(rows[:PROFILE_TOP_FUNCTIONS], columns=columns),
+        'key_functions': pd.DataFrame(
+            [(name, calls, cumulative_time) for name, (calls, cumulative_time) in key_functions.items() if calls],
+            columns=['Função', 'Chamadas', 'Tempo acumulado (s)']
+        ),
+        'data': data,
+        'created_at': time.strftime('%Y%m%d-%H%M%S'),
+    }
+
+def render_profile_report(report):
+    """Relatório do último rerun perfilado, no fim da barra lateral"""
+    with st.sidebar.expander("⏱️ Perfil do último rerun", expanded=True):
+        st.caption(f"Rerun completo em {report['elapsed'] * 1000:,.0f} ms (tempos com a sobrecarga do cProfile)")
+        if not report['key_functions'].empty:
+            st.dataframe(report['key_functions'], hide_index=True, use_container_width=True)
+        st.dataframe(report['top'], hide_index=True, use_container_width=True)
+        st.download_button(
+            "⬇️ Baixar perfil (.prof)",
+            data=report['data'],
+            file_name=f"adas-rerun-{report['created_at']}.prof",
+            mime="application/octet-stream",
+            key="profile_download",
+            help="Abra com snakeviz, `python -m pstats` ou pstats.Stats"
+        )
+        if st.button("Descartar perfil", key="profile_discard"):
+            st.session_state.pop('profile_report', None)
+            st.rerun()
+
+def run_app():
+    """Executa main(); só o rerun pedido roda sob cProfile (os demais não têm custo extra)"""
+    if profiling_requested():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Outro perfil em andamento no processo (Python 3.12+ admite um por vez)
+            st.sidebar.warning(f"⏱️ Perfil indisponível agora: {e}")
+            main()
+        else:
+            start = time.perf_counter()
+            try:
+                main()
+            finally:
+                profiler.disable()
+                st.session_state['profile_report'] = summarize_profile(profiler, time.perf_counter() - start)
+                # Um rerun por pedido: tirar o parâmetro da URL evita perfilar os seguintes
+                if st.query_params.get('profile') == '1':
+                    del st.query_params['profile']
+    else:
+        main()
+    
+    report = st.session_state.get('profile_report')
+    if report is not None:
+        render_profile_report(report)
+
+def main():
+    # Header
+    st.markdown("""
+    <div class="main-header">
+        <h1>🔧 Sistema Inteligente de Calibração ADAS</h1>
+        <p>Plataforma Profissional para Consulta de Sistemas ADAS - Criada pela Carglass</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Rede da sessão: base de veículos e tabela de links próprias
+    tenant = select_tenant()
+    
+    # Upload opcional de base própria (XLSX/CSV)
+    uploaded_file = st.sidebar.file_uploader(
+        "📤 Enviar base própria",
+        type=['xlsx', 'csv', 'txt'],
+        help="Substitui a base padrão apenas nesta sessão"
+    )
+    
+    # Carregar dados (a base da rede é carregada na primeira vez que alguma sessão a usa)
+    base, status_message, total_records = load_vehicle_data(uploaded_file, tenant)
+    stats = base.stats
+    
+    # Verificar os PDFs de calibração em segundo plano (links fora do ar são ocultados)
+    if LINK_CHECK_ENABLED:
+        get_link_status_cache().refresh_in_background(iter_calibration_links(tenant.links))
+    
+    # Manter a cópia local dos PDFs atualizada em segundo plano
+    get_document_store().refresh_in_background(iter_calibration_links(tenant.links))
+    
+    # Cards mais vistos já montados para a versão atual da base e dos links
+    prewarm_vehicle_cards(base, tenant)
+    
+    # Buscas mais frequentes dos últimos dias repetidas em segundo plano (primeira carga da base)
+    prewarm_popular_queries(base, tenant)
+    
+    # Mostrar status dos dados carregados
+    if "XLSX carregada" in status_message:
+        st.success(status_message + " 📊 (Dados limpos)")
+    elif "SQLite carregada" in status_message:
+        st.success(status_message + " 🗄️ (SQLite)")
+    elif "enviado carregado" in status_message:
+        st.success(status_message + " 📤 (Upload)")
+    elif "CSV carregada" in status_message:
+        st.info(status_message + " 📋 (Fallback)")
+    elif "demonstração" in status_message:
+        st.warning(status_message)
+    else:
+        st.error(status_message)
+    
+    # Linhas descartadas pela validação da carga
+    cleaning_report = getattr(base, 'cleaning_report', None)
+    if cleaning_report and cleaning_report['rejected']:
+        rejected = sum(cleaning_report['rejected'].values())
+        st.warning(f"⚠️ {rejected:,} de {cleaning_report['rows']:,} linha(s) descartada(s) na validação da base")
+    
+    # Sidebar com estatísticas dinâmicas
+    with st.sidebar:
+        st.header("📊 Estatísticas")
+        if tenant.name != DEFAULT_TENANT_NAME:
+            st.caption(f"🏢 {tenant.label}")
+        
+        if not base.is_empty:
+            # CAMPO 1: Total de Veículos - Contagem distinta de FipeID
+            if stats['total_vehicles'] is not None:
+                st.metric("Total de Veículos", f"{stats['total_vehicles']:,}")
             
-            with col3:
-                if 'BrandName' in df.columns:
-                    unique_brands = df['BrandName'].nunique()
-                    st.metric("Marcas Únicas", unique_brands)
+            # CAMPO 2: Veículos com ADAS - Contagem distinta de FipeID onde ADAS = 'Sim'
+            if stats['adas_vehicles'] is not None:
+                st.metric("Veículos com ADAS", f"{stats['adas_vehicles']:,}")
             
-            with col4:
-                if 'VehicleModelYear' in df.columns:
-                    min_year = df['VehicleModelYear'].min()
-                    max_year = df['VehicleModelYear'].max()
-                    st.metric("Range Anos", f"{max_year-min_year+1}")
+            # Marcas Disponíveis
+            if stats['brands'] is not None:
+                st.metric("Marcas Disponíveis", stats['brands'])
+        else:
+            st.error("❌ Nenhum dado carregado")
+        
+        # Saúde dos links de calibração (administração)
+        if is_admin_session():
+            st.button(
+                "⏱️ Perfilar um rerun", key="profile_request", on_click=_request_profile,
+                help="Roda a tela de novo sob cProfile e mostra as funções mais lentas aqui na barra lateral"
+            )
+            
+            with st.expander("🔗 Links de calibração"):
+                link_counts, dead_links, link_checking = get_link_status_cache().summary()
+                st.caption(
+                    f"OK: {link_counts['ok']} | Fora do ar: {link_counts['dead']} | "
+                    f"Sem resposta: {link_counts['unreachable']}" + (" | 🔄 verificando..." if link_checking else "")
+                )
+                for url in dead_links:
+                    st.write(f"❌ {url}")
+                if st.button("Verificar agora", key="link_check_now"):
+                    get_link_status_cache().refresh_in_background(iter_calibration_links(tenant.links), force=True)
+                
+                cached_documents, cached_bytes = get_document_store().summary()
+                st.caption(f"PDFs em cache local: {cached_documents} ({cached_bytes / 1024 / 1024:,.1f} MB)")
+
+            # Resultado da limpeza e validação da base carregada (administração)
+            if cleaning_report:
+                with st.expander("🧹 Validação da base"):
+                    st.caption(f"Linhas lidas: {cleaning_report['rows']:,} | Mantidas: {cleaning_report['kept']:,}")
+                    for reason, count in {**cleaning_report['rejected'], **cleaning_report.get('odd', {})}.items():
+                        st.write(f"• {reason}: {count:,}")
+                    for col, count in cleaning_report['normalized'].items():
+                        st.write(f"• {col}: {count:,} valor(es) padronizado(s)")
+                    for col, values in cleaning_report['unrecognized'].items():
+                        samples = ", ".join(f"'{value}' ({count:,})" for value, count in values.items())
+                        st.write(f"• {col}: não reconhecidos {samples}")
+                    for col, count in cleaning_report['missing'].items():
+                        st.write(f"• {col}: {count:,} sem valor")
+
+            # Bases em memória e pressão de memória do contêiner (administração)
+            with st.expander("🗄️ Cache de bases"):
+                dataset_cache = get_dataset_cache()
+                dataset_cache.refresh_sizes(_loaded_base_nbytes)
+                cache_stats = dataset_cache.stats()
+                st.caption(
+                    f"{cache_stats['entries']} de {dataset_cache.max_entries} base(s) | "
+                    f"{cache_stats['bytes'] / 1024 / 1024:,.0f} de {dataset_cache.max_bytes / 1024 / 1024:,.0f} MB | "
+                    f"Despejos: {cache_stats['evictions']:,}"
+                )
+                for key, nbytes, idle in dataset_cache.entries():
+                    st.write(f"• `{key}` — {nbytes / 1024 / 1024:,.1f} MB, sem uso há {idle / 60:,.0f} min")
+
+                memory = container_memory()
+                if memory is not None:
+                    usage, limit = memory
+                    st.caption(f"Memória do contêiner: {usage / 1024 / 1024:,.0f} de {limit / 1024 / 1024:,.0f} MB")
+                    if usage >= MEMORY_WARNING_RATIO * limit:
+                        st.warning("⚠️ Memória do contêiner perto do limite")
+
+                if st.button("Esvaziar cache de bases", key="dataset_cache_purge"):
+                    count, freed = dataset_cache.purge()
+                    st.success(f"{count} base(s) removida(s), {freed / 1024 / 1024:,.0f} MB liberados")
+
+            # Atualização incremental da base carregada, sem reler o arquivo inteiro (administração)
+            with st.expander("🩹 Aplicar delta"):
+                st.caption(
+                    "XLSX ou CSV (;) com FipeID, VehicleModelYear e as demais colunas; a coluna opcional "
+                    "Operação aceita inserir, atualizar ou excluir (sem ela, as linhas incluem ou substituem)."
+                )
+                if isinstance(base, VehicleBase) and base.journal_path is None:
+                    st.warning(
+                        "⚠️ Base enviada nesta sessão: os deltas ficam só em memória e se perdem se ela "
+                        "sair do cache ou o servidor reiniciar."
+                    )
+                delta_file = st.file_uploader("Arquivo de delta", type=['xlsx', 'csv', 'txt'], key="delta_file")
+                if st.button("Aplicar delta", key="delta_apply", disabled=delta_file is None):
+                    try:
+                        # Mesma limpeza da carga; linhas com chave inválida contam como ignoradas
+                        delta, delta_report = clean_vehicle_data(read_delta_file(delta_file), deduplicate=False)
+                        delta_summary = base.apply_delta(delta)
+                        delta_summary['ignored'] += sum(delta_report['rejected'].values())
+                        st.session_state['delta_summary'] = delta_summary
+                    except Exception as e:
+                        st.error(f"❌ Erro ao aplicar delta: {str(e)}")
+                    else:
+                        # Estatísticas e filtros desta tela já foram desenhados com a versão anterior
+                        st.rerun()
+                
+                delta_summary = st.session_state.get('delta_summary')
+                if delta_summary:
+                    st.success(
+                        f"✅ Delta aplicado em {delta_summary['seconds'] * 1000:,.0f} ms: "
+                        f"{delta_summary['inserted']} incluída(s), {delta_summary['updated']} alterada(s), "
+                        f"{delta_summary['deleted']} excluída(s), {delta_summary['ignored']} ignorada(s)"
+                    )
+                st.caption(f"Versão da base: `{base.version}`")
+
+        # Métricas do cache de buscas compartilhado
+        with st.expander("⚡ Cache de buscas"):
+            query_stats = get_query_cache().stats()
+            st.metric("Taxa de acerto", f"{query_stats['hit_rate']:.0%}")
+            st.caption(
+                f"Acertos: {query_stats['hits']:,} | Calculadas: {query_stats['misses']:,} | "
+                f"Coalescidas: {query_stats['coalesced']:,} | Despejos: {query_stats['evictions']:,} | "
+                f"Entradas: {query_stats['entries']:,} ({query_stats['bytes'] / 1024:,.0f} KB)"
+            )
+            card_stats = get_card_cache().stats()
+            st.caption(
+                f"Cards: {card_stats['entries']:,} em cache | Acertos: {card_stats['hits']:,} | "
+                f"Montados: {card_stats['misses']:,} | Despejos: {card_stats['evictions']:,} "
+                f"({card_stats['hit_rate']:.0%})"
+            )
+            log_stats = get_query_log().stats()
+            st.caption(
+                f"Log de buscas: {log_stats['recorded']:,} registrada(s) | "
+                f"Pendentes: {log_stats['pending']:,} | Descartadas: {log_stats['dropped']:,}"
+            )
+    
+    # Seletor explícito em vez de st.tabs: as abas rodam juntas a cada rerun e montariam o cubo
+    # do painel mesmo para quem só consulta
+    view_mode = st.radio(
+        "Visão", ["🔍 Consulta", "📊 Painel"], horizontal=True, key="view_mode", label_visibility="collapsed"
+    )
+    
+    if view_mode != "📊 Painel":
+        # Interface de busca
+        st.subheader("🔍 Buscar Veículo na Base ADAS")
+    
+        # Filtros de busca
+        col1, col2, col3 = st.columns([3, 1.5, 1])
+    
+        with col1:
+            search_query = st.text_input(
+                "Digite para buscar:",
+                placeholder="Ex: BMW, Polo, Mercedes, 92983",
+                help="Busque por marca, modelo ou código FIPE",
+                key="search_query"
+            )
+    
+        with col2:
+            # Filtro de ano (baseado nos dados reais)
+            if base.model_years:
+                years_available = base.model_years
+                year_filter = st.selectbox(
+                    "📅 Filtrar por Ano:",
+                    options=["Todos os anos"] + [str(year) for year in years_available],
+                    help="Selecione um ano específico"
+                )
+            else:
+                year_filter = st.selectbox(
+                    "📅 Filtrar por Ano:",
+                    options=["Todos os anos"],
+                    disabled=True,
+                    help="Filtro indisponível - dados não carregados"
+                )
+    
+        with col3:
+            search_button = st.button("🔍 Buscar", type="primary")
+    
+        # Sugestões do autocompletar: escolher uma dispara uma única busca pelo nome completo
+        if search_query and not search_query.isdigit():
+            suggestions = dict(base.autocomplete.suggest(search_query))
+            if suggestions and search_query.strip() not in suggestions:
+                st.pills(
+                    "💡 Sugestões:",
+                    options=list(suggestions),
+                    format_func=lambda text: f"{text} ({suggestions[text]:,})",
+                    selection_mode="multi",
+                    key="autocomplete_choice",
+                    on_change=_use_autocomplete_suggestion
+                )
+    
+        # Filtros avançados por marca, faixa de anos, características ADAS e tipo de regulagem
+        facet_filters = ()
+        if not base.is_empty:
+            facet_filters = read_facet_filters(base.model_years)
+            render_facet_filters(base, facet_filters)
+    
+        # Processar busca
+        if search_button or search_query or (year_filter and year_filter != "Todos os anos") or facet_filters:
+            with st.spinner("🔄 Buscando na base de dados..."):
+                positions, scores = rank_vehicles(search_query, base, year_filter, facet_filters)
+            
+            # Nova busca volta para a primeira página e descarta a exportação anterior; só ela
+            # entra no log de buscas (trocar de página ou exportar é rerun da mesma busca)
+            results_key = (base.version, fold_search_text(search_query or ''), year_filter, facet_filters)
+            new_search = st.session_state.get('results_key') != results_key
+            if new_search:
+                st.session_state['results_key'] = results_key
+                st.session_state['results_page'] = 1
+                st.session_state.pop('export_file', None)
+            
+            page_size = result_page_size(search_query)
+            total_pages = max(1, -(-len(positions) // page_size))
+            page = min(st.session_state.get('results_page', 1), total_pages)
+            results = search_vehicles(search_query, base, year_filter, facet_filters,
+                                      offset=(page - 1) * page_size, limit=page_size, tenant=tenant, log=new_search)
+        
+            if results:
+                # Mostrar filtros aplicados
+                filters_applied = []
+                if search_query:
+                    filters_applied.append(f"Termo: '{search_query}'")
+                if year_filter and year_filter != "Todos os anos":
+                    filters_applied.append(f"Ano: {year_filter}")
+                if facet_filters:
+                    filters_applied.append(f"Filtros avançados: {len(facet_filters)}")
+            
+                filter_text = " | ".join(filters_applied) if filters_applied else "Todos"
+                showing = f" (exibindo {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(results)})" if total_pages > 1 else ""
+                st.success(f"✅ Encontrados {len(positions)} resultado(s){showing} - Filtros: {filter_text}")
+                
+                col_page, col_export = st.columns([1, 3])
+                with col_page:
+                    if total_pages > 1:
+                        st.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages, key="results_page")
+                with col_export:
+                    with st.expander(f"📥 Exportar {len(positions)} resultado(s)"):
+                        export_format = st.radio("Formato", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+                        if st.button("Preparar arquivo", key="export_prepare"):
+                            with st.spinner("📄 Gerando arquivo..."):
+                                st.session_state['export_file'] = (
+                                    export_format,
+                                    export_results(base, positions, scores, year_filter, export_format, tenant)
+                                )
+                        prepared = st.session_state.get('export_file')
+                        if prepared and prepared[0] == export_format:
+                            extension, mime = EXPORT_FORMATS[export_format]
+                            st.download_button(
+                                f"⬇️ Baixar {export_format}",
+                                data=prepared[1],
+                                file_name=f"resultados_adas.{extension}",
+                                mime=mime,
+                                key="export_download"
+                            )
+            
+                # Processar e exibir cada veículo (cards montados uma vez e reaproveitados)
+                card_cache = get_card_cache()
+                links_version = calibration_links_version(tenant)
+                root_version = dataset_root_version(base.version)
+                year_int = _parse_year_filter(year_filter)
+                for vehicle in results:
+                    card_cache.record_view(root_version, vehicle.get('view_position'), year_int)
+                    render_vehicle_card(vehicle_card(base, vehicle, links_version, tenant))
+        
+            else:
+                filter_msg = f" com filtros aplicados" if (search_query or year_filter != "Todos os anos" or facet_filters) else ""
+                st.error(f"❌ Nenhum resultado encontrado{filter_msg}")
+                st.info("💡 Tente: 'BMW', 'Polo', 'Mercedes' ou códigos FIPE")
+    
+        # Exibir dica quando não há busca
+        elif not search_query and (not year_filter or year_filter == "Todos os anos"):
+            st.info("💡 **Dica:** Digite um termo de busca ou selecione um ano para começar")
+        
+            # Mostrar estatísticas interessantes se há dados
+            if not base.is_empty:
+                st.subheader("📊 Resumo da Base Carregada")
+                col1, col2, col3, col4 = st.columns(4)
+            
+                with col1:
+                    if stats['total_vehicles'] is not None:
+                        st.metric("Total Veículos", f"{stats['total_vehicles']:,}")
+            
+                with col2:
+                    if stats['adas_vehicles'] is not None:
+                        total_vehicles = stats['total_vehicles']
+                        adas_percent = (stats['adas_vehicles'] / total_vehicles * 100) if total_vehicles > 0 else 0
+                        st.metric("Percentual ADAS", f"{adas_percent:.1f}%")
+            
+                with col3:
+                    if stats['brands'] is not None:
+                        st.metric("Marcas Únicas", stats['brands'])
+            
+                with col4:
+                    if stats['min_year'] is not None:
+                        st.metric("Range Anos", f"{stats['max_year']-stats['min_year']+1}")
+    
+    else:
+        # Painel gerencial a partir do cubo de agregados (sem varrer a tabela)
+        render_dashboard(base, stats)
     
     # Footer informativo
     st.markdown("---")
@@ -1126,4 +4646,4 @@ def main():
 
 # Executar aplicação
 if __name__ == "__main__":
-    main()
+    run_app()
@@ -0,0 +1,45 @@
+"""Regressões do índice de autocompletar (AutocompleteIndex)"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import pandas as pd
+
+import streamlit_app as app
+
+
+def _view(names):
+    return pd.DataFrame({'VehicleName': names})
+
+
+def _texts(suggestions):
+    return [text for text, _ in suggestions]
+
+
+def test_short_key_does_not_hide_longer_prefixes():
+    # "KA" (Ford Ka) é mais curto que o prefixo pré-calculado e vem antes de "KARDIAN" na ordem
+    index = app.AutocompleteIndex(_view(['Ka', 'Kardian 1.0', 'Kadett']))
+
+    assert _texts(index.suggest('KAR')) == ['Kardian 1.0']
+    assert _texts(index.suggest('KAD')) == ['Kadett']
+    assert sorted(_texts(index.suggest('KA'))) == ['Ka', 'Kadett', 'Kardian 1.0']
+    assert _texts(index.suggest('KARD')) == ['Kardian 1.0']
+
+
+def test_short_key_after_delta():
+    index = app.AutocompleteIndex(_view(['Ka', 'Kwid']))
+    patched = index.with_delta(_view([]), _view(['Kardian 1.0']))
+
+    assert _texts(patched.suggest('KAR')) == ['Kardian 1.0']
+    assert sorted(_texts(patched.suggest('KA'))) == ['Ka', 'Kardian 1.0']
+    assert _texts(index.suggest('KAR')) == []
+
+
+def test_precomputed_prefixes_match_range_scan():
+    names = ['Ka', 'Kardian 1.0', 'Kadett', 'K', 'Kwid', 'Compass', 'Corolla', 'C4 Cactus', 'Co', 'Polo TSI']
+    index = app.AutocompleteIndex(_view(names))
+
+    for prefix, ranked in index._top_by_prefix.items():
+        lo, hi = index._prefix_range(prefix)
+        assert ranked == index._top_in_range(lo, hi), prefix
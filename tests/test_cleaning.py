@@ -0,0 +1,114 @@
+"""Limpeza e validação da base na carga (clean_vehicle_data)"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import streamlit_app as app
+
+
+def _clean_one(column, value):
+    """Valor limpo de uma coluna numa base de uma linha válida"""
+    df = pd.DataFrame({'FipeID': [1001], 'VehicleModelYear': [2024], column: [value]})
+    clean, _ = app.clean_vehicle_data(df)
+    return clean[column].iloc[0]
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('Sim', 'Sim'),
+    ('SIM', 'Sim'),
+    (' sim', 'Sim'),
+    ('S', 'Sim'),
+    ('yes', 'Sim'),
+    ('X', 'Sim'),
+    (1, 'Sim'),
+    (1.0, 'Sim'),
+    ('Não', 'Não'),
+    ('NAO ', 'Não'),
+    ('não', 'Não'),
+    ('n', 'Não'),
+    ('0', 'Não'),
+    (np.nan, None),
+    ('', None),
+    ('  ', None),
+    ('talvez', None),
+])
+def test_flag_variants(value, expected):
+    assert _clean_one('ADAS', value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('BMW', 'BMW'),
+    ('bmw ', 'BMW'),
+    (' Fiat', 'FIAT'),
+    ('Land  Rover', 'LAND ROVER'),
+    ('Mercedes-Benz\t', 'MERCEDES-BENZ'),
+    (np.nan, None),
+    ('   ', None),
+])
+def test_brand_normalization(value, expected):
+    assert _clean_one('BrandName', value) == expected
+
+
+@pytest.mark.parametrize('fipe, year, kept', [
+    (1001, 2024, (1001, 2024)),
+    ('1001', '2024', (1001, 2024)),
+    (1001.0, 2024.0, (1001, 2024)),
+    (' 1001', '2024 ', (1001, 2024)),
+    (1001, '2024.5', None),
+    (1001, 'abc', None),
+    (1001, None, None),
+    (0, 2024, None),
+    (-5, 2024, None),
+    (1001.5, 2024, None),
+    (None, 2024, None),
+])
+def test_key_normalization(fipe, year, kept):
+    clean, report = app.clean_vehicle_data(pd.DataFrame({'FipeID': [fipe], 'VehicleModelYear': [year]}))
+    if kept is None:
+        assert clean.empty and sum(report['rejected'].values()) == 1
+    else:
+        assert tuple(clean.iloc[0]) == kept
+        assert clean['FipeID'].dtype == clean['VehicleModelYear'].dtype == np.int64
+
+
+def test_rejection_report():
+    df = pd.DataFrame({
+        'FipeID': [1001, '1002', 1003.0, None, 0, 1006.5, 1001, 1008, 1009],
+        'VehicleModelYear': ['2024', 2023.0, 1900, 2024, 2024, 2024, '2024', 'abc', 2099],
+        'BrandName': ['bmw ', ' Fiat', 'Land  Rover', 'VW', 'VW', 'VW', 'BMW', 'VW', np.nan],
+        'ADAS': ['SIM', ' sim', 'S', np.nan, 'x', 'y', 'Não', 'talvez', 'talvez'],
+        # Nome de coluna com espaços nas pontas também é corrigido
+        ' Faróis Matrix ': ['nao', 'Não', '0', 1, '', 'N', 'NÃO', 'n', 'sim'],
+    })
+    clean, report = app.clean_vehicle_data(df)
+
+    assert clean.to_dict('list') == {
+        'FipeID': [1001, 1002, 1003, 1009],
+        'VehicleModelYear': [2024, 2023, 1900, 2099],
+        'BrandName': ['BMW', 'FIAT', 'LAND ROVER', None],
+        'ADAS': ['Sim', 'Sim', 'Sim', None],
+        'Faróis Matrix': ['Não', 'Não', 'Não', 'Sim'],
+    }
+    assert report == {
+        'rows': 9,
+        'kept': 4,
+        # Cada linha conta só no primeiro motivo; a repetida (1001, 2024) mantém a primeira
+        'rejected': {'FipeID inválido': 3, 'Ano-modelo inválido': 1, 'FipeID e ano repetidos': 1},
+        # Anos fora da faixa esperada ficam na base, só no relatório
+        'odd': {'Ano-modelo fora do esperado': 2},
+        'normalized': {'BrandName': 3, 'ADAS': 4, 'Faróis Matrix': 3},
+        'unrecognized': {'ADAS': {'talvez': 1}},
+        'missing': {'BrandName': 1, 'ADAS': 1},
+    }
+
+
+def test_delta_keeps_repeated_keys():
+    # Deltas podem repetir FipeID e ano (a última linha vale), então não são deduplicados
+    df = pd.DataFrame({'FipeID': [1001, 1001], 'VehicleModelYear': [2024, 2024], 'op': ['delete', 'insert']})
+    clean, report = app.clean_vehicle_data(df, deduplicate=False)
+    assert len(clean) == 2 and report['rejected'] == {}
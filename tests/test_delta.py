@@ -0,0 +1,151 @@
+"""Deltas (inclusões, alterações e exclusões) nos backends pandas e SQLite"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import pandas as pd
+import pytest
+
+import streamlit_app as app
+
+
+def _vehicles(rows):
+    """Linhas (FipeID, ano, marca, modelo, ADAS) no formato da base"""
+    df = pd.DataFrame(rows, columns=['FipeID', 'VehicleModelYear', 'BrandName', 'VehicleName', 'ADAS'])
+    df['Abreviação de descrição'] = df['BrandName'] + ' ' + df['VehicleName']
+    df['Tipo de Regulagem'] = 'Estática'
+    return df
+
+
+BASE = _vehicles([
+    (1001, 2022, 'BMW', '320i', 'Sim'),
+    (1001, 2023, 'BMW', '320i', 'Sim'),
+    (1002, 2021, 'BMW', 'X1', 'Não'),
+    (1003, 2023, 'FIAT', 'Pulse', 'Sim'),
+    (1004, 2020, 'FIAT', 'Argo', 'Não'),
+])
+
+
+@pytest.fixture
+def bases(tmp_path):
+    """Mesma base nos dois backends, com os índices já construídos (que os deltas atualizam)"""
+    path = str(tmp_path / 'base.sqlite')
+    app.build_sqlite_base(BASE, path, 'v1')
+    pandas_base, sqlite_base = app.VehicleBase(BASE.copy(), 'v1'), app.SQLiteVehicleBase(path, 'v1')
+    for base in (pandas_base, sqlite_base):
+        _ = base.stats, base.autocomplete, base.cube, base.bm25, base.facet_counts(())
+    return pandas_base, sqlite_base
+
+
+def _results(base, query, year=None):
+    positions, scores = base.rank(app.fold_search_text(query), year, ())
+    records = base.records(positions)
+    return [(record['FipeID'], int(position)) for record, position in zip(records, positions.tolist())], (
+        None if scores is None else scores.round(9).tolist()
+    )
+
+
+def _apply(bases, delta):
+    return [base.apply_delta(delta) for base in bases]
+
+
+def test_delta_with_only_new_fipes(bases):
+    delta = _vehicles([(2001, 2024, 'BMW', 'iX', 'Sim')])
+    pandas_summary, sqlite_summary = _apply(bases, delta)
+
+    assert pandas_summary['inserted'] == sqlite_summary['inserted'] == 1
+    for base in bases:
+        assert [fipe for fipe, _ in _results(base, 'ix')[0]] == [2001]
+        assert base.stats['total_vehicles'] == 5
+
+
+def test_readded_fipe_keeps_position_on_both_backends(bases):
+    deleted = BASE[BASE['FipeID'] == 1002].assign(op='delete')
+    _apply(bases, deleted)
+    for base in bases:
+        assert 1002 not in [fipe for fipe, _ in _results(base, 'bmw')[0]]
+
+    # Reinclusão misturada com um FipeID inédito e uma alteração
+    readded = pd.concat([
+        _vehicles([(1002, 2024, 'BMW', 'X1', 'Sim'), (2001, 2024, 'BMW', 'iX', 'Sim')]),
+        BASE[BASE['FipeID'] == 1004].assign(ADAS='Sim'),
+    ], ignore_index=True)
+    _apply(bases, readded)
+
+    pandas_base, sqlite_base = bases
+    for query, year in [('bmw', None), ('', 2024), ('fiat', None), ('x1', None)]:
+        assert _results(pandas_base, query, year) == _results(sqlite_base, query, year), (query, year)
+    positions = dict(_results(pandas_base, 'bmw')[0])
+    assert positions[1002] == 1 and positions[2001] == 4
+
+    # FipeID inédito menor que o do delta anterior: entra depois dele, na ordem das posições
+    _apply(bases, _vehicles([(1500, 2024, 'BMW', 'M2', 'Sim')]))
+    assert _results(pandas_base, '', 2024) == _results(sqlite_base, '', 2024)
+    assert [fipe for fipe, _ in _results(pandas_base, '', 2024)[0]][-2:] == [2001, 1500]
+
+
+def test_compacted_overlay_keeps_positions_and_results(bases, monkeypatch):
+    # Sobreposição incorporada a um segmento novo a cada delta
+    monkeypatch.setattr(app, 'DELTA_OVERLAY_MAX_ROWS', 0)
+    pandas_base, sqlite_base = bases
+    _apply(bases, BASE[BASE['FipeID'] == 1002].assign(op='delete'))
+    _apply(bases, _vehicles([(2001, 2024, 'BMW', 'iX', 'Sim'), (2002, 2024, 'BMW', 'i4', 'Sim')]))
+    # Posição de um FipeID novo excluído fica reservada no segmento
+    _apply(bases, _vehicles([(2001, 2024, 'BMW', 'iX', 'Sim')]).assign(op='delete'))
+    _apply(bases, _vehicles([(1002, 2024, 'BMW', 'X1', 'Sim'), (2001, 2025, 'BMW', 'iX', 'Não')]))
+
+    assert not len(pandas_base.snapshot.touched)
+    for query, year in [('bmw', None), ('', 2024), ('', 2025), ('x1', None)]:
+        assert _results(pandas_base, query, year) == _results(sqlite_base, query, year), (query, year)
+    assert dict(_results(pandas_base, 'bmw')[0]) == {1001: 0, 1002: 1, 2001: 4, 2002: 5}
+    assert pandas_base.facet_counts(()) == sqlite_base.facet_counts(())
+    assert pandas_base.stats == sqlite_base.stats
+
+
+def test_journal_replays_pandas_deltas_on_reload(tmp_path):
+    journal = str(tmp_path / 'base.deltas.jsonl')
+    base = app.VehicleBase(BASE.copy(), 'v1', journal_path=journal)
+    base.apply_delta(BASE[BASE['FipeID'] == 1002].assign(op='delete'))
+    base.apply_delta(_vehicles([(2001, 2024, 'BMW', 'iX', 'Sim'), (1004, 2020, 'FIAT', 'Argo', 'Sim')]))
+
+    # Base relida da origem depois de um despejo do cache: os deltas voltam a valer
+    reloaded = app.VehicleBase(BASE.copy(), 'v1', journal_path=journal)
+    assert reloaded.replay_journal() == 2
+    assert reloaded.version == base.version
+    for query, year in [('bmw', None), ('', 2024), ('argo', None)]:
+        assert _results(reloaded, query, year) == _results(base, query, year), (query, year)
+    assert reloaded.stats == base.stats
+
+    # Origem nova: os deltas anotados para a anterior saem do diário
+    renewed = app.VehicleBase(BASE.copy(), 'v2', journal_path=journal)
+    assert renewed.replay_journal() == 0
+    assert open(journal, encoding='utf-8').read() == ''
+
+
+@pytest.mark.parametrize('filters', [
+    (),
+    (('BrandName', ('BMW',)),),
+    (('BrandName', ('BMW', 'FIAT')), ('VehicleModelYear', (2023, 2024))),
+    (('ADAS', ('Sim',)),),
+])
+def test_facet_counts_match_sqlite_before_and_after_deltas(bases, filters):
+    pandas_base, sqlite_base = bases
+    assert pandas_base.facet_counts(filters) == sqlite_base.facet_counts(filters)
+
+    _apply(bases, BASE[BASE['FipeID'] == 1002].assign(op='delete'))
+    _apply(bases, _vehicles([(2001, 2024, 'BMW', 'iX', 'Sim'), (1003, 2023, 'FIAT', 'Pulse', 'Não')]))
+    assert pandas_base.facet_counts(filters) == sqlite_base.facet_counts(filters)
+
+
+def test_prewarm_skips_vehicles_deleted_after_being_viewed(bases, monkeypatch):
+    _apply(bases, BASE[BASE['FipeID'] == 1002].assign(op='delete'))
+    for base in bases:
+        cache = app.CardCache(100)
+        monkeypatch.setattr(app, 'get_card_cache', lambda: cache)
+        # Posição 1 (FipeID 1002) foi vista antes da exclusão
+        assert base.live_among([3, 1, 0]).tolist() == [3, 0]
+        root = app.dataset_root_version(base.version)
+        for position in (0, 1):
+            cache.record_view(root, position, None)
+        assert app.prewarm_vehicle_cards(base) == 1
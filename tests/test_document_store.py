@@ -0,0 +1,117 @@
+"""Cache local dos PDFs de calibração contra uma origem HTTP local"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import collections
+import hashlib
+import http.server
+import threading
+import time
+
+import pytest
+
+import streamlit_app as app
+
+PDF_A = b'%PDF-1.4 manual A'
+PDF_B = b'%PDF-1.4 manual B'
+
+
+@pytest.fixture
+def origin():
+    """Servidor em 127.0.0.1 que responde 304 ao ETag atual; conteúdos trocáveis durante o teste"""
+    documents = {'/a.pdf': PDF_A, '/copy.pdf': PDF_A, '/page.pdf': b'<html>login</html>'}
+    hits = collections.Counter()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits[self.path] += 1
+            body = documents.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", documents, hits
+    server.shutdown()
+    server.server_close()
+
+
+def _files(directory):
+    return sorted(name for name in os.listdir(directory) if name != 'index.json')
+
+
+def test_content_addressing_and_revalidation(origin, tmp_path):
+    base_url, documents, hits = origin
+    store = app.CalibrationDocumentStore(str(tmp_path), 'app/static/calibration', refresh_interval=3600)
+    sha_a = hashlib.sha256(PDF_A).hexdigest()
+
+    # Dois links com o mesmo conteúdo apontam para um único arquivo
+    assert store.fetch(f"{base_url}/a.pdf") == store.fetch(f"{base_url}/copy.pdf") == sha_a
+    assert _files(tmp_path) == [f"{sha_a}.pdf"]
+    assert store.local_url(f"{base_url}/a.pdf") == f"app/static/calibration/{sha_a}.pdf?v={sha_a[:12]}"
+    assert store.version == 2
+    assert store.summary() == (2, 2 * len(PDF_A))
+
+    # Conteúdo inalterado: a origem responde 304 e nada muda
+    assert store.fetch(f"{base_url}/a.pdf") == sha_a
+    assert hits['/a.pdf'] == 2 and store.version == 2
+
+    # Conteúdo novo: URL local nova; o arquivo antigo fica enquanto outro link aponta para ele
+    documents['/a.pdf'] = PDF_B
+    sha_b = store.fetch(f"{base_url}/a.pdf")
+    assert sha_b == hashlib.sha256(PDF_B).hexdigest() and store.version == 3
+    assert _files(tmp_path) == sorted([f"{sha_a}.pdf", f"{sha_b}.pdf"])
+    documents['/copy.pdf'] = PDF_B
+    store.fetch(f"{base_url}/copy.pdf")
+    assert _files(tmp_path) == [f"{sha_b}.pdf"]
+
+    # O índice gravado em disco vale para o próximo processo
+    reopened = app.CalibrationDocumentStore(str(tmp_path), 'app/static/calibration', refresh_interval=3600)
+    assert reopened.local_url(f"{base_url}/a.pdf") == store.local_url(f"{base_url}/a.pdf")
+
+
+def test_non_pdf_is_rejected(origin, tmp_path):
+    base_url, _, _ = origin
+    store = app.CalibrationDocumentStore(str(tmp_path), 'app/static/calibration', refresh_interval=3600)
+
+    with pytest.raises(ValueError):
+        store.fetch(f"{base_url}/page.pdf")
+    assert store.local_url(f"{base_url}/page.pdf") is None
+    # Nem o PDF nem o arquivo temporário ficam no diretório
+    assert _files(tmp_path) == []
+
+
+def test_background_refresh_fetches_missing_and_backs_off_failures(origin, tmp_path):
+    base_url, _, hits = origin
+    store = app.CalibrationDocumentStore(str(tmp_path), 'app/static/calibration', refresh_interval=3600)
+    urls = [f"{base_url}/a.pdf", f"{base_url}/page.pdf", f"{base_url}/gone.pdf"]
+
+    assert store.refresh_in_background(urls)
+    deadline = time.time() + 10
+    while store._refreshing and time.time() < deadline:
+        time.sleep(0.02)
+
+    assert store.local_url(f"{base_url}/a.pdf") is not None
+    assert store.local_url(f"{base_url}/gone.pdf") is None
+    # Baixado e falhas recentes ficam de fora até o backoff vencer
+    assert store.stale_documents(urls) == []
+    assert not store.refresh_in_background(urls)
+    assert hits['/gone.pdf'] == hits['/page.pdf'] == 1
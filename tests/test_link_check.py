@@ -0,0 +1,142 @@
+"""Verificação dos links de calibração contra uma origem HTTP local"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import asyncio
+import collections
+import http.server
+import threading
+import time
+
+import pytest
+
+import streamlit_app as app
+
+
+@pytest.fixture
+def origin():
+    """Servidor em 127.0.0.1 com uma rota por comportamento; conta as requisições por (método, rota)"""
+    hits = collections.Counter()
+    in_flight = {'now': 0, 'max': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def _respond(self):
+            path = self.path.split('?')[0]
+            with lock:
+                hits[self.command, path] += 1
+                count = hits[self.command, path]
+            if path == '/ok':
+                status = 200
+            elif path == '/missing':
+                status = 404
+            elif path == '/busy':
+                status = 429
+            elif path == '/flaky':
+                # Falha de servidor só na primeira tentativa
+                status = 503 if count == 1 else 200
+            elif path == '/head-refused':
+                status = 405 if self.command == 'HEAD' else 206
+            elif path == '/slow':
+                time.sleep(1.0)
+                status = 200
+            elif path == '/gate':
+                with lock:
+                    in_flight['now'] += 1
+                    in_flight['max'] = max(in_flight['max'], in_flight['now'])
+                time.sleep(0.05)
+                with lock:
+                    in_flight['now'] -= 1
+                status = 200
+            else:
+                status = 500
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_HEAD = do_GET = _respond
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits, in_flight
+    server.shutdown()
+    server.server_close()
+
+
+def test_states_and_retries(origin):
+    base_url, hits, _ = origin
+    urls = {name: f"{base_url}/{name}" for name in ('ok', 'missing', 'busy', 'flaky', 'head-refused', 'slow')}
+    statuses = asyncio.run(app.check_links(list(urls.values()), concurrency=8, timeout=0.3, retries=1))
+
+    assert {name: statuses[url]['state'] for name, url in urls.items()} == {
+        'ok': 'ok',
+        'missing': 'dead',
+        # 429 é limite de requisições, não link quebrado
+        'busy': 'unreachable',
+        'flaky': 'ok',
+        'head-refused': 'ok',
+        'slow': 'unreachable',
+    }
+    assert statuses[urls['missing']]['status'] == 404
+    assert statuses[urls['slow']]['status'] is None and statuses[urls['slow']]['error']
+
+    # Respostas definitivas não são repetidas; 429, 5xx e timeouts são
+    assert hits['HEAD', '/ok'] == hits['HEAD', '/missing'] == 1
+    assert hits['HEAD', '/busy'] == hits['HEAD', '/flaky'] == 2
+    assert hits['HEAD', '/slow'] == 2
+    # Servidor que recusa HEAD recebe um GET
+    assert hits['HEAD', '/head-refused'] == hits['GET', '/head-refused'] == 1
+
+
+def test_concurrency_is_bounded(origin):
+    base_url, _, in_flight = origin
+    urls = [f"{base_url}/gate?{i}" for i in range(20)]
+    statuses = asyncio.run(app.check_links(urls, concurrency=3, timeout=2.0, retries=0))
+
+    assert all(status['state'] == 'ok' for status in statuses.values())
+    assert 1 < in_flight['max'] <= 3
+
+
+def test_statuses_expire_after_ttl(origin):
+    base_url, _, _ = origin
+    urls = [f"{base_url}/ok", f"{base_url}/missing"]
+    cache = app.LinkStatusCache(ttl=0.3)
+    assert cache.stale_links(urls) == urls
+
+    cache.update(asyncio.run(app.check_links(urls, timeout=1.0, retries=0)))
+    assert cache.stale_links(urls) == []
+    assert cache.is_dead(f"{base_url}/missing") and not cache.is_dead(f"{base_url}/ok")
+    assert cache.version == 1
+    assert cache.summary()[0] == {'ok': 1, 'dead': 1, 'unreachable': 0}
+
+    time.sleep(0.4)
+    assert cache.stale_links(urls) == urls
+    # Vencido, o último status conhecido continua valendo até a próxima verificação
+    assert cache.is_dead(f"{base_url}/missing")
+
+    # Nova verificação sem mudança na lista de fora do ar não invalida os cards
+    cache.update(asyncio.run(app.check_links(urls, timeout=1.0, retries=0)))
+    assert cache.stale_links(urls) == [] and cache.version == 1
+
+
+def test_background_refresh_checks_only_stale_links(origin):
+    base_url, hits, _ = origin
+    urls = [f"{base_url}/ok", f"{base_url}/missing"]
+    cache = app.LinkStatusCache(ttl=60)
+    cache.update(asyncio.run(app.check_links(urls[:1], timeout=1.0, retries=0)))
+
+    assert cache.refresh_in_background(urls)
+    deadline = time.time() + 10
+    while cache.summary()[2] and time.time() < deadline:
+        time.sleep(0.02)
+
+    assert cache.is_dead(f"{base_url}/missing")
+    assert hits['HEAD', '/ok'] == 1
+    # Nada vencido: não dispara outra verificação
+    assert not cache.refresh_in_background(urls)
@@ -0,0 +1,108 @@
+"""Cache de buscas: cálculo único para sessões simultâneas (single-flight) e limite em bytes"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import streamlit_app as app
+
+SESSIONS = 8
+
+
+def _result(size=100, fill=0):
+    """Resultado ranqueado (posições, scores) com `size` posições"""
+    return np.full(size, fill, dtype=np.int64), None
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "tempo esgotado"
+        time.sleep(0.005)
+
+
+def _run_sessions(cache, key, compute):
+    """Mesma busca em SESSIONS threads; retorna (valores, exceções)"""
+    values, errors = [], []
+
+    def session():
+        try:
+            values.append(cache.get_or_compute(key, compute))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session) for _ in range(SESSIONS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return values, errors
+
+
+def test_concurrent_sessions_compute_once():
+    cache = app.QueryCache(1024 * 1024)
+    calls = []
+    result = _result()
+
+    def compute():
+        calls.append(1)
+        # Só termina quando todas as outras sessões estão aguardando este cálculo
+        _wait_for(lambda: cache.stats()['coalesced'] == SESSIONS - 1)
+        return result
+
+    values, errors = _run_sessions(cache, ('v1', 'BMW', None, ()), compute)
+
+    assert not errors and len(calls) == 1
+    assert len(values) == SESSIONS and all(value is result for value in values)
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced'], stats['hits']) == (1, SESSIONS - 1, 0)
+    assert cache.get_or_compute(('v1', 'BMW', None, ()), compute) is result
+    assert cache.stats()['hits'] == 1
+
+
+def test_followers_retry_when_leader_fails():
+    cache = app.QueryCache(1024 * 1024)
+    calls = []
+    result = _result()
+
+    def compute():
+        calls.append(1)
+        if len(calls) == 1:
+            _wait_for(lambda: cache.stats()['coalesced'] == SESSIONS - 1)
+            raise RuntimeError("rerun interrompido")
+        return result
+
+    values, errors = _run_sessions(cache, ('v1', 'POLO', None, ()), compute)
+
+    # Só a líder vê o erro; uma das demais calcula de novo e as outras recebem esse resultado
+    assert len(errors) == 1 and isinstance(errors[0], RuntimeError)
+    assert len(values) == SESSIONS - 1 and all(value is result for value in values)
+    assert len(calls) == 2 and cache.stats()['misses'] == 2
+
+
+def test_lru_eviction_by_bytes():
+    entry_bytes = app._ranked_result_nbytes(_result())
+    cache = app.QueryCache(3 * entry_bytes)
+    for key in 'abc':
+        cache.get_or_compute(key, _result)
+    # Acesso a "a" a torna a mais recente: "b" é a próxima a sair
+    cache.get_or_compute('a', pytest.fail)
+    cache.get_or_compute('d', _result)
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (3, 3 * entry_bytes, 1)
+    calls = []
+    cache.get_or_compute('b', lambda: calls.append(1) or _result())
+    assert calls == [1] and cache.stats()['evictions'] == 2
+    # "c" saiu para "b" entrar; "a" continua em cache
+    cache.get_or_compute('a', pytest.fail)
+
+    # Resultado maior que o limite inteiro não entra (nem despeja os outros)
+    cache.get_or_compute('big', lambda: _result(size=1000))
+    assert cache.stats()['entries'] == 3 and cache.stats()['evictions'] == 2
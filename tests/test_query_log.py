@@ -0,0 +1,103 @@
+"""Log de buscas: gravação em segundo plano, rotação e buscas mais frequentes"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import json
+import time
+
+import pandas as pd
+
+import streamlit_app as app
+
+
+def _lines(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def test_writer_thread_flushes_buffer(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    log = app.QueryLog(path, max_bytes=1024 * 1024, flush_interval=0.05)
+    for query in ('BMW', 'POLO', 'BMW'):
+        log.record('padrao', query, None, (), 3, 0.01)
+    assert log.stats()['recorded'] == 3
+
+    deadline = time.time() + 5
+    while len(_lines(path)) < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    assert [entry['query'] for entry in _lines(path)] == ['BMW', 'POLO', 'BMW']
+    assert log.stats()['pending'] == 0
+
+
+def test_full_buffer_drops_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'QUERY_LOG_BUFFER_LIMIT', 2)
+    log = app.QueryLog(str(tmp_path / 'log.jsonl'), max_bytes=1024 * 1024, flush_interval=3600)
+    for query in ('A', 'B', 'C'):
+        log.record('padrao', query, None, (), 0, 0.0)
+
+    assert log.stats() == {'recorded': 2, 'dropped': 1, 'pending': 2}
+    assert log.flush() == 2 and log.flush() == 0
+
+
+def test_rotation_keeps_one_previous_file(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    log = app.QueryLog(path, max_bytes=200, flush_interval=3600)
+    for round_ in range(6):
+        log.record('padrao', f'BUSCA {round_}', None, (), 1, 0.0)
+        log.record('padrao', f'BUSCA {round_}', None, (), 1, 0.0)
+        log.flush()
+
+    assert os.path.exists(f"{path}.1")
+    # As buscas mais recentes continuam no arquivo atual; a versão mais antiga foi descartada
+    current = [entry['query'] for entry in _lines(path)]
+    previous = [entry['query'] for entry in _lines(f"{path}.1")]
+    assert current[-1] == 'BUSCA 5'
+    assert 'BUSCA 0' not in current + previous
+    assert {query for query, _, _ in log.top_queries('padrao', 10, 3600)} == set(previous + current)
+
+
+def test_top_queries_by_tenant_age_and_filters(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    log = app.QueryLog(path, max_bytes=1024 * 1024, flush_interval=3600)
+    adas = (('ADAS', ('Sim',)), ('VehicleModelYear', (2023, 2024)))
+    for _ in range(3):
+        log.record('padrao', 'BMW', None, adas, 5, 0.0)
+    for _ in range(2):
+        log.record('padrao', 'POLO', 2024, (), 2, 0.0)
+    log.record('padrao', '', None, (), 100, 0.0)
+    log.record('outra', 'FIAT', None, (), 1, 0.0)
+    log.flush()
+
+    with open(path, 'a', encoding='utf-8') as f:
+        # Entrada antiga (fora da janela), entrada sem filtros de versões anteriores e linha cortada
+        f.write(json.dumps({'ts': time.time() - 7200, 'rede': 'padrao', 'query': 'ANTIGA', 'year': None}) + '\n')
+        f.write(json.dumps({'ts': time.time(), 'rede': 'padrao', 'query': 'GOLF', 'year': None}) + '\n')
+        f.write('{"ts": 1, "rede": "pad')
+
+    assert log.top_queries('padrao', 10, 3600) == [('BMW', None, adas), ('POLO', 2024, ()), ('GOLF', None, ())]
+    assert log.top_queries('padrao', 1, 3600) == [('BMW', None, adas)]
+    assert log.top_queries('outra', 10, 3600) == [('FIAT', None, ())]
+
+
+def test_filtered_searches_are_logged_with_their_filters(tmp_path, monkeypatch):
+    log = app.QueryLog(str(tmp_path / 'log.jsonl'), max_bytes=1024 * 1024, flush_interval=3600)
+    monkeypatch.setattr(app, 'get_query_log', lambda: log)
+    df = pd.DataFrame({
+        'FipeID': [1001, 1002],
+        'VehicleModelYear': [2023, 2023],
+        'BrandName': ['BMW', 'BMW'],
+        'VehicleName': ['320i', 'X1'],
+        'ADAS': ['Sim', 'Não'],
+    })
+    base = app.VehicleBase(df, 'v1')
+    filters = (('ADAS', ('Sim',)),)
+
+    results = app.search_vehicles('bmw', base, None, filters)
+    log.flush()
+    assert [result['FipeID'] for result in results] == [1001]
+    assert log.top_queries(app.DEFAULT_TENANT.name, 10, 3600) == [('BMW', None, filters)]
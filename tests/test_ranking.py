@@ -0,0 +1,99 @@
+"""Ranking BM25F das buscas textuais (pesos por campo, prefixos e desempate)"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import streamlit_app as app
+
+ROWS = [
+    (1001, 2021, 'BMW', 'Z4'),
+    (1001, 2022, 'BMW', 'Z4'),
+    (1002, 2024, 'BMW', 'X1'),
+    (1003, 2023, 'BMW', 'X3'),
+    (1004, 2024, 'BMW', 'X5'),
+    (2001, 2018, 'VOLKSWAGEN', 'Polo'),
+    (2002, 2024, 'VOLKSWAGEN', 'Polo Track 1.0 MPI Manual'),
+    (3001, 2020, 'KIA', 'Soul'),
+    (3002, 2024, 'FIAT', 'Kia Style'),
+]
+
+
+def _frame(rows):
+    df = pd.DataFrame(rows, columns=['FipeID', 'VehicleModelYear', 'BrandName', 'VehicleName'])
+    df['Abreviação de descrição'] = df['BrandName'] + ' ' + df['VehicleName']
+    return df
+
+
+@pytest.fixture(params=['pandas', 'sqlite'])
+def base(request, tmp_path):
+    df = _frame(ROWS)
+    version = f"ranking-{request.param}"
+    if request.param == 'pandas':
+        return app.VehicleBase(df, version)
+    path = str(tmp_path / 'base.sqlite')
+    app.build_sqlite_base(df, path, version)
+    return app.SQLiteVehicleBase(path, version)
+
+
+def _ranked(base, query):
+    positions, scores = base.rank(app.fold_search_text(query), None, ())
+    return [record['FipeID'] for record in base.records(positions)], scores
+
+
+def test_ties_broken_by_latest_model_year_then_view_order(base):
+    fipes, scores = _ranked(base, 'bmw')
+    # Mesmo score para todos os BMW: ano-modelo mais recente primeiro; 1002 e 1004 (2024) na ordem da visão
+    assert np.allclose(scores, scores[0])
+    assert fipes == [1002, 1004, 1003, 1001]
+
+
+def test_word_prefix_matches_while_typing(base):
+    assert _ranked(base, 'bm')[0] == _ranked(base, 'bmw')[0]
+    assert _ranked(base, 'bm')[1].tolist() == pytest.approx(_ranked(base, 'bmw')[1].tolist())
+
+
+def test_shorter_field_ranks_first(base):
+    # "Polo" sozinho é mais relevante que dentro de um nome longo, mesmo sendo mais antigo
+    fipes, scores = _ranked(base, 'polo')
+    assert fipes == [2001, 2002] and scores[0] > scores[1]
+
+
+def test_brand_field_outweighs_name_field(base):
+    fipes, scores = _ranked(base, 'kia')
+    assert fipes == [3001, 3002] and scores[0] > scores[1]
+
+
+def _field_counts(df):
+    view = app.build_canonical_view(df)
+    return {
+        col: view[app.search_key_column(col)].value_counts()
+        for col, _ in app.SEARCH_FIELD_WEIGHTS if app.search_key_column(col) in view.columns
+    }, view
+
+
+def _scores(index, view, query):
+    codes = {
+        col: index.texts[col].get_indexer(view[app.search_key_column(col)])
+        for col, _ in app.SEARCH_FIELD_WEIGHTS if app.search_key_column(col) in view.columns
+    }
+    return index.score(query, codes)
+
+
+def test_index_with_delta_matches_rebuilt_index():
+    before = _frame(ROWS)
+    after = _frame([row for row in ROWS if row[0] != 1003] + [(4001, 2025, 'BYD', 'Dolphin Mini')])
+    counts, before_view = _field_counts(before)
+    _, after_view = _field_counts(after)
+    removed = before_view[before_view['FipeID'] == 1003]
+    added = after_view[after_view['FipeID'] == 4001]
+
+    patched = app.BM25FIndex(counts).with_delta(removed, added)
+    rebuilt = app.BM25FIndex(_field_counts(after)[0])
+    assert patched.total == rebuilt.total
+    for query in ('BMW', 'BYD', 'MINI', 'POLO', 'X'):
+        assert _scores(patched, after_view, query) == pytest.approx(_scores(rebuilt, after_view, query)), query
@@ -0,0 +1,73 @@
+"""Chaves de busca normalizadas (sem acentos, maiúsculas, números e unidades padronizados)"""
+import os
+
+os.environ.setdefault('ADAS_LINK_CHECK', '0')
+os.environ.setdefault('ADAS_DOCUMENT_CACHE', '0')
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import streamlit_app as app
+
+FOLDED = [
+    ('CITROËN', 'CITROEN'),
+    ('Citroen', 'CITROEN'),
+    ('citroën', 'CITROEN'),
+    ('Câm', 'CAM'),
+    ('Cam', 'CAM'),
+    ('Câmbio Automático', 'CAMBIO AUTOMATICO'),
+    ('1.5 TB', '1.5 TB'),
+    ('1,5TB', '1.5 TB'),
+    ('1,5 tb', '1.5 TB'),
+    ('1.5TB', '1.5 TB'),
+    ('2.0 16V', '2.0 16 V'),
+    ('V8', 'V8'),
+    ('Mercedes-Benz', 'MERCEDES BENZ'),
+    ('  T-Cross  ', 'T CROSS'),
+    ('A.B', 'A B'),
+    ('', ''),
+]
+
+
+@pytest.mark.parametrize('text, expected', FOLDED)
+def test_fold_search_text(text, expected):
+    assert app.fold_search_text(text) == expected
+
+
+def test_fold_search_series_matches_text_version():
+    texts = [text for text, _ in FOLDED]
+    series = pd.Series(texts + [np.nan, None, 3], dtype=object)
+    assert app.fold_search_series(series).tolist() == [app.fold_search_text(text) for text in texts] + ['', '', '3']
+
+
+@pytest.fixture(params=['pandas', 'sqlite'])
+def base(request, tmp_path):
+    df = pd.DataFrame({
+        'FipeID': [1001, 1002, 1003],
+        'VehicleModelYear': [2024, 2023, 2022],
+        'BrandName': ['CITROËN', 'VOLKSWAGEN', 'BMW'],
+        'VehicleName': ['C4 Cactus 1.6 Câmbio Aut.', 'Polo 1,0 TSI', '118i M Sport 1.5 TB'],
+    })
+    df['Abreviação de descrição'] = df['VehicleName']
+    # Versão própria por backend: o cache de buscas do processo é chaveado pela versão
+    version = f"search-keys-{request.param}"
+    if request.param == 'pandas':
+        return app.VehicleBase(df, version)
+    path = str(tmp_path / 'base.sqlite')
+    app.build_sqlite_base(df, path, version)
+    return app.SQLiteVehicleBase(path, version)
+
+
+@pytest.mark.parametrize('query, fipe', [
+    ('citroen', 1001),
+    ('Citroën', 1001),
+    ('câm', 1001),
+    ('CAMBIO', 1001),
+    ('1.0 tsi', 1002),
+    ('1,5TB', 1003),
+    ('1.5 tb', 1003),
+])
+def test_search_ignores_accents_case_and_number_format(base, query, fipe):
+    results = app.search_vehicles(query, base, log=False)
+    assert [result['FipeID'] for result in results] == [fipe]